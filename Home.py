@@ -1,5 +1,6 @@
 import streamlit as st
-import pandas as pd
+from datetime import datetime
+from zoneinfo import ZoneInfo
 
 # --- App Configuration ---
 st.set_page_config(
@@ -9,7 +10,7 @@ st.set_page_config(
 )
 
 st.title("📊 IT Project Profitability Calculator")
-st.caption(f"Current Time: {pd.Timestamp.now(tz='Asia/Ho_Chi_Minh').strftime('%Y-%m-%d %H:%M:%S %Z')}")
+st.caption(f"Current Time: {datetime.now(ZoneInfo('Asia/Ho_Chi_Minh')).strftime('%Y-%m-%d %H:%M:%S %Z')}")
 st.markdown("---")
 
 # App introduction
@@ -28,6 +29,7 @@ This application helps you calculate the profitability of your IT projects by:
 Use the navigation sidebar on the left to move between different pages:
 
 - **Cost Calculator**: The main tool for calculating project profitability
+- **Performance**: Timings of database calls and page rendering
 - **About**: Information about this application
 - **Help**: Detailed usage instructions
 
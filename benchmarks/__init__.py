@@ -0,0 +1,6 @@
+"""Benchmarks for the storage layer, the database helpers and the calculators.
+
+`benchmarks.suite` is the reproducible regression suite: it fills throwaway
+databases with `benchmarks.datagen` and writes its timings to JSON. The
+other modules are focused one-off comparisons.
+"""
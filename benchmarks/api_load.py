@@ -0,0 +1,229 @@
+"""Load test for the HTTP quoting API in utils.api.
+
+Fills a throwaway database with seeded synthetic data (see
+benchmarks.datagen), starts `python -m utils.api` on it in its own process
+and drives each scenario from many concurrent keep-alive connections for a
+fixed time:
+
+    python -m benchmarks.api_load --size 100k --connections 64 --duration 10
+
+Reports requests/s, deals/s and p50/p95/p99 latency per scenario. Pass
+--url to load a server that is already running instead; project ids are
+then assumed to run from 1 to --size.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from benchmarks import datagen
+from utils.api import DEAL_FIELDS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_CONNECTIONS = 64
+DEFAULT_DURATION = 5.0
+# Seconds each scenario runs before measuring starts
+WARMUP = 1.0
+# Distinct request bodies generated per scenario; requests cycle through them
+BODIES_PER_SCENARIO = 256
+
+
+@dataclass
+class Scenario:
+    """Requests to send, as ready-to-write bytes, and the deals each one prices"""
+    name: str
+    requests: list
+    deals: int = 0
+
+
+def _request(method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n"
+    if body:
+        head += "Content-Type: application/json\r\n"
+    return (head + "\r\n").encode() + body
+
+
+def _deals(n, seed):
+    """`n` synthetic deals with the same distribution as the benchmark projects"""
+    return [
+        dict(zip(DEAL_FIELDS, row[1:1 + len(DEAL_FIELDS)]))
+        for chunk in datagen.generate_projects(n, seed) for row in chunk
+    ]
+
+
+def build_scenarios(rows, batch_sizes, seed=datagen.DEFAULT_SEED):
+    """Every scenario, reading projects with ids 1..rows"""
+    rng = random.Random(seed)
+    deals = _deals(max(BODIES_PER_SCENARIO, *batch_sizes), seed)
+    scenarios = [Scenario("quote", [_request("POST", "/quote", deal) for deal in deals[:BODIES_PER_SCENARIO]], 1)]
+    for size in batch_sizes:
+        # Alternate both body shapes the batch endpoint accepts
+        chunks = [deals[start:start + size] for start in range(0, len(deals) - size + 1, size)] or [deals[:size]]
+        scenarios.append(Scenario(f"quotes[{size}]", [
+            _request("POST", "/quotes", {"deals": chunk}) for chunk in chunks
+        ], size))
+        scenarios.append(Scenario(f"quotes[{size}, columns]", [
+            _request("POST", "/quotes", {"deals": {name: [deal[name] for deal in chunk] for name in DEAL_FIELDS}})
+            for chunk in chunks
+        ], size))
+    scenarios.append(Scenario("get_project", [
+        _request("GET", f"/projects/{rng.randint(1, rows)}") for _ in range(BODIES_PER_SCENARIO)
+    ]))
+    scenarios.append(Scenario("list_projects", [
+        _request("GET", "/projects?limit=25"),
+        _request("GET", "/projects?limit=25&sort_by=total_revenue"),
+        _request("GET", "/projects?limit=25&name=a&min_margin=30"),
+    ]))
+    scenarios.append(Scenario("create_project", [
+        _request("POST", "/projects", {"name": f"Load test {i}", **deal}) for i, deal in enumerate(deals[:BODIES_PER_SCENARIO])
+    ]))
+    return scenarios
+
+
+async def _read_response(reader):
+    """Read one response and return its status code"""
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    if length:
+        await reader.readexactly(length)
+    return status
+
+
+async def _client(host, port, requests, offset, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(requests[i % len(requests)])
+            status = await _read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+            i += 1
+    finally:
+        writer.close()
+
+
+async def _drive(host, port, scenario, connections, seconds):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(host, port, scenario.requests, i, deadline, latencies, errors) for i in range(connections)
+    ))
+    return latencies, errors, time.perf_counter() - start
+
+
+def run_scenario(host, port, scenario, connections=DEFAULT_CONNECTIONS, duration=DEFAULT_DURATION):
+    """Warm up, then load the server with one scenario; returns its throughput and latency"""
+    asyncio.run(_drive(host, port, scenario, connections, WARMUP))
+    latencies, errors, seconds = asyncio.run(_drive(host, port, scenario, connections, duration))
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": len(latencies) / seconds,
+        "deals_per_second": len(latencies) * scenario.deals / seconds,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def start_server(db_path):
+    """Start `python -m utils.api` on a free port; returns (process, host, port)"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "utils.api", "--port", "0", "--db", db_path],
+        cwd=ROOT, stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline()
+    if not line.startswith("Listening on "):
+        process.kill()
+        raise RuntimeError("The API server did not start")
+    address = urlsplit(line.split()[-1])
+    return process, address.hostname, address.port
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="1k", help=f"projects in the database: {', '.join(datagen.SIZES)} or a number")
+    parser.add_argument("--seed", type=int, default=datagen.DEFAULT_SEED)
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS)
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds per scenario")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 10_000],
+                        help="deals per request in the batch scenarios")
+    parser.add_argument("--only", nargs="+", help="run only scenarios whose name contains one of these")
+    parser.add_argument("--url", help="load a running server instead of starting one")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    try:
+        rows = datagen.parse_size(args.size)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    scenarios = [
+        s for s in build_scenarios(rows, args.batch_sizes, args.seed)
+        if not args.only or any(part in s.name for part in args.only)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        process = None
+        if args.url:
+            address = urlsplit(args.url)
+            host, port = address.hostname, address.port
+        else:
+            with datagen.data_dir(tmp) as path:
+                datagen.populate(rows, args.seed)
+            process, host, port = start_server(str(path / "app.db"))
+
+        results = {
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "size": rows,
+                "connections": args.connections,
+                "duration": args.duration,
+            },
+            "scenarios": {},
+        }
+        print(f"{'scenario':<24}{'req/s':>10}{'deals/s':>12}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'errors':>8}")
+        try:
+            for scenario in scenarios:
+                stats = run_scenario(host, port, scenario, args.connections, args.duration)
+                results["scenarios"][scenario.name] = stats
+                deals = f"{stats['deals_per_second']:>12,.0f}" if scenario.deals else f"{'-':>12}"
+                print(f"{scenario.name:<24}{stats['requests_per_second']:>10,.0f}{deals}{stats['p50_ms']:>10.2f}"
+                      f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['errors']:>8}")
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Per-call latency of a fresh sqlite3.connect() versus the pooled storage layer.
+
+Run from the repository root:
+
+    python -m benchmarks.connection_latency --calls 2000
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import storage
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    upfront_payment REAL NOT NULL
+)
+'''
+
+def _fresh_read(db_path, project_id):
+    conn = sqlite3.connect(db_path)
+    conn.execute("SELECT * FROM projects WHERE id = ?", (project_id,)).fetchone()
+    conn.close()
+
+def _fresh_write(db_path, i):
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO projects (name, upfront_payment) VALUES (?, ?)", (f"p{i}", i))
+    conn.commit()
+    conn.close()
+
+def _pooled_read(db_path, project_id):
+    with storage.connect(db_path) as conn:
+        conn.execute("SELECT * FROM projects WHERE id = ?", (project_id,)).fetchone()
+
+def _pooled_write(db_path, i):
+    with storage.transaction(db_path) as conn:
+        conn.execute("INSERT INTO projects (name, upfront_payment) VALUES (?, ?)", (f"p{i}", i))
+
+def _time(fn, db_path, calls):
+    samples = []
+    for i in range(1, calls + 1):
+        start = time.perf_counter()
+        fn(db_path, i)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples), statistics.quantiles(samples, n=100)[94]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fresh_db = os.path.join(tmp, "fresh.db")
+        pooled_db = os.path.join(tmp, "pooled.db")
+        for path in (fresh_db, pooled_db):
+            with storage.transaction(path) as conn:
+                conn.execute(SCHEMA)
+        storage.close_all()
+
+        # Both files run in WAL mode so only the connection handling differs
+        cases = [
+            ("write, connect per call", _fresh_write, fresh_db),
+            ("write, pooled", _pooled_write, pooled_db),
+            ("read,  connect per call", _fresh_read, fresh_db),
+            ("read,  pooled", _pooled_read, pooled_db),
+        ]
+        print(f"{'case':<26}{'p50 (us)':>12}{'p95 (us)':>12}")
+        for label, fn, path in cases:
+            p50, p95 = _time(fn, path, args.calls)
+            print(f"{label:<26}{p50:>12.1f}{p95:>12.1f}")
+        storage.close_all()
+
+if __name__ == "__main__":
+    main()
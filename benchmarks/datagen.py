@@ -0,0 +1,256 @@
+"""Seeded synthetic data for the projects, freelancers and transactions tables.
+
+The same size and seed always produce the same rows, so benchmark results
+from different commits are measured against identical data. Each table
+draws from its own random stream, so changing one generator does not shift
+the data of the others. To fill a directory for manual experiments:
+
+    python -m benchmarks.datagen --size 100k --data-dir /tmp/cost-calculate-bench
+"""
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import db_utils, payroll_db, payroll_engine, project_db, storage
+from utils.cache import clear_caches
+from utils.profitability import allocation_mixes, SENSITIVITY_MARGINS
+from utils.storage import transaction
+
+# Named dataset sizes: rows per table
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+DEFAULT_SEED = 42
+
+# Rows generated and inserted at a time, which bounds memory use
+CHUNK_SIZE = 100_000
+
+# Generated dates fall inside this range (end exclusive)
+START_DATE = np.datetime64("2022-01-01")
+END_DATE = np.datetime64("2025-01-01")
+
+TRANSACTION_CATEGORIES = {
+    "Income": ("Project Payment", "Maintenance", "Consulting", "Other Income"),
+    "Expense": ("Freelancers", "Salaries", "Cloud Hosting", "Software Tools", "Office", "Bank Fees", "Taxes"),
+}
+# Share of transactions per currency and a base rate to VND for each
+CURRENCIES = (("VND", 0.80, 1.0), ("USD", 0.15, 24_500.0), ("EUR", 0.05, 26_500.0))
+NATIONALITIES = (("Vietnamese", 0.7), ("Foreign", 0.3))
+NAME_WORDS = (
+    "Alpha", "Bamboo", "Cedar", "Delta", "Ember", "Falcon", "Granite", "Harbor",
+    "Indigo", "Jade", "Lotus", "Mekong", "Nova", "Orchid", "Pearl", "River",
+)
+
+# Stream ids keeping each table's random numbers independent
+_PROJECTS, _FREELANCERS, _TRANSACTIONS, _FX_RATES = range(4)
+
+
+def parse_size(size):
+    """Turn a size name from SIZES or a plain row count into a number of rows"""
+    if str(size).lower() in SIZES:
+        return SIZES[str(size).lower()]
+    try:
+        rows = int(size)
+    except ValueError:
+        raise ValueError(f"Unknown dataset size {size!r}; use one of {', '.join(SIZES)} or a row count") from None
+    if rows <= 0:
+        raise ValueError("Dataset size must be positive")
+    return rows
+
+
+def _rng(seed, stream, chunk=0):
+    return np.random.default_rng([seed, stream, chunk])
+
+
+def _chunks(n):
+    for start in range(0, n, CHUNK_SIZE):
+        yield start, min(CHUNK_SIZE, n - start)
+
+
+def _names(rng, ids, prefix=""):
+    first = rng.choice(NAME_WORDS, size=len(ids))
+    second = rng.choice(NAME_WORDS, size=len(ids))
+    return [f"{prefix}{a} {b} {i}" for a, b, i in zip(first.tolist(), second.tolist(), ids.tolist())]
+
+
+def _timestamps(rng, n):
+    """Random YYYY-MM-DD HH:MM:SS strings inside the generated date range"""
+    span = (END_DATE - START_DATE).astype("timedelta64[s]").astype(np.int64)
+    seconds = rng.integers(0, span, size=n)
+    stamps = START_DATE.astype("datetime64[s]") + seconds.astype("timedelta64[s]")
+    return np.char.replace(stamps.astype(str), "T", " ").tolist()
+
+
+def generate_projects(n, seed=DEFAULT_SEED):
+    """Yield chunks of project rows as lists of tuples in projects table column order"""
+    mixes = allocation_mixes(5)
+    # Keep to mixes that give every category something, like real quotes
+    mixes = mixes[(mixes > 0).all(axis=1)]
+    for start, size in _chunks(n):
+        rng = _rng(seed, _PROJECTS, start)
+        ids = np.arange(start + 1, start + size + 1)
+        upfront = np.round(rng.lognormal(np.log(20_000), 0.8, size), -2)
+        monthly = np.where(rng.random(size) < 0.6, np.round(rng.lognormal(np.log(800), 0.6, size), -1), 0.0)
+        months = np.where(monthly > 0, rng.integers(1, 25, size), 0)
+        other = np.where(rng.random(size) < 0.2, np.round(rng.uniform(0, 5_000, size), -1), 0.0)
+        margin = rng.choice(np.array(SENSITIVITY_MARGINS[2:-4], dtype=np.float64), size)
+        allocations = mixes[rng.integers(0, len(mixes), size)]
+        yield list(zip(
+            _names(rng, ids, "Project "), upfront.tolist(), monthly.tolist(), months.tolist(), other.tolist(),
+            margin.tolist(), *(allocations[:, i].tolist() for i in range(4)), _timestamps(rng, size)
+        ))
+
+
+def generate_freelancers(n, seed=DEFAULT_SEED):
+    """Yield chunks of (name, nationality, gross_payment) tuples"""
+    nationalities = np.array([name for name, _ in NATIONALITIES], dtype=object)
+    weights = [weight for _, weight in NATIONALITIES]
+    for start, size in _chunks(n):
+        rng = _rng(seed, _FREELANCERS, start)
+        ids = np.arange(start + 1, start + size + 1)
+        gross = np.round(rng.lognormal(np.log(2_500), 0.7, size), -1)
+        yield list(zip(_names(rng, ids), rng.choice(nationalities, size, p=weights).tolist(), gross.tolist()))
+
+
+def generate_fx_rates(seed=DEFAULT_SEED):
+    """Monthly (currency, rate_date, rate) rows for every foreign currency"""
+    rng = _rng(seed, _FX_RATES)
+    months = np.arange(START_DATE.astype("datetime64[M]"), END_DATE.astype("datetime64[M]"))
+    rows = []
+    for currency, _, base_rate in CURRENCIES[1:]:
+        # A gentle random walk around the base rate
+        rates = base_rate * np.exp(np.cumsum(rng.normal(0, 0.01, len(months))))
+        dates = months.astype("datetime64[D]").astype(str).tolist()
+        rows.extend(zip([currency] * len(months), dates, np.round(rates, 2).tolist()))
+    return rows
+
+
+def generate_transactions(n, seed=DEFAULT_SEED, fx_rates=None):
+    """Yield chunks of transaction rows in db_utils.TRANSACTION_COLUMNS order.
+
+    Foreign-currency rows are valued at the monthly rates from
+    generate_fx_rates(), so revaluing them is a no-op.
+    """
+    fx_rates = fx_rates or generate_fx_rates(seed)
+    currencies = np.array([code for code, _, _ in CURRENCIES], dtype=object)
+    currency_weights = [share for _, share, _ in CURRENCIES]
+    monthly_rates = {(currency, rate_date[:7]): rate for currency, rate_date, rate in fx_rates}
+    labels = [(kind, category) for kind, categories in TRANSACTION_CATEGORIES.items() for category in categories]
+    span = int((END_DATE - START_DATE).astype(np.int64))
+
+    for start, size in _chunks(n):
+        rng = _rng(seed, _TRANSACTIONS, start)
+        ids = np.arange(start + 1, start + size + 1)
+        dates = (START_DATE + rng.integers(0, span, size).astype("timedelta64[D]")).astype(str).tolist()
+        kinds, categories = zip(*(labels[i] for i in rng.integers(0, len(labels), size).tolist()))
+        chunk_currencies = rng.choice(currencies, size, p=currency_weights).tolist()
+        amounts = np.round(rng.lognormal(np.log(1_000), 1.0, size), 2)
+        # VND amounts are the same values converted at a typical rate, rounded to 1,000 dong
+        amounts = np.where(np.array(chunk_currencies) == "VND", np.round(amounts * 25_000, -3), amounts).tolist()
+        rates = [
+            monthly_rates.get((currency, tx_date[:7]), 1.0)
+            for currency, tx_date in zip(chunk_currencies, dates)
+        ]
+        yield [
+            (tx_date, kind, amount, currency, amount * rate, f"Synthetic {category.lower()} #{tx_id}",
+             category, f"REF-{tx_id:08d}", rate)
+            for tx_date, kind, amount, currency, rate, category, tx_id
+            in zip(dates, kinds, amounts, chunk_currencies, rates, categories, ids.tolist())
+        ]
+
+
+@contextmanager
+def data_dir(path):
+    """Point every database module at a database inside `path` for the block"""
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    saved = (project_db.DB_PATH, db_utils.DB_PATH, payroll_db.DB_PATH)
+    project_db.DB_PATH = db_utils.DB_PATH = payroll_db.DB_PATH = str(path / "app.db")
+    try:
+        yield path
+    finally:
+        project_db.DB_PATH, db_utils.DB_PATH, payroll_db.DB_PATH = saved
+        storage.close_all()
+        clear_caches()
+
+
+def populate(rows, seed=DEFAULT_SEED, progress=None):
+    """Create the schema and insert `rows` projects, freelancers and transactions.
+
+    Writes to whatever DB_PATHs the modules currently point at (see
+    data_dir()). `progress` is called with (table, rows_done). Returns the
+    seconds spent per table.
+    """
+    project_db.init_db()
+    seconds = {}
+
+    start = time.perf_counter()
+    done = 0
+    with transaction(project_db.DB_PATH) as conn:
+        for chunk in generate_projects(rows, seed):
+            conn.executemany('''
+                INSERT INTO projects (
+                    name, upfront_payment, monthly_maintenance, maintenance_months,
+                    other_revenue, target_margin, freelancer_allocation,
+                    internal_staff_allocation, tech_infra_allocation, admin_allocation, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', chunk)
+            done += len(chunk)
+            if progress:
+                progress("projects", done)
+    seconds["projects"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    freelancers = [row for chunk in generate_freelancers(rows, seed) for row in chunk]
+    payroll_engine.run_payroll(freelancers)
+    if progress:
+        progress("freelancers", len(freelancers))
+    del freelancers
+    seconds["freelancers"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fx_rates = generate_fx_rates(seed)
+    db_utils.save_fx_rates(fx_rates)
+    done = 0
+    with transaction(db_utils.DB_PATH), db_utils.bulk_load():
+        for chunk in generate_transactions(rows, seed, fx_rates):
+            done += db_utils.save_transactions(chunk)
+            if progress:
+                progress("transactions", done)
+    seconds["transactions"] = time.perf_counter() - start
+    return seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill the app databases with seeded synthetic data.")
+    parser.add_argument("--size", default="1k", help=f"rows per table: {', '.join(SIZES)} or a number")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--data-dir", required=True, help="directory for the generated database")
+    args = parser.parse_args(argv)
+
+    try:
+        rows = parse_size(args.size)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    if os.path.exists(os.path.join(args.data_dir, "app.db")):
+        print(f"error: app.db already exists in {args.data_dir}", file=sys.stderr)
+        return 1
+
+    def report(table, done):
+        print(f"\r{table:<14}{done:>12,} rows", end="", file=sys.stderr)
+
+    with data_dir(args.data_dir):
+        seconds = populate(rows, args.seed, report)
+    print(file=sys.stderr)
+    for table, elapsed in seconds.items():
+        print(f"{table:<14}{rows:>12,} rows in {elapsed:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Cold-start budget check for Home.py and the pages.
+
+Each entry point is rendered once in a fresh interpreter, as the first page
+a new server process serves: Streamlit itself is imported beforehand (the
+server has it loaded before any page runs) and the databases point at an
+empty temporary directory. The fastest of the runs is compared with the
+page's budget (timing noise on a shared machine only ever adds time, so a
+median can cross a budget the page itself meets), and heavy modules the
+page is expected to leave unloaded are checked. Exits non-zero when a
+budget is exceeded:
+
+    python -m benchmarks.import_time --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# First-run budget per entry point in milliseconds, and heavy modules it
+# must not import on a cold start with empty databases
+BUDGETS = {
+    "Home.py": (450, ("pandas",)),
+    "pages/cost-calculate.py": (300, ("pandas", "numpy")),
+    "pages/payroll.py": (800, ()),
+    "pages/performance.py": (800, ()),
+}
+
+# Modules reported as loaded by each page
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "plotly")
+
+_PROBE = '''
+import json, os, sys, tempfile, time
+sys.path.insert(0, {root!r})
+import streamlit
+from streamlit.testing.v1 import AppTest
+
+# The utils modules are part of the page's cold start, so time them too
+loaded_before = set(sys.modules)
+start = time.perf_counter()
+from utils import db_utils, payroll_db, project_db
+
+data_dir = tempfile.mkdtemp()
+project_db.DB_PATH = db_utils.DB_PATH = payroll_db.DB_PATH = os.path.join(data_dir, "app.db")
+
+at = AppTest.from_file({page!r}, default_timeout=60)
+at.run()
+print(json.dumps({{
+    "ms": (time.perf_counter() - start) * 1000,
+    "error": str(at.exception[0].value) if at.exception else None,
+    "loaded": [m for m in {heavy!r} if m in sys.modules and m not in loaded_before],
+}}))
+'''
+
+
+def measure(page, runs):
+    """Fastest first-run time of a page over `runs` fresh interpreters"""
+    samples, loaded = [], set()
+    for _ in range(runs):
+        probe = _PROBE.format(root=ROOT, page=os.path.join(ROOT, page), heavy=HEAVY_MODULES)
+        result = subprocess.run(
+            [sys.executable, "-c", probe], capture_output=True, text=True, cwd=ROOT, check=True
+        )
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        if sample["error"]:
+            raise RuntimeError(f"{page} failed: {sample['error']}")
+        samples.append(sample["ms"])
+        loaded.update(sample["loaded"])
+    return min(samples), sorted(loaded)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    failures = 0
+    print(f"{'page':<26}{'best (ms)':>10}{'budget':>9}  loaded")
+    for page, (budget_ms, must_stay_unloaded) in BUDGETS.items():
+        best_ms, loaded = measure(page, args.runs)
+        problems = []
+        if best_ms > budget_ms:
+            problems.append("over budget")
+        eager = [m for m in must_stay_unloaded if m in loaded]
+        if eager:
+            problems.append(f"imported {', '.join(eager)}")
+        failures += bool(problems)
+        flag = f"  FAIL: {'; '.join(problems)}" if problems else ""
+        print(f"{page:<26}{best_ms:>10.0f}{budget_ms:>9}  {', '.join(loaded) or '-'}{flag}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
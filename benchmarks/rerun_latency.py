@@ -0,0 +1,167 @@
+"""Rerun latency of the cost calculator page: full-page reruns versus fragment reruns.
+
+Each scenario changes one widget and times the rerun it triggers, once
+rerunning the whole script (what every widget change cost before the page
+was split into fragments) and once rerunning only the fragment that owns
+the widget. The page runs against a throwaway database. Run from the
+repository root:
+
+    python -m benchmarks.rerun_latency --runs 20
+
+AppTest has no public API for fragment reruns, so this drives private
+Streamlit internals; it checks for them first and stops with an error on a
+Streamlit release that lacks them.
+"""
+import argparse
+import dataclasses
+import inspect
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import app_test
+
+from benchmarks import datagen
+
+try:
+    from streamlit.runtime.scriptrunner_utils.script_requests import ScriptRequests
+except ImportError:
+    ScriptRequests = None
+
+# Streamlit release the private hooks below were written against
+TESTED_STREAMLIT = "1.65"
+
+PAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pages", "cost-calculate.py")
+
+
+class _FragmentRerun:
+    """Route AppTest reruns through a single fragment.
+
+    AppTest has no public API for fragment reruns, so the rerun request it
+    sends to its script runner is tagged with the fragment id, exactly like
+    the browser does when a widget inside a fragment changes. Each AppTest
+    run uses a fresh runner that starts with a full rerun pending, which is
+    dropped first so it does not absorb the fragment rerun.
+    """
+
+    def __init__(self, fragment_id):
+        self.fragment_id = fragment_id
+        self._original = app_test.LocalScriptRunner.request_rerun
+
+    def __enter__(self):
+        fragment_id, original = self.fragment_id, self._original
+
+        def request_rerun(runner, rerun_data):
+            runner._requests = ScriptRequests()
+            return original(runner, dataclasses.replace(rerun_data, fragment_id=fragment_id))
+
+        app_test.LocalScriptRunner.request_rerun = request_rerun
+        return self
+
+    def __exit__(self, *exc):
+        app_test.LocalScriptRunner.request_rerun = self._original
+
+
+def _internals_error(missing):
+    return RuntimeError(
+        f"Streamlit {streamlit.__version__} lacks the private APIs this benchmark drives "
+        f"({', '.join(missing)}); it was written against Streamlit {TESTED_STREAMLIT}"
+    )
+
+
+def check_streamlit():
+    """Raise RuntimeError unless the Streamlit internals used here exist"""
+    missing = []
+    if ScriptRequests is None:
+        missing.append("scriptrunner_utils.script_requests.ScriptRequests")
+    if not hasattr(getattr(app_test, "LocalScriptRunner", None), "request_rerun"):
+        missing.append("testing.v1.app_test.LocalScriptRunner.request_rerun")
+    if missing:
+        raise _internals_error(missing)
+
+
+def _fragment_id(at, name):
+    """Find the id of the fragment registered for the function `name`"""
+    if not hasattr(getattr(at, "_fragment_storage", None), "_fragments"):
+        raise _internals_error(["AppTest._fragment_storage._fragments"])
+    for fragment_id, fragment in at._fragment_storage._fragments.items():
+        func = inspect.getclosurevars(fragment).nonlocals.get("non_optional_func")
+        if func is not None and func.__name__ == name:
+            return fragment_id
+    raise LookupError(f"Fragment {name!r} was not rendered")
+
+
+def _quote_page():
+    """A page with revenue entered and the allocation form submitted"""
+    at = AppTest.from_file(PAGE, default_timeout=60)
+    at.run()
+    at.number_input[0].set_value(50000.0).run()
+    at.session_state["allocation_percentages"] = True
+    at.button[0].click().run()
+    return at
+
+
+def _slider(at, label):
+    return next(s for s in at.slider if s.label.startswith(label))
+
+
+def _text_input(at, label):
+    return next(t for t in at.text_input if t.label == label)
+
+
+SCENARIOS = [
+    ("developer split slider", "developer_split_panel",
+     lambda at, i: _slider(at, "Developer 1").set_value(10 + 5 * (i % 10))),
+    ("internal developer slider", "internal_staff_panel",
+     lambda at, i: _slider(at, "Internal Developer").set_value(5 * (i % 20))),
+    ("target margin slider", "quote_tab",
+     lambda at, i: _slider(at, "Target Profit Margin").set_value(5 * (i % 18))),
+    ("saved projects name filter", "saved_projects_tab",
+     lambda at, i: _text_input(at, "Filter by name").set_value(f"p{i}")),
+]
+
+
+def _time_reruns(at, change, runs, fragment_id=None):
+    samples = []
+    for i in range(runs):
+        change(at, i)
+        start = time.perf_counter()
+        if fragment_id is None:
+            at.run()
+        else:
+            with _FragmentRerun(fragment_id):
+                at.run()
+        samples.append((time.perf_counter() - start) * 1000)
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+    return statistics.median(samples), max(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    try:
+        check_streamlit()
+        with tempfile.TemporaryDirectory() as tmp, datagen.data_dir(tmp):
+            print(f"{'widget':<30}{'full p50 (ms)':>15}{'fragment p50 (ms)':>19}{'speedup':>9}")
+            for label, fragment, change in SCENARIOS:
+                at = _quote_page()
+                full_p50, _ = _time_reruns(at, change, args.runs)
+                fragment_p50, _ = _time_reruns(at, change, args.runs, _fragment_id(at, fragment))
+                print(f"{label:<30}{full_p50:>15.1f}{fragment_p50:>19.1f}{full_p50 / fragment_p50:>8.1f}x")
+    except RuntimeError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,376 @@
+"""Regression benchmarks for the database helpers and the profitability math.
+
+Every public function in utils.project_db and utils.db_utils, plus the
+portfolio engine in utils.profitability and the single-quote calculator, is
+timed against seeded synthetic data (see benchmarks.datagen) at each
+requested size. Query caches are cleared before every run, so reads are
+measured cold. Results are written as JSON and can be compared with a
+previous run:
+
+    python -m benchmarks.suite --sizes 1k 100k --output before.json
+    python -m benchmarks.suite --sizes 1k 100k --output after.json --compare before.json
+"""
+import argparse
+import inspect
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import plotly.io
+import plotly.tools
+
+from benchmarks import datagen
+from utils import calc, charts, db_utils, profitability, project_db
+from utils.cache import clear_caches
+from utils.storage import connect
+
+# Modules whose every public function must have a benchmark case
+COVERED_MODULES = (project_db, db_utils, profitability)
+
+DEFAULT_RUNS = 5
+# Stop repeating a case once its runs have taken this long
+DEFAULT_CASE_BUDGET = 10.0
+# A case is reported as a regression when its median grows by this factor
+# and by more than the noise floor
+DEFAULT_THRESHOLD = 1.25
+NOISE_FLOOR_SECONDS = 0.001
+
+# Rows touched by the bulk write cases and quotes computed by the calc case
+BATCH_ROWS = 1_000
+
+SAMPLE_PROJECT = {
+    "name": "Benchmark project",
+    "upfront_payment": 25_000.0,
+    "monthly_maintenance": 500.0,
+    "maintenance_months": 12,
+    "other_revenue": 0.0,
+    "target_margin": 50.0,
+    "freelancer_allocation": 50.0,
+    "internal_staff_allocation": 20.0,
+    "tech_infra_allocation": 15.0,
+    "admin_allocation": 15.0,
+}
+SAMPLE_TRANSACTION = {
+    "date": "2024-06-15",
+    "type": "Expense",
+    "amount": 120.0,
+    "currency": "USD",
+    "vnd_amount": 120.0 * 24_500,
+    "description": "Benchmark transaction",
+    "category": "Cloud Hosting",
+    "reference": "REF-BENCH",
+    "exchange_rate": 24_500.0,
+}
+
+
+@dataclass
+class Case:
+    """One timed call. `setup` runs untimed before every run."""
+    name: str
+    run: object
+    setup: object = None
+
+
+def _clear_all_caches():
+    clear_caches()
+    calc.calculate.cache_clear()
+    profitability.sensitivity_grid.cache_clear()
+    profitability.sensitivity_table.cache_clear()
+
+
+def _build_cases(rows, seed):
+    """Benchmark cases for a database populated with `rows` rows per table"""
+    middle_id = max(rows // 2, 1)
+    state = {}
+
+    def save_then(key, save):
+        def setup():
+            _clear_all_caches()
+            state[key] = save()
+        return setup
+
+    project_table = project_db.get_all_projects()
+    projects = pd.DataFrame(project_table.to_columns())
+    portfolio = profitability.compute_portfolio(projects)
+    project_rows = list(project_table[:BATCH_ROWS])
+    project_inserts = [
+        tuple(getattr(project, name) for name in project_db.PROJECT_INSERT_COLUMNS) for project in project_rows
+    ]
+    transactions = next(datagen.generate_transactions(BATCH_ROWS, seed + 1))
+    fx_rates = datagen.generate_fx_rates(seed)
+    foreign = db_utils.get_foreign_transactions_after(0, BATCH_ROWS)
+    rate_updates = [(row[4], row[5], row[0]) for row in foreign]
+    quote = calc.calculate_project(project_rows[0])
+    deal_chart = (quote.expected_profit, quote.actual_margin_pct, quote.category_expenses, quote.total_revenue)
+    expense_chart = (list(quote.category_expenses), list(quote.category_expenses.values()), 320)
+
+    return [
+        # utils.project_db
+        Case("project_db.init_db", project_db.init_db),
+        Case("project_db.ensure_db", project_db.ensure_db),
+        Case("project_db.get_all_projects", project_db.get_all_projects),
+        Case("project_db.list_projects", project_db.list_projects),
+        Case("project_db.list_projects[filtered,revenue]", lambda: project_db.list_projects(
+            sort_by="total_revenue", name="Lotus", min_margin=30, max_margin=70
+        )),
+        Case("project_db.get_project_by_id", lambda: project_db.get_project_by_id(middle_id)),
+        Case("project_db.search_projects", project_db.search_projects),
+        Case("project_db.search_projects[prefix]", lambda: project_db.search_projects("Lotus")),
+        Case("project_db.search_projects[substring]", lambda: project_db.search_projects("otus")),
+        Case("project_db.search_projects[no match]", lambda: project_db.search_projects("zzzz")),
+        Case("project_db.get_project_actuals", project_db.get_project_actuals),
+        Case("project_db.get_project_actuals[one]", lambda: project_db.get_project_actuals([middle_id])),
+        Case("project_db.save_project", lambda: project_db.save_project(SAMPLE_PROJECT)),
+        Case("project_db.save_projects", lambda: project_db.save_projects(project_inserts)),
+        Case("project_db.update_project", lambda: project_db.update_project(state["project_id"], SAMPLE_PROJECT),
+             save_then("project_id", lambda: project_db.save_project(SAMPLE_PROJECT))),
+        Case("project_db.delete_project", lambda: project_db.delete_project(state["project_id"]),
+             save_then("project_id", lambda: project_db.save_project(SAMPLE_PROJECT))),
+
+        # utils.db_utils
+        Case("db_utils.init_db", db_utils.init_db),
+        Case("db_utils.ensure_db", db_utils.ensure_db),
+        Case("db_utils.get_all_transactions", db_utils.get_all_transactions),
+        Case("db_utils.get_filtered_transactions", lambda: db_utils.get_filtered_transactions(
+            ["Expense"], ["Cloud Hosting", "Software Tools"]
+        )),
+        Case("db_utils.search_transactions", lambda: db_utils.search_transactions("cloud hosting")),
+        Case("db_utils.search_transactions[reference]",
+             lambda: db_utils.search_transactions(f"REF-{middle_id:08d}"[:-2])),
+        Case("db_utils.get_transaction_totals", db_utils.get_transaction_totals),
+        Case("db_utils.get_transaction_totals[week,range]", lambda: db_utils.get_transaction_totals(
+            bucket="week", start_date="2023-01-01", end_date="2023-12-31"
+        )),
+        Case("db_utils.get_monthly_totals", db_utils.get_monthly_totals),
+        Case("db_utils.verify_monthly_rollups", db_utils.verify_monthly_rollups),
+        Case("db_utils.get_fx_rates", db_utils.get_fx_rates),
+        Case("db_utils.get_foreign_transactions_after",
+             lambda: db_utils.get_foreign_transactions_after(0, BATCH_ROWS)),
+        Case("db_utils.export_to_dataframe", db_utils.export_to_dataframe),
+        Case("db_utils.save_transaction", lambda: db_utils.save_transaction(SAMPLE_TRANSACTION)),
+        Case("db_utils.save_transactions", lambda: db_utils.save_transactions(transactions)),
+        Case("db_utils.update_transaction", lambda: db_utils.update_transaction(middle_id, SAMPLE_TRANSACTION)),
+        Case("db_utils.delete_transaction", lambda: db_utils.delete_transaction(state["transaction_id"]),
+             save_then("transaction_id", _insert_transaction)),
+        Case("db_utils.save_fx_rates", lambda: db_utils.save_fx_rates(fx_rates)),
+        Case("db_utils.update_exchange_rates", lambda: db_utils.update_exchange_rates(rate_updates)),
+        Case("db_utils.rebuild_monthly_rollups", db_utils.rebuild_monthly_rollups),
+        Case("db_utils.bulk_load", _empty_bulk_load),
+
+        # utils.profitability and utils.calc
+        Case("profitability.compute_arrays", lambda: profitability.compute_arrays(projects)),
+        Case("profitability.compute_portfolio", lambda: profitability.compute_portfolio(projects)),
+        Case("profitability.compute_portfolio[records]", lambda: profitability.compute_portfolio(project_table)),
+        Case("profitability.summarize_portfolio", lambda: profitability.summarize_portfolio(portfolio)),
+        Case("profitability.allocation_mixes", profitability.allocation_mixes),
+        Case("profitability.sensitivity_grid", lambda: profitability.sensitivity_grid(100_000.0)),
+        Case("profitability.sensitivity_table", lambda: profitability.sensitivity_table(100_000.0)),
+        Case("profitability.deal_problems", lambda: profitability.deal_problems(project_table.to_columns())),
+        Case("profitability.deal_errors", lambda: profitability.deal_errors(SAMPLE_PROJECT)),
+        Case(f"calc.calculate_project[x{len(project_rows)}]",
+             lambda: [calc.calculate_project(project) for project in project_rows]),
+
+        # utils.charts, built from scratch and served from the figure cache, up
+        # to the JSON st.plotly_chart sends to the browser
+        Case("charts.deal_composition_figure[json]", lambda: _chart_json(charts.deal_composition_figure(*deal_chart))),
+        Case("charts.deal_composition_figure[cached,json]",
+             lambda: _chart_json(charts.deal_composition_figure(*deal_chart)),
+             setup=lambda: charts.deal_composition_figure(*deal_chart)),
+        Case("charts.expense_pie_figure[json]", lambda: _chart_json(charts.expense_pie_figure(*expense_chart))),
+        Case("charts.expense_pie_figure[cached,json]", lambda: _chart_json(charts.expense_pie_figure(*expense_chart)),
+             setup=lambda: charts.expense_pie_figure(*expense_chart)),
+    ]
+
+
+def _chart_json(figure):
+    """Encode a figure the way st.plotly_chart does"""
+    figure = plotly.tools.return_figure_from_figure_or_data(figure, validate_figure=True)
+    return plotly.io.to_json(figure, validate=False)
+
+
+def _insert_transaction():
+    """Insert the sample transaction and return its id"""
+    db_utils.save_transaction(SAMPLE_TRANSACTION)
+    with connect(db_utils.DB_PATH) as conn:
+        return conn.execute("SELECT MAX(id) FROM transactions").fetchone()[0]
+
+
+def _empty_bulk_load():
+    """Drop and rebuild the ledger indexes and rollups around an empty load"""
+    with db_utils.bulk_load():
+        pass
+
+
+def missing_cases(cases):
+    """Public functions of COVERED_MODULES that no case benchmarks"""
+    covered = {case.name.split("[")[0] for case in cases}
+    missing = []
+    for module in COVERED_MODULES:
+        prefix = module.__name__.rsplit(".", 1)[-1]
+        for name, func in inspect.getmembers(module, inspect.isfunction):
+            if func.__module__ == module.__name__ and not name.startswith("_") and f"{prefix}.{name}" not in covered:
+                missing.append(f"{prefix}.{name}")
+    return missing
+
+
+def time_case(case, runs, budget):
+    """Run a case up to `runs` times (at least once, within `budget` seconds)"""
+    samples = []
+    while len(samples) < runs and (not samples or sum(samples) < budget):
+        if case.setup is not None:
+            case.setup()
+        else:
+            _clear_all_caches()
+        start = time.perf_counter()
+        case.run()
+        samples.append(time.perf_counter() - start)
+    return {
+        "runs": len(samples),
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+    }
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def _environment(seed, runs):
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sqlite": sqlite3.sqlite_version,
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "seed": seed,
+        "runs": runs,
+    }
+
+
+def run_suite(sizes, seed=datagen.DEFAULT_SEED, runs=DEFAULT_RUNS, budget=DEFAULT_CASE_BUDGET,
+              only=None, progress=None):
+    """Populate a throwaway dataset per size and time every case against it.
+
+    `only` optionally restricts the cases to names containing one of its
+    substrings. `progress` is called with (size, case name, timings).
+    Returns the JSON-ready results; `uncovered` lists public functions of
+    COVERED_MODULES without a case.
+    """
+    results = {"environment": _environment(seed, runs), "uncovered": [], "sizes": {}}
+    for size in sizes:
+        rows = datagen.parse_size(size)
+        with tempfile.TemporaryDirectory() as tmp, datagen.data_dir(tmp):
+            generate_seconds = datagen.populate(rows, seed)
+            cases = _build_cases(rows, seed)
+            results["uncovered"] = missing_cases(cases)
+            if only:
+                cases = [case for case in cases if any(pattern in case.name for pattern in only)]
+
+            timings = {}
+            for case in cases:
+                timings[case.name] = time_case(case, runs, budget)
+                if progress:
+                    progress(size, case.name, timings[case.name])
+        results["sizes"][size] = {"rows": rows, "generate_seconds": generate_seconds, "cases": timings}
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Median ratios of every case present in both result sets.
+
+    Returns a list of dicts with `size`, `case`, `baseline`, `current`,
+    `ratio` and `regression` (ratio above `threshold` and slower by more
+    than NOISE_FLOOR_SECONDS).
+    """
+    rows = []
+    for size, current in results["sizes"].items():
+        previous = baseline.get("sizes", {}).get(size)
+        if previous is None:
+            continue
+        for name, timing in current["cases"].items():
+            before = previous["cases"].get(name)
+            if before is None:
+                continue
+            ratio = timing["median"] / before["median"] if before["median"] > 0 else float("inf")
+            rows.append({
+                "size": size,
+                "case": name,
+                "baseline": before["median"],
+                "current": timing["median"],
+                "ratio": ratio,
+                "regression": ratio > threshold and timing["median"] - before["median"] > NOISE_FLOOR_SECONDS,
+            })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["1k"],
+                        help=f"dataset sizes: {', '.join(datagen.SIZES)} or row counts")
+    parser.add_argument("--seed", type=int, default=datagen.DEFAULT_SEED)
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--budget", type=float, default=DEFAULT_CASE_BUDGET,
+                        help="seconds after which a case stops repeating")
+    parser.add_argument("--only", nargs="+", help="run only cases whose name contains one of these")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="median ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    try:
+        for size in args.sizes:
+            datagen.parse_size(size)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    def report(size, name, timing):
+        print(f"{size:>6}  {name:<48}{timing['median'] * 1000:>12.2f} ms  ({timing['runs']} runs)")
+
+    results = run_suite(args.sizes, args.seed, args.runs, args.budget, args.only, report)
+    if results["uncovered"]:
+        print(f"warning: no benchmark for {', '.join(results['uncovered'])}", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} (commit {baseline.get('environment', {}).get('commit')})")
+        print(f"{'size':>6}  {'case':<48}{'before (ms)':>12}{'after (ms)':>12}{'ratio':>8}")
+        regressions = 0
+        for row in compare(results, baseline, args.threshold):
+            regressions += row["regression"]
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(f"{row['size']:>6}  {row['case']:<48}{row['baseline'] * 1000:>12.2f}"
+                  f"{row['current'] * 1000:>12.2f}{row['ratio']:>7.2f}x{flag}")
+        if regressions:
+            print(f"{regressions} case(s) slower than {args.threshold:g}x the baseline", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,440 @@
 import streamlit as st
-import pandas as pd
-import plotly.graph_objects as go
 import sys
 import os
+from datetime import datetime
+from zoneinfo import ZoneInfo
 
 # Add the parent directory to sys.path to allow relative imports
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from utils.project_db import init_db, save_project, get_all_projects, get_project_by_id, update_project, delete_project
+from utils.project_db import ensure_db, save_project, get_all_projects, list_projects, get_project_by_id, get_project_actuals, update_project, delete_project
+from utils.calc import DEFAULT_ALLOCATIONS, QuoteInputs, calculate, calculate_project
+from utils.charts import deal_composition_figure, expense_pie_figure
+from utils.profitability import compute_portfolio, deal_errors, summarize_portfolio, sensitivity_grid, sensitivity_table
+from utils.export import EXPORT_FORMATS, download_data, download_file_name, download_mime
+from utils.metrics import span
+from utils.pickers import project_picker
+from utils.simulation import DEFAULT_RISK, PERCENTILES, simulate_quote
+from utils.lazy import lazy_import
+
+# Heavy modules are imported on first use, not on every cold page load
+pd = lazy_import("pandas")
+go = lazy_import("plotly.graph_objects")
 
 # --- App Configuration ---
 st.set_page_config(layout="wide", page_title="IT Project Cost Calculator")
 
-# Initialize database
-init_db()
+# Number of saved projects shown per page in the saved calculations tab
+PROJECTS_PAGE_SIZE = 25
+
+# Initialize database (once per process)
+ensure_db()
+
+# --- Fragments ---
+# Panels with their own widgets rerun on their own instead of rerunning the whole page
+
+@st.fragment
+def developer_split_panel(quote):
+    """Per-developer payments from the freelancer budget"""
+    # Calculate per-developer allocation
+    st.markdown("#### Suggested Freelancer Payments")
+    dev_count = st.number_input("Number of Freelance Developers", min_value=1, max_value=10, value=2, step=1)
+
+    if dev_count > 0:
+        quote = calculate(quote.inputs.with_changes(developer_count=dev_count))
+        st.markdown(f"**Even split per developer: {quote.even_split:,.2f}**")
+
+        # Slider for adjusting allocations between developers
+        if dev_count > 1:
+            st.markdown("#### Adjust Developer Payment Split")
+            dev_split = []
+
+            for i in range(1, dev_count):
+                max_percent = 100 if i == dev_count-1 else 90
+                dev_split.append(st.slider(f"Developer {i} (% of freelancer budget)", 
+                                           min_value=5, max_value=max_percent, 
+                                           value=max(5, int(100/dev_count)), step=5))
+
+            # Last developer gets remainder
+            quote = calculate(quote.inputs.with_changes(developer_split=tuple(dev_split)))
+
+            for name, amount, percent in quote.developer_payments:
+                st.markdown(f"* **{name}**: {amount:,.2f} ({percent:g}% of freelancer budget)")
+
+
+@st.fragment
+def internal_staff_panel(quote):
+    """Split of the internal staff budget between development and sales"""
+    int_dev_percent = st.slider("Internal Developer %", 0, 100, 70, 5)
+    quote = calculate(quote.inputs.with_changes(internal_developer_pct=float(int_dev_percent)))
+
+    for name, amount, percent in quote.internal_staff_split:
+        st.markdown(f"* **{name}**: {amount:,.2f} ({percent:g}%)")
+
+
+@st.fragment
+def risk_simulation_panel(summary):
+    """Monte Carlo simulation around the planned figures of a quote"""
+    st.markdown("Simulate revenue slippage, maintenance churn and cost overruns to see the range of likely outcomes.")
+    with st.form("risk_simulation"):
+        risk_col1, risk_col2, risk_col3 = st.columns(3)
+        with risk_col1:
+            slippage_mean = st.slider("Expected Revenue Slippage %", 0, 50, int(DEFAULT_RISK["revenue_slippage_mean"] * 100), 1)
+            slippage_sd = st.slider("Revenue Slippage Volatility %", 0, 50, int(DEFAULT_RISK["revenue_slippage_sd"] * 100), 1)
+        with risk_col2:
+            churn_rate = st.slider("Monthly Maintenance Churn %", 0, 50, int(DEFAULT_RISK["monthly_churn_rate"] * 100), 1)
+            n_scenarios = st.select_slider("Scenarios", options=[10_000, 100_000, 1_000_000], value=1_000_000)
+        with risk_col3:
+            overrun_mean = st.slider("Expected Cost Overrun %", -20, 50, int(DEFAULT_RISK["cost_overrun_mean"] * 100), 1)
+            overrun_sd = st.slider("Cost Overrun Volatility %", 0, 50, int(DEFAULT_RISK["cost_overrun_sd"] * 100), 1)
+        run_simulation = st.form_submit_button("Run Simulation")
+
+    if run_simulation:
+        plan = summary.inputs
+        simulation = simulate_quote(
+            plan.upfront_payment, plan.monthly_maintenance, plan.maintenance_months, plan.other_revenue,
+            plan.target_margin,
+            plan.allocations,
+            n_scenarios=n_scenarios,
+            revenue_slippage_mean=slippage_mean / 100,
+            revenue_slippage_sd=slippage_sd / 100,
+            monthly_churn_rate=churn_rate / 100,
+            cost_overrun_mean=overrun_mean / 100,
+            cost_overrun_sd=overrun_sd / 100,
+        )
+
+        with span("cost_calculator.risk_simulation_results"):
+            sim_col1, sim_col2, sim_col3 = st.columns(3)
+            with sim_col1:
+                st.metric("Median Profit", f"{simulation['profit_percentiles'][50]:,.2f}",
+                          delta=f"{simulation['profit_percentiles'][50] - summary.expected_profit:,.2f} vs plan")
+            with sim_col2:
+                st.metric("Mean Profit", f"{simulation['mean_profit']:,.2f}")
+            with sim_col3:
+                st.metric("Probability of Loss", f"{simulation['probability_of_loss'] * 100:.1f}%")
+
+            st.table(pd.DataFrame({
+                "Percentile": [f"P{p}" for p in PERCENTILES],
+                "Profit": [f"{simulation['profit_percentiles'][p]:,.2f}" for p in PERCENTILES],
+                "Margin": [f"{simulation['margin_percentiles'][p]:.1f}%" for p in PERCENTILES],
+            }))
+
+            counts, edges = simulation["profit_histogram"]
+            fig = go.Figure(go.Bar(
+                x=(edges[:-1] + edges[1:]) / 2,
+                y=counts,
+                marker=dict(color=['#e74c3c' if x < 0 else '#2ecc71' for x in edges[:-1]])
+            ))
+            fig.update_layout(
+                title=f"Profit Distribution ({simulation['n_scenarios']:,} scenarios)",
+                height=300,
+                margin=dict(l=20, r=20, t=50, b=20),
+                xaxis=dict(title='Profit'),
+                yaxis=dict(title='Scenarios'),
+                bargap=0
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+
+@st.fragment
+def sensitivity_panel(total_revenue):
+    """What-if grid over every target margin and allocation mix for one deal"""
+    st.markdown("Explore every target margin (0-90%) against every allocation mix for this deal's revenue.")
+    sens_col1, sens_col2, sens_col3 = st.columns(3)
+    with sens_col1:
+        sensitivity_metrics = {
+            "Freelancer Budget": ("budget", 0),
+            "Internal Staff Budget": ("budget", 1),
+            "Tech & Infrastructure Budget": ("budget", 2),
+            "Admin & Misc Budget": ("budget", 3),
+            "Expected Profit": ("expected_profit", None),
+        }
+        sensitivity_metric = st.selectbox("Metric", list(sensitivity_metrics))
+    with sens_col2:
+        mix_step = st.select_slider("Allocation step (%)", options=[5, 10, 20, 25], value=10)
+    with sens_col3:
+        freelancer_range = st.slider("Freelancer % range", 0, 100, (30, 70), mix_step)
+
+    grid = sensitivity_grid(float(total_revenue), mix_step)
+    mixes = grid["mixes"]
+    in_range = (mixes[:, 0] >= freelancer_range[0]) & (mixes[:, 0] <= freelancer_range[1])
+
+    kind, category = sensitivity_metrics[sensitivity_metric]
+    values = grid["budgets"][:, :, category] if kind == "budget" else grid["expected_profit"]
+    mix_labels = [f"{a:.0f}/{b:.0f}/{c:.0f}/{d:.0f}" for a, b, c, d in mixes[in_range]]
+
+    st.caption(f"{len(grid['margins']) * len(mixes):,} combinations evaluated; "
+               f"showing {in_range.sum():,} mixes (Freelancer/Internal/Tech/Admin %).")
+    with span("cost_calculator.sensitivity_heatmap") as rendered:
+        fig = go.Figure(go.Heatmap(
+            z=values[:, in_range].T,
+            x=[f"{m:.0f}%" for m in grid["margins"]],
+            y=mix_labels,
+            colorscale="Viridis",
+            colorbar=dict(title=sensitivity_metric)
+        ))
+        fig.update_layout(
+            title=f"{sensitivity_metric} by Target Margin and Allocation Mix",
+            height=min(900, 200 + 12 * len(mix_labels)),
+            margin=dict(l=20, r=20, t=50, b=20),
+            xaxis=dict(title='Target Margin'),
+            yaxis=dict(title='Allocation Mix', type='category')
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        rendered.rows = len(mix_labels)
+
+    with span("cost_calculator.sensitivity_table") as rendered:
+        table = sensitivity_table(float(total_revenue), mix_step)
+        table = table[(table["freelancer_allocation"] >= freelancer_range[0]) &
+                      (table["freelancer_allocation"] <= freelancer_range[1])]
+        st.dataframe(table, use_container_width=True, hide_index=True)
+        rendered.rows = len(table)
+
+
+@st.fragment
+def saved_projects_tab():
+    """Saved calculations; unaffected by edits to the quote in the first tab"""
+    st.header("Saved Project Calculations")
+
+    # Sorting and filtering run in SQL so only one page of rows is ever loaded
+    sort_options = {
+        "Newest first": ("created_at", True),
+        "Oldest first": ("created_at", False),
+        "Name (A-Z)": ("name", False),
+        "Highest revenue": ("total_revenue", True),
+        "Highest target margin": ("target_margin", True),
+    }
+    filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
+    with filter_col1:
+        name_filter = st.text_input("Filter by name", "")
+    with filter_col2:
+        margin_range = st.slider("Target Margin % range", 0, 90, (0, 90), 5)
+    with filter_col3:
+        min_revenue = st.number_input("Minimum Total Revenue", min_value=0.0, value=0.0, step=1000.0, format="%.2f")
+    with filter_col4:
+        sort_label = st.selectbox("Sort by", list(sort_options))
+
+    sort_by, descending = sort_options[sort_label]
+    list_filters = {
+        "sort_by": sort_by,
+        "descending": descending,
+        "name": name_filter.strip() or None,
+        # Only pass narrowed ranges so the planner keeps using the sort index
+        "min_margin": margin_range[0] if margin_range[0] > 0 else None,
+        "max_margin": margin_range[1] if margin_range[1] < 90 else None,
+        "min_revenue": min_revenue if min_revenue > 0 else None,
+    }
+
+    # Keep a stack of keyset cursors; restart from the first page when filters change
+    if st.session_state.get("project_list_filters") != list_filters:
+        st.session_state["project_list_filters"] = list_filters
+        st.session_state["project_list_cursors"] = [None]
+    cursors = st.session_state["project_list_cursors"]
+
+    page = list_projects(limit=PROJECTS_PAGE_SIZE, cursor=cursors[-1], **list_filters)
+    saved_projects = page["projects"]
+
+    if not saved_projects:
+        if len(cursors) == 1 and list_filters["name"] is None and margin_range == (0, 90) and min_revenue == 0:
+            st.info("No saved calculations found. Use the 'Create New Calculation' tab to save your first calculation.")
+        else:
+            st.info("No saved calculations match these filters.")
+    else:
+        # Compute revenue, budgets, profit and margin for the page in one pass
+        projects_df = compute_portfolio(saved_projects)
+
+        if st.checkbox("Show portfolio totals (all saved projects)"):
+            portfolio = summarize_portfolio(compute_portfolio(get_all_projects()))
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Portfolio Revenue", f"{portfolio['total_revenue']:,.2f}")
+            with col2:
+                st.metric("Portfolio Expenses", f"{portfolio['total_expenses']:,.2f}")
+            with col3:
+                st.metric("Portfolio Profit", f"{portfolio['total_profit']:,.2f}",
+                          delta=f"{portfolio['weighted_margin_pct']:.1f}% margin")
+
+        # Format display table
+        with span("saved_projects.table") as rendered:
+            display_df = projects_df[['id', 'name', 'total_revenue', 'expected_profit', 'target_margin', 'created_at']].copy()
+            display_df.columns = ['ID', 'Project Name', 'Total Revenue', 'Expected Profit', 'Target Margin %', 'Created At']
+
+            # Format numbers
+            display_df['Total Revenue'] = display_df['Total Revenue'].map('{:,.2f}'.format)
+            display_df['Expected Profit'] = display_df['Expected Profit'].map('{:,.2f}'.format)
+            display_df['Target Margin %'] = display_df['Target Margin %'].map('{:.0f}%'.format)
+
+            # Display the table
+            st.dataframe(display_df, use_container_width=True)
+            rendered.rows = len(display_df)
+
+        # Export all saved projects; the file is only built when the button is clicked
+        export_col1, export_col2 = st.columns([1, 3])
+        with export_col1:
+            export_format = st.selectbox("Export format", list(EXPORT_FORMATS), key="project_export_format")
+        with export_col2:
+            st.download_button(
+                "Download All Projects",
+                download_data("projects", export_format),
+                download_file_name("saved_projects", export_format),
+                download_mime(export_format)
+            )
+
+        # Page navigation
+        def _previous_page():
+            st.session_state["project_list_cursors"].pop()
+
+        def _next_page(cursor):
+            st.session_state["project_list_cursors"].append(cursor)
+
+        nav_col1, nav_col2, nav_col3 = st.columns([1, 1, 4])
+        with nav_col1:
+            st.button("◀ Previous", on_click=_previous_page, disabled=len(cursors) == 1)
+        with nav_col2:
+            st.button("Next ▶", on_click=_next_page, args=(page["next_cursor"],),
+                      disabled=page["next_cursor"] is None)
+        with nav_col3:
+            st.caption(f"Page {len(cursors)}")
+
+        # Project selection for actions (view/edit/delete)
+        # Offers the projects of this page until a name or ID is typed
+        selected_project_id = project_picker(
+            "Select a project to view, edit or delete:", key="selected_project",
+            default=[{"id": i, "name": n} for i, n in zip(saved_projects["id"], saved_projects["name"])]
+        )
+
+        if selected_project_id:
+            # Get the selected project
+            project = get_project_by_id(selected_project_id)
+
+            # Display project details and action buttons
+            st.subheader(f"Project: {project.name}")
+
+            # Action buttons
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                load_button = st.button("Load Project")
+            with col2:
+                edit_button = st.button("Edit Project")
+            with col3:
+                delete_button = st.button("Delete Project")
+
+            # Confirmation left by a load/edit click before the full-page rerun
+            notice = st.session_state.pop("saved_projects_notice", None)
+            if notice:
+                st.success(notice)
+
+            if load_button:
+                # Store the project data in session state to load in the other tab;
+                # rerun the whole page (not just this fragment) so the sidebar picks it up
+                st.session_state.load_project = project
+                st.session_state.saved_projects_notice = f"Project '{project.name}' loaded. Switch to 'Create New Calculation' tab to view."
+                st.rerun()
+
+            elif edit_button:
+                # Store the project data in session state for editing
+                st.session_state.edit_project = project
+                st.session_state.saved_projects_notice = f"Switch to 'Create New Calculation' tab to edit project '{project.name}'."
+                st.rerun()
+
+            elif delete_button:
+                # Show confirmation before deleting
+                confirm_delete = st.checkbox("Confirm deletion")
+                if confirm_delete and st.button("Confirm Delete"):
+                    if delete_project(selected_project_id):
+                        st.success(f"Project '{project.name}' has been deleted.")
+                        st.rerun()
+                    else:
+                        st.error("Failed to delete project. Please try again.")
+
+            # Display project details
+            st.subheader("Project Details")
+
+            # Derived figures come from the same calculation core as the live form
+            figures = calculate_project(project)
+            total_revenue = figures.total_revenue
+            freelancer_budget = figures.freelancer_budget
+            internal_staff_budget = figures.internal_staff_budget
+            tech_infra_budget = figures.tech_infra_budget
+            admin_budget = figures.admin_budget
+            total_expenses = figures.total_expenses
+            expected_profit = figures.expected_profit
+            actual_margin_pct = figures.actual_margin_pct
+
+            # Display financial summary
+            with span("saved_projects.project_metrics"):
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Total Revenue", f"{total_revenue:,.2f}")
+                with col2:
+                    st.metric("Total Expenses", f"{total_expenses:,.2f}")
+                with col3:
+                    st.metric("Profit", f"{expected_profit:,.2f}", delta=f"{actual_margin_pct:.1f}% margin")
+
+            # Ledger transactions and freelancers booked to the project
+            with span("saved_projects.actuals"):
+                actuals = get_project_actuals([selected_project_id])
+                actuals = actuals[0] if actuals else None
+                if actuals and (actuals["actual_income"] or actuals["actual_expense"] or actuals["freelancer_count"]):
+                    st.subheader("Booked Actuals")
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Booked Income (VND)", f"{actuals['actual_income']:,.0f}")
+                    with col2:
+                        st.metric("Booked Expenses (VND)", f"{actuals['actual_expense']:,.0f}")
+                    with col3:
+                        st.metric(f"Freelancer Payroll ({actuals['freelancer_count']:,})",
+                                  f"{actuals['freelancer_gross']:,.0f}")
+
+            # Display allocation details
+            st.subheader("Cost Allocations")
+
+            allocation_data = {
+                "Category": ["Freelancer", "Internal Staff", "Tech & Infrastructure", "Admin & Misc"],
+                "Percentage": [
+                    f"{project.freelancer_allocation:.0f}%",
+                    f"{project.internal_staff_allocation:.0f}%", 
+                    f"{project.tech_infra_allocation:.0f}%",
+                    f"{project.admin_allocation:.0f}%"
+                ],
+                "Amount": [
+                    f"{freelancer_budget:,.2f}",
+                    f"{internal_staff_budget:,.2f}",
+                    f"{tech_infra_budget:,.2f}",
+                    f"{admin_budget:,.2f}"
+                ]
+            }
+
+            # Display as a table
+            with span("saved_projects.allocation_table") as rendered:
+                st.table(pd.DataFrame(allocation_data))
+                rendered.rows = len(allocation_data["Category"])
+
+            # Display chart if Plotly is available
+            try:
+                with span("saved_projects.expense_chart"):
+                    # Create a pie chart for expense breakdown
+                    labels = allocation_data["Category"]
+                    values = [
+                        freelancer_budget,
+                        internal_staff_budget,
+                        tech_infra_budget,
+                        admin_budget
+                    ]
+
+                    st.plotly_chart(expense_pie_figure(labels, values, 300), use_container_width=True)
+            except Exception as e:
+                st.warning("Chart could not be displayed")
+
 
 st.title("📊 IT Project Cost Calculator")
-st.caption(f"Current Time: {pd.Timestamp.now(tz='Asia/Ho_Chi_Minh').strftime('%Y-%m-%d %H:%M:%S %Z')}")
+st.caption(f"Current Time: {datetime.now(ZoneInfo('Asia/Ho_Chi_Minh')).strftime('%Y-%m-%d %H:%M:%S %Z')}")
 st.markdown("---")
 
-# Create tabs for better organization
-tab1, tab2 = st.tabs(["Create New Calculation", "View Saved Calculations"])
-
-with tab1:
+@st.fragment
+def quote_tab():
+    """The quote inputs and figures, rerun on their own so editing a quote
+    never reruns the saved-projects tab. Returns the current inputs in the
+    shape save_project() takes."""
     st.markdown("This tool only used for the first 10 deals")
     st.markdown("**Instructions:** Enter your estimated project revenue and costs below. All values should be in your primary operating currency.")
 
@@ -46,10 +459,17 @@ with tab1:
             upfront_payment = st.number_input("Upfront Project Payment", min_value=0.0, value=0.0, step=500.0, format="%.2f")
             monthly_maintenance = st.number_input("Monthly Maintenance Fee", min_value=0.0, value=0.0, step=100.0, format="%.2f")
             num_maintenance_months = st.number_input("Number of Maintenance Months", min_value=0, value=1, step=1)
-            total_maintenance = monthly_maintenance * num_maintenance_months
             other_revenue = st.number_input("Other Project Revenue", min_value=0.0, value=0.0, step=100.0, format="%.2f")
             
-            total_revenue = upfront_payment + total_maintenance + other_revenue
+            # All figures come from the memoized calculation core
+            quote = calculate(QuoteInputs(
+                upfront_payment=upfront_payment,
+                monthly_maintenance=monthly_maintenance,
+                maintenance_months=num_maintenance_months,
+                other_revenue=other_revenue
+            ))
+            total_maintenance = quote.total_maintenance
+            total_revenue = quote.total_revenue
                 
             st.markdown(f"**Total Project Revenue: {total_revenue:,.2f}**")
             if total_maintenance > 0:
@@ -60,8 +480,23 @@ with tab1:
             target_margin = st.slider("Target Profit Margin (%)", min_value=0, max_value=90, value=50, step=5)
             
             # Calculate available budget for costs based on target margin
-            available_budget = total_revenue * (1 - target_margin/100) if total_revenue > 0 else 0
+            quote = calculate(quote.inputs.with_changes(target_margin=target_margin))
+            available_budget = quote.available_budget
             
+            # Inputs as they would be saved; the allocation form fills in its own values
+            project_inputs = {
+                "name": project_name,
+                "upfront_payment": upfront_payment,
+                "monthly_maintenance": monthly_maintenance,
+                "maintenance_months": num_maintenance_months,
+                "other_revenue": other_revenue,
+                "target_margin": target_margin,
+                **dict(zip(
+                    ("freelancer_allocation", "internal_staff_allocation", "tech_infra_allocation", "admin_allocation"),
+                    DEFAULT_ALLOCATIONS
+                ))
+            }
+
             st.markdown(f"**Target Margin: {target_margin}%**")
             st.markdown(f"**Available Budget for Costs: {available_budget:,.2f}**")
             
@@ -91,22 +526,29 @@ with tab1:
                     if total_allocation != 100:
                         st.error(f"⚠️ Total allocation must equal 100% (currently {total_allocation}%)")
                     
-                    # Save calculation to database when save button is clicked
+                    project_inputs.update(
+                        freelancer_allocation=freelancer_allocation,
+                        internal_staff_allocation=internal_staff_allocation,
+                        tech_infra_allocation=tech_infra_allocation,
+                        admin_allocation=admin_allocation
+                    )
+
+                    # Confirmation left by a save before the full-page rerun
+                    notice = st.session_state.pop("quote_notice", None)
+                    if notice:
+                        st.success(notice)
+
+                    # Save calculation to database when save button is clicked; rerun
+                    # the whole page (not just this fragment) so the saved list shows it
                     if save_button and total_allocation == 100:
-                        project_data = {
-                            "name": project_name,
-                            "upfront_payment": upfront_payment,
-                            "monthly_maintenance": monthly_maintenance,
-                            "maintenance_months": num_maintenance_months,
-                            "other_revenue": other_revenue,
-                            "target_margin": target_margin,
-                            "freelancer_allocation": freelancer_allocation,
-                            "internal_staff_allocation": internal_staff_allocation,
-                            "tech_infra_allocation": tech_infra_allocation,
-                            "admin_allocation": admin_allocation
-                        }
-                        project_id = save_project(project_data)
-                        st.success(f"Calculation saved as '{project_name}' (ID: {project_id})")
+                        # Same rules as the API and batch quoting
+                        errors = deal_errors(project_inputs)
+                        for error in errors:
+                            st.error(f"⚠️ {error}")
+                        if not errors:
+                            project_id = save_project(project_inputs)
+                            st.session_state.quote_notice = f"Calculation saved as '{project_name}' (ID: {project_id})"
+                            st.rerun()
         
     # In column 2, display the suggested costs based on allocations
     with col2:
@@ -114,82 +556,43 @@ with tab1:
         
         if total_revenue > 0 and 'allocation_percentages' in st.session_state and total_allocation == 100:
             # Calculate suggested costs based on available budget
-            freelancer_budget = available_budget * (freelancer_allocation / 100)
-            internal_staff_budget = available_budget * (internal_staff_allocation / 100)
-            tech_infra_budget = available_budget * (tech_infra_allocation / 100)
-            admin_budget = available_budget * (admin_allocation / 100)
+            quote = calculate(quote.inputs.with_changes(
+                freelancer_allocation=freelancer_allocation,
+                internal_staff_allocation=internal_staff_allocation,
+                tech_infra_allocation=tech_infra_allocation,
+                admin_allocation=admin_allocation
+            ))
+            freelancer_budget = quote.freelancer_budget
+            internal_staff_budget = quote.internal_staff_budget
+            tech_infra_budget = quote.tech_infra_budget
+            admin_budget = quote.admin_budget
             
             # Store in category expenses for later display
-            category_expenses = {
-                "A. Freelancers": freelancer_budget,
-                "B. Internal Staff": internal_staff_budget,
-                "C. Tech & Infrastructure": tech_infra_budget,
-                "D. Admin & Misc": admin_budget
-            }
-            
-            total_expenses = sum(category_expenses.values())
+            category_expenses = quote.category_expenses
+            total_expenses = quote.total_expenses
             
             # Display detailed cost suggestions by category
             with st.expander("Freelancer Cost Suggestions", expanded=True):
                 st.metric("Total Freelancer Budget", f"{freelancer_budget:,.2f}")
                 
-                # Calculate per-developer allocation
-                st.markdown("#### Suggested Freelancer Payments")
-                dev_count = st.number_input("Number of Freelance Developers", min_value=1, max_value=10, value=2, step=1)
-                
-                if dev_count > 0:
-                    even_split = freelancer_budget / dev_count
-                    st.markdown(f"**Even split per developer: {even_split:,.2f}**")
-                    
-                    # Slider for adjusting allocations between developers
-                    if dev_count > 1:
-                        st.markdown("#### Adjust Developer Payment Split")
-                        remaining = freelancer_budget
-                        dev_allocations = []
-                        
-                        for i in range(1, dev_count):
-                            max_percent = 100 if i == dev_count-1 else 90
-                            percent = st.slider(f"Developer {i} (% of freelancer budget)", 
-                                               min_value=5, max_value=max_percent, 
-                                               value=max(5, int(100/dev_count)), step=5)
-                            amount = freelancer_budget * (percent / 100)
-                            remaining -= amount
-                            dev_allocations.append((f"Developer {i}", amount, percent))
-                        
-                        # Last developer gets remainder
-                        if remaining > 0:
-                            percent = 100 - sum(alloc[2] for alloc in dev_allocations)
-                            dev_allocations.append((f"Developer {dev_count}", remaining, percent))
-                        
-                        for name, amount, percent in dev_allocations:
-                            st.markdown(f"* **{name}**: {amount:,.2f} ({percent}% of freelancer budget)")
+                developer_split_panel(quote)
             
             with st.expander("Internal Staff Allocation"):
                 st.metric("Total Internal Staff Budget", f"{internal_staff_budget:,.2f}")
                 
-                int_dev_percent = st.slider("Internal Developer %", 0, 100, 70, 5)
-                sales_percent = 100 - int_dev_percent
-                
-                int_dev_budget = internal_staff_budget * (int_dev_percent / 100)
-                sales_budget = internal_staff_budget * (sales_percent / 100)
-                
-                st.markdown(f"* **Internal Developer**: {int_dev_budget:,.2f} ({int_dev_percent}%)")
-                st.markdown(f"* **Sales Person**: {sales_budget:,.2f} ({sales_percent}%)")
+                internal_staff_panel(quote)
             
             with st.expander("Technology & Infrastructure"):
                 st.metric("Total Tech & Infrastructure Budget", f"{tech_infra_budget:,.2f}")
                 st.markdown("Suggested breakdown:")
-                st.markdown(f"* **Cloud Hosting**: {tech_infra_budget * 0.4:,.2f} (40%)")
-                st.markdown(f"* **Software Tools**: {tech_infra_budget * 0.3:,.2f} (30%)")
-                st.markdown(f"* **Domain/Google Workspace**: {tech_infra_budget * 0.15:,.2f} (15%)")
-                st.markdown(f"* **Misc Tech Costs**: {tech_infra_budget * 0.15:,.2f} (15%)")
+                for name, amount, percent in quote.tech_infra_breakdown:
+                    st.markdown(f"* **{name}**: {amount:,.2f} ({percent:g}%)")
             
             with st.expander("Administrative & Miscellaneous"):
                 st.metric("Total Admin & Misc Budget", f"{admin_budget:,.2f}")
                 st.markdown("Suggested breakdown:")
-                st.markdown(f"* **Accounting/Legal**: {admin_budget * 0.3:,.2f} (30%)")
-                st.markdown(f"* **Bank Fees**: {admin_budget * 0.2:,.2f} (20%)")
-                st.markdown(f"* **Contingency**: {admin_budget * 0.5:,.2f} (50%)")
+                for name, amount, percent in quote.admin_breakdown:
+                    st.markdown(f"* **{name}**: {amount:,.2f} ({percent:g}%)")
         else:
             if total_revenue <= 0:
                 st.info("Enter project revenue to see suggested cost allocations.")
@@ -223,45 +626,49 @@ with tab1:
             admin_alloc = saved["admin"]
         else:
             # Default allocations
-            freelancer_alloc = 50
-            internal_staff_alloc = 20
-            tech_infra_alloc = 15
-            admin_alloc = 15
+            freelancer_alloc, internal_staff_alloc, tech_infra_alloc, admin_alloc = DEFAULT_ALLOCATIONS
         
-        # Always recalculate with current target margin
-        available_budget = total_revenue * (1 - target_margin/100)
-        
-        # Calculate costs based on current allocations
-        freelancer_budget = available_budget * (freelancer_alloc / 100)
-        internal_staff_budget = available_budget * (internal_staff_alloc / 100)
-        tech_infra_budget = available_budget * (tech_infra_alloc / 100)
-        admin_budget = available_budget * (admin_alloc / 100)
+        # Always recalculate with current target margin and allocations
+        summary = calculate(QuoteInputs(
+            upfront_payment=upfront_payment,
+            monthly_maintenance=monthly_maintenance,
+            maintenance_months=num_maintenance_months,
+            other_revenue=other_revenue,
+            target_margin=target_margin,
+            freelancer_allocation=freelancer_alloc,
+            internal_staff_allocation=internal_staff_alloc,
+            tech_infra_allocation=tech_infra_alloc,
+            admin_allocation=admin_alloc
+        ))
         
         # Update category expenses for display
-        category_expenses = {
-            "A. Freelancers": freelancer_budget,
-            "B. Internal Staff": internal_staff_budget,
-            "C. Tech & Infrastructure": tech_infra_budget,
-            "D. Admin & Misc": admin_budget
-        }
-        
-        total_expenses = sum(category_expenses.values())
+        category_expenses = summary.category_expenses
+        total_expenses = summary.total_expenses
         
         if saved["total"] != 100:
             st.info("Using default cost allocations. Adjust and submit the form for customized allocations.")
         
         # Calculate summary metrics
-        expected_profit = total_revenue - total_expenses
-        actual_margin_pct = (expected_profit / total_revenue * 100) if total_revenue > 0 else 0
-
-        col_sum1, col_sum2, col_sum3 = st.columns(3)
-        with col_sum1:
-            st.metric("Total Project Revenue", f"{total_revenue:,.2f}")
-        with col_sum2:
-            st.metric("Suggested Total Expenses", f"{total_expenses:,.2f}")
-        with col_sum3:
-            st.metric("Expected Profit", f"{expected_profit:,.2f}", 
-                    delta=f"{actual_margin_pct:.1f}% margin" if total_revenue > 0 else "N/A")
+        expected_profit = summary.expected_profit
+        actual_margin_pct = summary.actual_margin_pct
+
+        with span("cost_calculator.summary_metrics"):
+            col_sum1, col_sum2, col_sum3 = st.columns(3)
+            with col_sum1:
+                st.metric("Total Project Revenue", f"{total_revenue:,.2f}")
+            with col_sum2:
+                st.metric("Suggested Total Expenses", f"{total_expenses:,.2f}")
+            with col_sum3:
+                st.metric("Expected Profit", f"{expected_profit:,.2f}", 
+                        delta=f"{actual_margin_pct:.1f}% margin" if total_revenue > 0 else "N/A")
+
+        # Monte Carlo risk simulation around the deterministic figures above
+        with st.expander("🎲 Risk Simulation"):
+            risk_simulation_panel(summary)
+
+        # What-if grid over every target margin and allocation mix, computed in one pass
+        with st.expander("📐 Sensitivity Analysis"):
+            sensitivity_panel(float(total_revenue))
 
         # Display improved cost breakdown visualization
         if total_expenses > 0:
@@ -278,52 +685,10 @@ with tab1:
                 plotly_available = False
                 st.warning("📦 **Plotly is not installed.** For better visualizations, install it with: `pip install plotly`")
             
-            with viz_col1:
+            with viz_col1, span("cost_calculator.deal_composition_chart"):
                 if plotly_available:
-                    # Create a stacked bar chart showing deal composition using Plotly
-                    # Prepare data for stacked visualization
-                    fig = go.Figure()
-                    
-                    # Add profit bar
-                    fig.add_trace(go.Bar(
-                        name='Profit',
-                        y=['Deal Composition'],
-                        x=[expected_profit],
-                        orientation='h',
-                        marker=dict(color='#2ecc71'),
-                        text=f"{actual_margin_pct:.1f}%",
-                        textposition='inside',
-                        insidetextanchor='middle'
-                    ))
-                    
-                    # Add expense categories
-                    categories = list(category_expenses.keys())
-                    colors = ['#3498db', '#9b59b6', '#e74c3c', '#f39c12']
-                    
-                    for i, (category, amount) in enumerate(category_expenses.items()):
-                        percentage = (amount / total_revenue * 100)
-                        fig.add_trace(go.Bar(
-                            name=category,
-                            y=['Deal Composition'],
-                            x=[amount],
-                            orientation='h',
-                            marker=dict(color=colors[i % len(colors)]),
-                            text=f"{percentage:.1f}%" if percentage >= 5 else "",
-                            textposition='inside',
-                            insidetextanchor='middle'
-                        ))
-                    
-                    # Customize layout
-                    fig.update_layout(
-                        title='Deal Size Composition',
-                        barmode='stack',
-                        height=200,
-                        margin=dict(l=50, r=50, t=50, b=20),
-                        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5),
-                        xaxis=dict(title='Amount')
-                    )
-                    
-                    # Show the figure
+                    # Stacked bar showing deal composition, cached on its inputs
+                    fig = deal_composition_figure(expected_profit, actual_margin_pct, category_expenses, total_revenue)
                     st.plotly_chart(fig, use_container_width=True)
                 else:
                     # Fallback to Streamlit's built-in charts
@@ -350,27 +715,13 @@ with tab1:
                 # Add annotations explaining the chart
                 st.markdown("**Deal Composition**: This chart shows how your total project revenue is distributed across cost categories and profit.")
             
-            with viz_col2:
+            with viz_col2, span("cost_calculator.expense_chart"):
                 if plotly_available:
                     # Create a pie chart for expense breakdown (excluding profit)
                     labels = list(category_expenses.keys())
                     values = list(category_expenses.values())
                     
-                    fig = go.Figure(data=[go.Pie(
-                        labels=labels,
-                        values=values,
-                        hole=.3,
-                        textinfo='label+percent',
-                        insidetextorientation='radial'
-                    )])
-                    
-                    fig.update_layout(
-                        title='Expense Distribution',
-                        height=320,
-                        margin=dict(l=20, r=20, t=50, b=20)
-                    )
-                    
-                    st.plotly_chart(fig, use_container_width=True)
+                    st.plotly_chart(expense_pie_figure(labels, values, 320), use_container_width=True)
                 else:
                     # Fallback to Streamlit's built-in charts
                     st.subheader("Expense Distribution")
@@ -388,26 +739,28 @@ with tab1:
             
             # Display Table with percentages (unchanged)
             st.subheader("Detailed Allocation Table")
-            summary_data = []
-            for category, amount in category_expenses.items():
-                percentage = (amount / total_expenses * 100) if total_expenses > 0 else 0
-                revenue_pct = (amount / total_revenue * 100) if total_revenue > 0 else 0
+            with span("cost_calculator.allocation_table") as rendered:
+                summary_data = []
+                for category, amount in category_expenses.items():
+                    percentage = (amount / total_expenses * 100) if total_expenses > 0 else 0
+                    revenue_pct = (amount / total_revenue * 100) if total_revenue > 0 else 0
+                    summary_data.append({
+                        "Category": category, 
+                        "Amount": f"{amount:,.2f}", 
+                        "% of Expenses": f"{percentage:.1f}%",
+                        "% of Revenue": f"{revenue_pct:.1f}%"
+                    })
+            
+                # Add profit row
                 summary_data.append({
-                    "Category": category, 
-                    "Amount": f"{amount:,.2f}", 
-                    "% of Expenses": f"{percentage:.1f}%",
-                    "% of Revenue": f"{revenue_pct:.1f}%"
+                    "Category": "Profit", 
+                    "Amount": f"{expected_profit:,.2f}", 
+                    "% of Expenses": "N/A",
+                    "% of Revenue": f"{actual_margin_pct:.1f}%"
                 })
-            
-            # Add profit row
-            summary_data.append({
-                "Category": "Profit", 
-                "Amount": f"{expected_profit:,.2f}", 
-                "% of Expenses": "N/A",
-                "% of Revenue": f"{actual_margin_pct:.1f}%"
-            })
-
-            st.table(pd.DataFrame(summary_data))
+
+                st.table(pd.DataFrame(summary_data))
+                rendered.rows = len(summary_data)
     else:
         st.info("Enter project revenue to see financial summary.")
 
@@ -415,163 +768,17 @@ with tab1:
     st.markdown("---")
     st.caption("**Note**: After changing the Target Margin, all calculations will update immediately. After adjusting cost allocation sliders, click the 'Calculate Suggested Costs' button to update the results.")
 
+    return project_inputs
+
+# Create tabs for better organization
+tab1, tab2 = st.tabs(["Create New Calculation", "View Saved Calculations"])
+
+with tab1:
+    current_inputs = quote_tab()
+
 # Tab for viewing saved calculations
 with tab2:
-    st.header("Saved Project Calculations")
-    
-    # Fetch all saved projects
-    saved_projects = get_all_projects()
-    
-    if not saved_projects:
-        st.info("No saved calculations found. Use the 'Create New Calculation' tab to save your first calculation.")
-    else:
-        # Create DataFrame for display
-        projects_df = pd.DataFrame(saved_projects)
-        
-        # Calculate and add total revenue column
-        projects_df['total_revenue'] = (
-            projects_df['upfront_payment'] + 
-            (projects_df['monthly_maintenance'] * projects_df['maintenance_months']) +
-            projects_df['other_revenue']
-        )
-        
-        # Format display table
-        display_df = projects_df[['id', 'name', 'total_revenue', 'target_margin', 'created_at']].copy()
-        display_df.columns = ['ID', 'Project Name', 'Total Revenue', 'Target Margin %', 'Created At']
-        
-        # Format numbers
-        display_df['Total Revenue'] = display_df['Total Revenue'].apply(lambda x: f"{x:,.2f}")
-        display_df['Target Margin %'] = display_df['Target Margin %'].apply(lambda x: f"{x:.0f}%")
-        
-        # Display the table
-        st.dataframe(display_df, use_container_width=True)
-        
-        # Project selection for actions (view/edit/delete)
-        selected_project_id = st.selectbox(
-            "Select a project to view, edit or delete:",
-            options=[p['id'] for p in saved_projects],
-            format_func=lambda x: f"ID {x}: {next((p['name'] for p in saved_projects if p['id'] == x), 'Unknown')}"
-        )
-        
-        if selected_project_id:
-            # Get the selected project
-            project = get_project_by_id(selected_project_id)
-            
-            # Display project details and action buttons
-            st.subheader(f"Project: {project['name']}")
-            
-            # Action buttons
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                load_button = st.button("Load Project")
-            with col2:
-                edit_button = st.button("Edit Project")
-            with col3:
-                delete_button = st.button("Delete Project")
-            
-            if load_button:
-                # Store the project data in session state to load in the other tab
-                st.session_state.load_project = project
-                st.success(f"Project '{project['name']}' loaded. Switch to 'Create New Calculation' tab to view.")
-            
-            elif edit_button:
-                # Store the project data in session state for editing
-                st.session_state.edit_project = project
-                st.success(f"Switch to 'Create New Calculation' tab to edit project '{project['name']}'.")
-                
-            elif delete_button:
-                # Show confirmation before deleting
-                confirm_delete = st.checkbox("Confirm deletion")
-                if confirm_delete and st.button("Confirm Delete"):
-                    if delete_project(selected_project_id):
-                        st.success(f"Project '{project['name']}' has been deleted.")
-                        st.experimental_rerun()
-                    else:
-                        st.error("Failed to delete project. Please try again.")
-
-            # Display project details
-            st.subheader("Project Details")
-            
-            # Calculate total revenue
-            total_revenue = (
-                project['upfront_payment'] + 
-                (project['monthly_maintenance'] * project['maintenance_months']) +
-                project['other_revenue']
-            )
-            
-            # Calculate available budget based on target margin
-            available_budget = total_revenue * (1 - project['target_margin']/100) if total_revenue > 0 else 0
-            
-            # Calculate costs based on allocations
-            freelancer_budget = available_budget * (project['freelancer_allocation'] / 100)
-            internal_staff_budget = available_budget * (project['internal_staff_allocation'] / 100)
-            tech_infra_budget = available_budget * (project['tech_infra_allocation'] / 100)
-            admin_budget = available_budget * (project['admin_allocation'] / 100)
-            
-            # Calculate total expenses and profit
-            total_expenses = freelancer_budget + internal_staff_budget + tech_infra_budget + admin_budget
-            expected_profit = total_revenue - total_expenses
-            actual_margin_pct = (expected_profit / total_revenue * 100) if total_revenue > 0 else 0
-            
-            # Display financial summary
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Total Revenue", f"{total_revenue:,.2f}")
-            with col2:
-                st.metric("Total Expenses", f"{total_expenses:,.2f}")
-            with col3:
-                st.metric("Profit", f"{expected_profit:,.2f}", delta=f"{actual_margin_pct:.1f}% margin")
-            
-            # Display allocation details
-            st.subheader("Cost Allocations")
-            
-            allocation_data = {
-                "Category": ["Freelancer", "Internal Staff", "Tech & Infrastructure", "Admin & Misc"],
-                "Percentage": [
-                    f"{project['freelancer_allocation']:.0f}%",
-                    f"{project['internal_staff_allocation']:.0f}%", 
-                    f"{project['tech_infra_allocation']:.0f}%",
-                    f"{project['admin_allocation']:.0f}%"
-                ],
-                "Amount": [
-                    f"{freelancer_budget:,.2f}",
-                    f"{internal_staff_budget:,.2f}",
-                    f"{tech_infra_budget:,.2f}",
-                    f"{admin_budget:,.2f}"
-                ]
-            }
-            
-            # Display as a table
-            st.table(pd.DataFrame(allocation_data))
-            
-            # Display chart if Plotly is available
-            try:
-                # Create a pie chart for expense breakdown
-                labels = allocation_data["Category"]
-                values = [
-                    freelancer_budget,
-                    internal_staff_budget,
-                    tech_infra_budget,
-                    admin_budget
-                ]
-                
-                fig = go.Figure(data=[go.Pie(
-                    labels=labels,
-                    values=values,
-                    hole=.3,
-                    textinfo='label+percent',
-                    insidetextorientation='radial'
-                )])
-                
-                fig.update_layout(
-                    title='Expense Distribution',
-                    height=300,
-                    margin=dict(l=20, r=20, t=50, b=20)
-                )
-                
-                st.plotly_chart(fig, use_container_width=True)
-            except Exception as e:
-                st.warning("Chart could not be displayed")
+    saved_projects_tab()
 
 # Check if a project is loaded from storage and populate fields
 if hasattr(st.session_state, 'load_project') or hasattr(st.session_state, 'edit_project'):
@@ -579,7 +786,7 @@ if hasattr(st.session_state, 'load_project') or hasattr(st.session_state, 'edit_
     project_data = getattr(st.session_state, 'load_project', None) or getattr(st.session_state, 'edit_project', None)
     
     # Switch to the first tab
-    st._set_query_params(**{'selected_tab': 0})
+    st.query_params['selected_tab'] = 0
     
     # Reset the session state to avoid future reloads
     if hasattr(st.session_state, 'load_project'):
@@ -588,27 +795,17 @@ if hasattr(st.session_state, 'load_project') or hasattr(st.session_state, 'edit_
         del st.session_state.edit_project
         
     # Display instructions to the user
-    st.sidebar.success(f"Project '{project_data['name']}' loaded. Adjust values and save as a new project or update the existing one.")
+    st.sidebar.success(f"Project '{project_data.name}' loaded. Adjust values and save as a new project or update the existing one.")
     
     # Create a mechanism to update this project
-    if st.sidebar.button(f"Update Project: {project_data['name']}"):
+    if st.sidebar.button(f"Update Project: {project_data.name}"):
         # Get current values from the UI
-        updated_data = {
-            "name": project_name,
-            "upfront_payment": upfront_payment,
-            "monthly_maintenance": monthly_maintenance,
-            "maintenance_months": num_maintenance_months,
-            "other_revenue": other_revenue,
-            "target_margin": target_margin,
-            "freelancer_allocation": freelancer_allocation,
-            "internal_staff_allocation": internal_staff_allocation,
-            "tech_infra_allocation": tech_infra_allocation,
-            "admin_allocation": admin_allocation
-        }
-        
+        errors = deal_errors(current_inputs)
+        if errors:
+            st.sidebar.error(f"Cannot update the project: {'; '.join(errors)}")
         # Update the project
-        if update_project(project_data['id'], updated_data):
-            st.sidebar.success(f"Project '{project_data['name']}' has been updated.")
-            st.experimental_rerun()
+        elif update_project(project_data.id, current_inputs):
+            st.sidebar.success(f"Project '{project_data.name}' has been updated.")
+            st.rerun()
         else:
             st.sidebar.error("Failed to update project. Please try again.")
\ No newline at end of file
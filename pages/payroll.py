@@ -1,127 +1,64 @@
 import streamlit as st
-import pandas as pd
-import plotly.graph_objects as go
-import sqlite3
+import sys
 import os
 
-# --- App Configuration ---
-st.set_page_config(layout="wide", page_title="IT Payroll Manager", page_icon="💼")
+# Add the parent directory to sys.path to allow relative imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.payroll_db import (
+    ensure_db, add_freelancer, get_all_freelancers, delete_freelancer,
+    update_freelancer, get_freelancer_by_id, get_tax_rules, get_tax_deductions,
+    get_payroll_runs, get_payroll_lines, get_freelancer_payroll_totals, delete_payroll_run
+)
+from utils.payroll_engine import calculate_tax, load_tax_table, run_payroll
+from utils.export import EXPORT_FORMATS, download_data, download_file_name, download_mime
+from utils.metrics import span
+from utils.pickers import freelancer_picker, project_picker
+from utils.lazy import lazy_import
 
-# Database setup
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "payroll.db")
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)    
+# Heavy modules are imported on first use, not on every cold page load
+pd = lazy_import("pandas")
+go = lazy_import("plotly.graph_objects")
 
-def init_db():
-    """Initialize the database with necessary tables"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS freelancers (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        nationality TEXT NOT NULL,
-        gross_payment REAL NOT NULL,
-        tax_rate REAL NOT NULL,
-        tax_amount REAL NOT NULL,
-        net_payment REAL NOT NULL
-    )
-    ''')
-    conn.commit()
-    conn.close()
-
-def add_freelancer(name, nationality, gross_payment, tax_rate, tax_amount, net_payment):
-    """Add a new freelancer to the database"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO freelancers (name, nationality, gross_payment, tax_rate, tax_amount, net_payment) VALUES (?, ?, ?, ?, ?, ?)",
-        (name, nationality, gross_payment, tax_rate, tax_amount, net_payment)
-    )
-    conn.commit()
-    conn.close()
-    
-def get_all_freelancers():
-    """Retrieve all freelancers from the database"""
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM freelancers", conn)
-    conn.close()
-    if not df.empty:
-        # Format tax_rate as percentage string for display
-        df['tax_rate'] = df['tax_rate'].apply(lambda x: f"{int(x*100)}%")
-    return df
-
-def delete_freelancer(freelancer_id):
-    """Delete a freelancer from the database"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM freelancers WHERE id = ?", (freelancer_id,))
-    conn.commit()
-    result = c.rowcount > 0  # Returns True if a row was deleted
-    conn.close()
-    return result
-
-def update_freelancer(freelancer_id, name, nationality, gross_payment, tax_rate, tax_amount, net_payment):
-    """Update an existing freelancer's information"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        """UPDATE freelancers 
-           SET name = ?, nationality = ?, gross_payment = ?, tax_rate = ?, 
-               tax_amount = ?, net_payment = ?
-           WHERE id = ?""",
-        (name, nationality, gross_payment, tax_rate, tax_amount, net_payment, freelancer_id)
-    )
-    conn.commit()
-    result = c.rowcount > 0  # Returns True if a row was updated
-    conn.close()
-    return result
+# --- App Configuration ---
+st.set_page_config(layout="wide", page_title="IT Payroll Manager", page_icon="💼")
 
-def get_freelancer_by_id(freelancer_id):
-    """Get a single freelancer by ID"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT * FROM freelancers WHERE id = ?", (freelancer_id,))
-    row = c.fetchone()
-    conn.close()
-    
-    if row:
-        # Convert to dictionary with column names
-        columns = ['id', 'name', 'nationality', 'gross_payment', 'tax_rate', 'tax_amount', 'net_payment']
-        return dict(zip(columns, row))
-    return None
+# Initialize database (once per process)
+ensure_db()
 
-# Initialize database
-init_db()
+# Residencies with tax rules, in the order they were defined
+tax_table = load_tax_table()
+nationalities = list(tax_table.residencies)
 
 st.title("💼 Freelancer Payroll Manager")
 
 # Create tabs for better organization
-tab1, tab2 = st.tabs(["Add Freelancer", "Manage Freelancers"])
+tab1, tab2, tab3 = st.tabs(["Add Freelancer", "Manage Freelancers", "Payroll Runs"])
 
 # Tab 1: Add Freelancer
 with tab1:
     st.subheader("➕ Add Freelancer")
+    # Outside the form so the project search updates as it is typed
+    project_id = project_picker("Project", key="new_freelancer_project", none_label="No project")
     with st.form("freelancer_form"):
         name = st.text_input("Full Name")
-        nationality = st.selectbox("Nationality", ["Vietnamese", "Foreign"])
+        nationality = st.selectbox("Nationality", nationalities)
         monthly_payment = st.number_input("Payment Amount (VND)", step=100000)
         submit = st.form_submit_button("Add")
 
         if submit:
-            tax_rate = 0.10 if nationality == "Vietnamese" else 0.20
-            tax_amount = monthly_payment * tax_rate
-            net_payment = monthly_payment - tax_amount
+            tax_rate, tax_amount, net_payment = calculate_tax(nationality, monthly_payment, tax_table)
             add_freelancer(
                 name=name,
                 nationality=nationality,
                 gross_payment=monthly_payment,
                 tax_rate=tax_rate,
                 tax_amount=tax_amount,
-                net_payment=net_payment
+                net_payment=net_payment,
+                project_id=project_id
             )
             st.success(f"Freelancer {name} added.")
             # Force a rerun to update the data display
-            st.experimental_rerun()
+            st.rerun()
 
 # Tab 2: Manage Freelancers
 with tab2:
@@ -142,20 +79,21 @@ with tab2:
             st.write("Select freelancers to manage:")
         with col2:
             if st.button("Refresh Data"):
-                st.experimental_rerun()
+                st.rerun()
+            # Recompute every freelancer's tax with the current rules in one pass
+            if st.button("Run Payroll"):
+                run = run_payroll(tax_table=tax_table)
+                st.success(f"Payroll recalculated for {run['freelancers']:,} freelancers: "
+                           f"{run['total_tax']:,.0f} VND tax, {run['total_net']:,.0f} VND net.")
+                freelancers_df = get_all_freelancers()
         
         # Display the dataframe
-        st.dataframe(freelancers_df)
+        with span("payroll.freelancers_table") as rendered:
+            st.dataframe(freelancers_df)
+            rendered.rows = len(freelancers_df)
         
         # Create selection for editing or deleting
-        freelancer_options = freelancers_df[['id', 'name']].copy()
-        freelancer_options['display'] = freelancer_options['id'].astype(str) + ' - ' + freelancer_options['name']
-        
-        selected_id = st.selectbox(
-            "Select freelancer to edit or delete:",
-            options=freelancer_options['id'].tolist(),
-            format_func=lambda x: freelancer_options[freelancer_options['id'] == x]['display'].iloc[0]
-        )
+        selected_id = freelancer_picker("Select freelancer to edit or delete:", key="selected_freelancer")
         
         # Get the selected freelancer's data
         if selected_id:
@@ -166,22 +104,22 @@ with tab2:
                 with col1:
                     st.subheader("Edit Freelancer")
                     with st.form(key="edit_form"):
-                        edit_name = st.text_input("Name", value=freelancer['name'])
+                        edit_name = st.text_input("Name", value=freelancer.name)
                         edit_nationality = st.selectbox(
                             "Nationality", 
-                            ["Vietnamese", "Foreign"],
-                            index=0 if freelancer['nationality'] == "Vietnamese" else 1
+                            nationalities,
+                            index=nationalities.index(freelancer.nationality) if freelancer.nationality in nationalities else 0
                         )
                         edit_payment = st.number_input(
                             "Gross Payment (VND)", 
-                            value=float(freelancer['gross_payment']),
+                            value=float(freelancer.gross_payment),
                             step=100000.0
                         )
                         
                         # Recalculate tax when payment or nationality changes
-                        edit_tax_rate = 0.10 if edit_nationality == "Vietnamese" else 0.20
-                        edit_tax_amount = edit_payment * edit_tax_rate
-                        edit_net_payment = edit_payment - edit_tax_amount
+                        edit_tax_rate, edit_tax_amount, edit_net_payment = calculate_tax(
+                            edit_nationality, edit_payment, tax_table
+                        )
                         
                         st.write(f"Tax Rate: {int(edit_tax_rate * 100)}%")
                         st.write(f"Tax Amount: {edit_tax_amount:,.0f} VND")
@@ -200,41 +138,135 @@ with tab2:
                                 edit_net_payment
                             ):
                                 st.success(f"Updated {edit_name}'s information.")
-                                st.experimental_rerun()
+                                st.rerun()
                             else:
                                 st.error("Failed to update. Please try again.")
                 
                 with col2:
                     st.subheader("Delete Freelancer")
-                    st.write(f"Selected: **{freelancer['name']}**")
-                    st.write(f"Gross Payment: {freelancer['gross_payment']:,.0f} VND")
-                    st.write(f"Tax Rate: {int(freelancer['tax_rate'] * 100)}%")
+                    st.write(f"Selected: **{freelancer.name}**")
+                    st.write(f"Gross Payment: {freelancer.gross_payment:,.0f} VND")
+                    st.write(f"Tax Rate: {int(freelancer.tax_rate * 100)}%")
                     
                     # Confirm deletion
                     if st.button("🗑️ Delete this freelancer", key=f"delete_{selected_id}"):
                         confirm = st.checkbox("Confirm deletion")
                         if confirm:
                             if delete_freelancer(selected_id):
-                                st.success(f"Freelancer {freelancer['name']} has been deleted.")
-                                st.experimental_rerun()
+                                st.success(f"Freelancer {freelancer.name} has been deleted.")
+                                st.rerun()
                             else:
                                 st.error("Failed to delete. Please try again.")
         
         # Export options
         st.subheader("Export Options")
-        csv = freelancers_df.to_csv(index=False).encode('utf-8')
-        st.download_button("Download CSV Report", csv, "freelancer_payroll.csv", "text/csv")
+        export_format = st.selectbox("Export format", list(EXPORT_FORMATS), key="freelancer_export_format")
+        st.download_button(
+            "Download Report",
+            download_data("freelancers", export_format),
+            download_file_name("freelancer_payroll", export_format),
+            download_mime(export_format)
+        )
     else:
         st.info("No freelancers added yet.")
 
+# Tab 3: Monthly payroll runs
+with tab3:
+    st.subheader("🗓️ Monthly Payroll Runs")
+    
+    # Snapshot the current roster, recalculated with the current tax rules
+    with st.form("payroll_run_form"):
+        run_col1, run_col2 = st.columns(2)
+        with run_col1:
+            run_date = st.date_input("Payroll month", help="Any day in the month to pay")
+        with run_col2:
+            replace_run = st.checkbox("Replace an existing run for this month")
+        create_run = st.form_submit_button("Create Payroll Run")
+    
+    if create_run:
+        period = run_date.strftime("%Y-%m")
+        try:
+            run = run_payroll(tax_table=tax_table, period=period, replace=replace_run)
+            st.success(f"Payroll run for {period} created with {run['freelancers']:,} freelancers "
+                       f"({run['total_net']:,.0f} VND net).")
+        except ValueError as e:
+            st.error(str(e))
+    
+    runs = get_payroll_runs()
+    if runs:
+        runs_df = pd.DataFrame(runs)
+        
+        # Per-period totals are stored on each run, so this never scans the lines
+        with span("payroll.runs_chart") as rendered:
+            fig = go.Figure()
+            for column, label, color in [("total_net", "Net", "#2ecc71"), ("total_tax", "Tax", "#e74c3c")]:
+                fig.add_trace(go.Bar(name=label, x=runs_df["period"], y=runs_df[column], marker=dict(color=color)))
+            fig.update_layout(
+                title="Monthly Payroll",
+                barmode="stack",
+                height=300,
+                margin=dict(l=20, r=20, t=50, b=20),
+                xaxis=dict(title="Period", type="category"),
+                yaxis=dict(title="VND")
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            rendered.rows = len(runs_df)
+        
+        with span("payroll.runs_table") as rendered:
+            display_runs = runs_df[["period", "freelancer_count", "total_gross", "total_tax", "total_net", "created_at"]].copy()
+            display_runs.columns = ["Period", "Freelancers", "Gross (VND)", "Tax (VND)", "Net (VND)", "Created At"]
+            for column in ["Gross (VND)", "Tax (VND)", "Net (VND)"]:
+                display_runs[column] = display_runs[column].map("{:,.0f}".format)
+            st.dataframe(display_runs, use_container_width=True, hide_index=True)
+            rendered.rows = len(display_runs)
+        
+        # Per-freelancer totals over a range of periods
+        st.subheader("Totals by Freelancer")
+        periods = runs_df["period"].tolist()
+        if len(periods) > 1:
+            start_period, end_period = st.select_slider("Periods", options=periods, value=(periods[0], periods[-1]))
+        else:
+            start_period = end_period = periods[0]
+        totals_df = get_freelancer_payroll_totals(start_period, end_period)
+        with span("payroll.freelancer_totals_table") as rendered:
+            st.dataframe(totals_df, use_container_width=True, hide_index=True)
+            rendered.rows = len(totals_df)
+        
+        # Lines of a single run
+        st.subheader("Run Details")
+        run_ids = {run["id"]: run["period"] for run in runs}
+        selected_run = st.selectbox("Select a payroll run:", options=list(run_ids)[::-1], format_func=run_ids.get)
+        run_lines = get_payroll_lines(selected_run)
+        with span("payroll.run_lines_table") as rendered:
+            st.dataframe(run_lines, use_container_width=True, hide_index=True)
+            rendered.rows = len(run_lines)
+        if st.button("🗑️ Delete this payroll run"):
+            if delete_payroll_run(selected_run):
+                st.success(f"Payroll run for {run_ids[selected_run]} has been deleted.")
+                st.rerun()
+            else:
+                st.error("Failed to delete. Please try again.")
+    else:
+        st.info("No payroll runs yet. Create one to start tracking monthly totals.")
+
 # Add helpful information
 with st.expander("💡 Understanding Payroll Tax Rates"):
-    st.markdown("""
-    ### Tax Rate Information
-    
-    - **Vietnamese Freelancers**: 10% Personal Income Tax (PIT)
-    - **Foreign Freelancers**: 20% Personal Income Tax (PIT)
+    # Describe the rules currently in the tax_rules and tax_deductions tables
+    rule_lines = []
+    for residency in nationalities:
+        brackets = [r for r in get_tax_rules() if r['residency'] == residency]
+        if len(brackets) == 1 and brackets[0]['min_income'] == 0:
+            rates = f"{brackets[0]['rate'] * 100:g}%"
+        else:
+            rates = ", ".join(f"{r['rate'] * 100:g}% from {r['min_income']:,.0f} VND" for r in brackets)
+        line = f"- **{residency} Freelancers**: {rates} Personal Income Tax (PIT)"
+        deductions = [d for d in get_tax_deductions() if d['residency'] == residency]
+        if deductions:
+            line += " after " + ", ".join(f"{d['description']} ({d['amount']:,.0f} VND)" for d in deductions)
+        rule_lines.append(line)
     
+    st.markdown("### Tax Rate Information\n\n" + "\n".join(rule_lines))
+    st.markdown("""
     These are simplified rates for demonstration purposes. Actual tax rates may vary based on:
     - Income thresholds
     - Tax residency status
@@ -0,0 +1,116 @@
+import streamlit as st
+import sys
+import os
+
+# Add the parent directory to sys.path to allow relative imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.cache import cache_stats
+from utils.metrics import WINDOW_SIZE, prometheus_text, reset_metrics, snapshot, write_prometheus
+from utils.lazy import lazy_import
+
+# Heavy modules are imported on first use, not on every cold page load
+pd = lazy_import("pandas")
+go = lazy_import("plotly.graph_objects")
+
+# --- App Configuration ---
+st.set_page_config(layout="wide", page_title="Performance", page_icon="⏱️")
+
+# Default target of the Prometheus export (e.g. a node_exporter textfile directory)
+DEFAULT_PROMETHEUS_FILE = os.environ.get(
+    "METRICS_PROMETHEUS_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "metrics.prom")
+)
+
+# Number of slowest metrics shown in the chart
+CHART_TOP_N = 15
+
+# Labels of the span kinds recorded by utils.metrics
+KIND_LABELS = {"db": "Database calls", "render": "Render blocks", "http": "API requests"}
+
+st.title("⏱️ Performance")
+st.caption(
+    f"Latency of database calls, page render blocks and API requests in this server process, "
+    f"over the last {WINDOW_SIZE:,} calls of each. Use the other pages, then refresh."
+)
+
+# Every kind of span recorded so far, the known ones first
+recorded = snapshot()
+kind_options = list(KIND_LABELS) + sorted({s["kind"] for s in recorded} - set(KIND_LABELS))
+
+col1, col2, col3 = st.columns([2, 1, 1])
+with col1:
+    kinds = st.multiselect("Show", kind_options, default=kind_options,
+                           format_func=lambda kind: KIND_LABELS.get(kind, kind))
+with col2:
+    if st.button("Refresh"):
+        st.rerun()
+with col3:
+    if st.button("Reset metrics"):
+        reset_metrics()
+        st.rerun()
+
+stats = [s for s in recorded if s["kind"] in kinds]
+if not stats:
+    st.info("No calls recorded yet. Open the Cost Calculator or Payroll pages to collect timings.")
+else:
+    metrics_df = pd.DataFrame(stats)
+
+    # Slowest calls by p95
+    top = metrics_df.sort_values("p95_ms", ascending=False).head(CHART_TOP_N).iloc[::-1]
+    fig = go.Figure()
+    for column, label, color in [("p50_ms", "p50", "#2ecc71"), ("p95_ms", "p95", "#f39c12"), ("p99_ms", "p99", "#e74c3c")]:
+        fig.add_trace(go.Bar(name=label, y=top["name"], x=top[column], orientation="h", marker=dict(color=color)))
+    fig.update_layout(
+        title=f"Slowest {len(top)} by p95",
+        barmode="group",
+        height=max(300, 60 + 45 * len(top)),
+        margin=dict(l=20, r=20, t=50, b=20),
+        xaxis=dict(title="Milliseconds"),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    display_df = metrics_df[[
+        "name", "kind", "count", "errors", "p50_ms", "p95_ms", "p99_ms", "max_ms",
+        "rows_p50", "rows_max", "total_rows", "total_seconds"
+    ]].copy()
+    display_df.columns = [
+        "Name", "Kind", "Calls", "Errors", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)",
+        "Rows p50", "Rows max", "Rows total", "Total (s)"
+    ]
+    st.dataframe(
+        display_df.sort_values("Total (s)", ascending=False),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            column: st.column_config.NumberColumn(format="%.2f")
+            for column in ["p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)", "Total (s)"]
+        }
+    )
+
+# Query result caches behind the read helpers, and the chart figure caches
+with st.expander("Query and figure caches"):
+    caches_df = pd.DataFrame(cache_stats())
+    if caches_df.empty:
+        st.write("No caches registered.")
+    else:
+        caches_df["hit_rate"] = caches_df["hit_rate"].map("{:.1%}".format)
+        st.dataframe(caches_df, use_container_width=True, hide_index=True)
+
+# Prometheus text-format export
+with st.expander("Prometheus export"):
+    st.markdown(
+        "Latencies are exported as a `summary` (p50/p95/p99 over the rolling window), "
+        "rows and errors as counters. Write the file into a node_exporter textfile "
+        "directory, or download it."
+    )
+    export_path = st.text_input("Export file", DEFAULT_PROMETHEUS_FILE)
+    export_col1, export_col2 = st.columns(2)
+    with export_col1:
+        if st.button("Write file"):
+            try:
+                st.success(f"Wrote {write_prometheus(export_path)}")
+            except OSError as e:
+                st.error(f"Could not write {export_path}: {e}")
+    with export_col2:
+        st.download_button("Download metrics.prom", prometheus_text, "metrics.prom", "text/plain")
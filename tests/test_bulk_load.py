@@ -0,0 +1,75 @@
+"""db_utils.bulk_load(): one transaction, and the ledger's triggers and indexes survive it"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks import datagen
+from utils import db_utils
+from utils.storage import connect
+
+ROWS = [
+    ("2024-01-05", "Income", 100.0, "VND", 100.0, "Cloud hosting fee", "Sales", "REF-1", 1.0),
+    ("2024-01-06", "Expense", 40.0, "VND", 40.0, "Office rent", "Rent", "REF-2", 1.0),
+]
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    with datagen.data_dir(tmp_path):
+        db_utils.init_db()
+        db_utils.save_transactions(ROWS[:1])
+        yield
+
+
+def _schema_objects():
+    with connect(db_utils.DB_PATH) as conn:
+        return {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE name LIKE 'idx_transactions_%' OR name LIKE 'trg_transactions_%'"
+        )}
+
+
+def test_failed_load_rolls_back_rows_indexes_and_triggers(ledger):
+    before = _schema_objects()
+    with pytest.raises(RuntimeError):
+        with db_utils.bulk_load():
+            db_utils.save_transactions(ROWS[1:])
+            raise RuntimeError("load failed")
+
+    assert _schema_objects() == before
+    with connect(db_utils.DB_PATH) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 1
+    assert db_utils.verify_monthly_rollups() == []
+
+
+def _search_index_ok():
+    # rank = 1 also compares the index with the transactions it was built from
+    with connect(db_utils.DB_PATH) as conn:
+        conn.execute("INSERT INTO transactions_fts (transactions_fts, rank) VALUES ('integrity-check', 1)")
+    return True
+
+
+def _set_description(transaction_id, description):
+    with connect(db_utils.DB_PATH) as conn:
+        conn.execute("UPDATE transactions SET description = ? WHERE id = ?", (description, transaction_id))
+
+
+def test_rows_changed_during_and_after_a_load_keep_the_search_index_intact(ledger):
+    with db_utils.bulk_load():
+        db_utils.save_transactions(ROWS[1:] * 3)
+        # A loaded row, not indexed yet, and one indexed before the load
+        _set_description(2, "Office rent, March")
+        _set_description(1, "Cloud hosting, renewed")
+        with connect(db_utils.DB_PATH) as conn:
+            conn.execute("DELETE FROM transactions WHERE id = 3")
+    assert _search_index_ok()
+
+    _set_description(2, "Office rent, April")
+    with connect(db_utils.DB_PATH) as conn:
+        conn.execute("DELETE FROM transactions WHERE id = 4")
+    assert _search_index_ok()
+
+    hits = {row["id"] for row in db_utils.search_transactions("rent")["transactions"]}
+    assert hits == {2}
+    assert [row["id"] for row in db_utils.search_transactions("renewed")["transactions"]] == [1]
@@ -0,0 +1,36 @@
+"""Cached query results are shared between sessions; callers must not be able to change them"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks import datagen
+from utils import payroll_db, project_db
+from utils.cache import clear_caches
+
+
+@pytest.fixture
+def database(tmp_path):
+    with datagen.data_dir(tmp_path):
+        project_db.init_db()
+        payroll_db.init_db()
+        clear_caches()
+        yield
+    clear_caches()
+
+
+def test_modifying_a_cached_result_does_not_change_the_next_one(database):
+    rules = payroll_db.get_tax_rules()
+    rules[0]["rate"] = 0.99
+    rules.clear()
+    assert payroll_db.get_tax_rules() and payroll_db.get_tax_rules()[0]["rate"] != 0.99
+
+    page = project_db.list_projects()
+    page["next_cursor"] = (0, 0)
+    assert project_db.list_projects()["next_cursor"] is None
+
+    freelancers = payroll_db.get_all_freelancers()
+    freelancers["name"] = "changed"
+    assert payroll_db.get_all_freelancers() is not freelancers
+    assert payroll_db.get_tax_rules.cache.stats()["hits"] >= 2
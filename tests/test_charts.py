@@ -0,0 +1,34 @@
+"""Cached chart figures must reach the browser exactly like the figures they replace"""
+import os
+import sys
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import charts
+
+CHARTS = [
+    (charts.deal_composition_figure, (30_000.0, 50.0, {"Freelancers": 15_000.0, "Admin": 15_000.0}, 60_000.0)),
+    (charts.expense_pie_figure, (["Freelancers", "Admin"], [15_000.0, 15_000.0], 300)),
+]
+
+
+def _render(func, args, cached):
+    """The spec st.plotly_chart sends for the figure built by `func`"""
+    def script(func, args, cached):
+        import streamlit as st
+
+        st.plotly_chart(func(*args) if cached else func.__wrapped__(*args))
+
+    at = AppTest.from_function(script, kwargs={"func": func, "args": args, "cached": cached})
+    at.run()
+    assert not at.exception
+    return at.get("plotly_chart")[0].proto.spec
+
+
+@pytest.mark.parametrize("func, args", CHARTS)
+def test_cached_figure_renders_the_same_spec(func, args):
+    built = _render(func, args, cached=False)
+    func(*args)  # fill the cache
+    assert _render(func, args, cached=True) == built
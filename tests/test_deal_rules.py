@@ -0,0 +1,60 @@
+"""The page, the HTTP API and batch quoting hold deals to the same rules"""
+import asyncio
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import api
+from utils.ingest import RowError
+from utils.profitability import deal_errors
+from utils.quotes import quote_chunk
+
+VALID = {"upfront_payment": 20_000, "monthly_maintenance": 800, "maintenance_months": 12}
+INVALID = [
+    ({"upfront_payment": -1}, "upfront_payment must be at least 0"),
+    ({"maintenance_months": 1.5}, "maintenance_months must be a whole number"),
+    ({"target_margin": 95}, "target_margin must be between 0 and 90"),
+    ({"freelancer_allocation": 60}, "The allocations must add up to 100%"),
+    ({"freelancer_allocation": 110, "internal_staff_allocation": -40}, "freelancer_allocation must be between 0 and 100"),
+]
+
+
+@pytest.mark.parametrize("change, message", INVALID)
+def test_invalid_deals_are_rejected_everywhere(change, message):
+    deal = {**VALID, **change}
+    assert message in deal_errors(deal)
+
+    with pytest.raises(api.ApiError, match=message):
+        api._project_data({"name": "Deal", **deal})
+    with pytest.raises(api.ApiError, match=message):
+        api.deal_columns([VALID, deal])
+    with pytest.raises(api.ApiError, match=message):
+        api.deal_columns({name: [VALID.get(name, default), deal.get(name, default)]
+                          for name, default in zip(api.DEAL_FIELDS, api.DEAL_DEFAULTS)})
+
+    async def quote():
+        return await api.QuoteBatcher().submit(api.deal_values(deal))
+    with pytest.raises(api.ApiError, match=message):
+        asyncio.run(quote())
+
+    deals = pd.DataFrame([{"name": "Valid", **VALID}, {"name": "Invalid", **deal}])
+    with pytest.raises(RowError, match=message):
+        quote_chunk(deals, require_name=True)
+    quotes, skipped = quote_chunk(deals, skip_invalid=True, require_name=True)
+    assert skipped == 1 and quotes["name"].tolist() == ["Valid"]
+
+
+def test_valid_deals_pass():
+    assert deal_errors(VALID) == []
+    assert api._project_data({"name": "Deal", **VALID})["maintenance_months"] == 12
+    _, count = api.deal_columns([VALID, VALID])
+    assert count == 2
+
+
+@pytest.mark.parametrize("values", [[True, 2], [2.5, False]])
+def test_booleans_in_columns_are_rejected(values):
+    with pytest.raises(api.ApiError, match="upfront_payment must be a finite number"):
+        api.deal_columns({"upfront_payment": values})
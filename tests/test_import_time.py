@@ -0,0 +1,20 @@
+"""Heavy modules Home.py and the pages must leave unloaded on a cold start.
+
+Only the import checks run here; the millisecond budgets depend on the
+machine and are checked by `python -m benchmarks.import_time`.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.import_time import BUDGETS, measure
+
+
+@pytest.mark.parametrize("page", [page for page, (_, unloaded) in BUDGETS.items() if unloaded])
+def test_cold_start_leaves_heavy_modules_unloaded(page):
+    _, must_stay_unloaded = BUDGETS[page]
+    _, loaded = measure(page, 1)
+    eager = [module for module in must_stay_unloaded if module in loaded]
+    assert not eager, f"{page} imported {', '.join(eager)} on a cold start"
@@ -0,0 +1,530 @@
+"""Local HTTP API for pricing deals and managing saved projects.
+
+A small asyncio HTTP/1.1 server (standard library only, with keep-alive)
+that exposes the profitability calculation and the project_db CRUD as JSON
+endpoints. Usage:
+
+    python -m utils.api --port 8080
+
+Endpoints:
+
+    GET    /health
+    POST   /quote               one deal -> its figures
+    POST   /quotes              {"deals": [...]} -> figures for every deal
+    GET    /projects            ?limit=&cursor=&sort_by=&descending=&name=
+                                &min_margin=&max_margin=&min_revenue=&max_revenue=
+    POST   /projects
+    GET    /projects/<id>
+    PUT    /projects/<id>
+    DELETE /projects/<id>
+    GET    /metrics             latency histograms in Prometheus text format
+
+A deal is an object with the DEAL_FIELDS of a project; missing fields take
+the calculator's defaults and other keys are ignored. Deals are held to the
+Cost Calculator's rules (profitability.deal_problems()): no negative
+revenue or months, whole months, a margin of 0-90% and allocations that
+add up to 100%. The batch endpoint also accepts the deals column by column
+({"deals": {"upfront_payment": [...], ...}}) and answers in the same shape.
+Either way the whole batch is evaluated in one vectorized compute_arrays()
+call, and single quotes that arrive together on different connections are
+coalesced the same way.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import sys
+import traceback
+from dataclasses import dataclass
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import project_db
+from utils.lazy import lazy_import
+from utils.metrics import prometheus_text, span
+from utils.profitability import (
+    DERIVED_COLUMNS, INPUT_COLUMNS, INPUT_DEFAULTS, compute_arrays, deal_errors, deal_problems
+)
+from utils.records import PROJECT_COLUMNS
+
+np = lazy_import("numpy")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# Project fields a quote depends on, and their defaults in the calculator
+DEAL_FIELDS = tuple(INPUT_COLUMNS)
+DEAL_DEFAULTS = tuple(INPUT_DEFAULTS[name] for name in DEAL_FIELDS)
+
+MAX_BODY_BYTES = 32 * 1024 * 1024
+MAX_HEADERS = 100
+MAX_BATCH_DEALS = 100_000
+# Single quotes evaluated together at most; a full batch is evaluated at once
+MAX_COALESCED_QUOTES = 4096
+MAX_PAGE_SIZE = 500
+# Seconds an idle keep-alive connection is kept open
+KEEP_ALIVE_TIMEOUT = 30
+
+
+class ApiError(Exception):
+    """Raised by a handler to answer with an error status and message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = HTTPStatus(status)
+        self.message = message
+
+
+@dataclass(frozen=True, slots=True)
+class Request:
+    """A parsed HTTP request"""
+    method: str
+    path: str
+    query: dict
+    headers: dict
+    body: bytes
+    keep_alive: bool
+
+    def json(self):
+        """The body decoded as JSON"""
+        try:
+            return json.loads(self.body)
+        except ValueError as e:
+            raise ApiError(400, f"Invalid JSON body: {e}") from None
+
+    def param(self, name, convert=str, default=None):
+        """A query string parameter converted with `convert`, or `default`"""
+        values = self.query.get(name)
+        if not values:
+            return default
+        try:
+            return convert(values[-1])
+        except ValueError:
+            raise ApiError(400, f"Invalid value for {name!r}: {values[-1]!r}") from None
+
+
+def _finite(value, name):
+    """Check that a JSON value is a finite number and return it as a float"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ApiError(400, f"{name} must be a finite number")
+    return float(value)
+
+
+def deal_values(deal):
+    """The DEAL_FIELDS of one deal object as a tuple of floats"""
+    if not isinstance(deal, dict):
+        raise ApiError(400, "A deal must be a JSON object")
+    return tuple(
+        _finite(deal[name], name) if name in deal else default
+        for name, default in zip(DEAL_FIELDS, DEAL_DEFAULTS)
+    )
+
+
+def deal_columns(deals):
+    """Validate a batch of deals and return (columns, count).
+
+    `deals` is a list of deal objects or a dict of field -> list of values;
+    the columns are float64 arrays keyed by DEAL_FIELDS.
+    """
+    if isinstance(deals, dict):
+        lengths = {len(values) for values in deals.values() if isinstance(values, list)}
+        if len(lengths) > 1:
+            raise ApiError(400, "Every column of deals must have the same length")
+        count = lengths.pop() if lengths else 0
+        raw = {name: deals.get(name) for name in DEAL_FIELDS}
+    elif isinstance(deals, list):
+        if not all(isinstance(deal, dict) for deal in deals):
+            raise ApiError(400, "Every deal must be a JSON object")
+        count = len(deals)
+        raw = {name: [deal.get(name, default) for deal in deals] for name, default in zip(DEAL_FIELDS, DEAL_DEFAULTS)}
+    else:
+        raise ApiError(400, "deals must be a list of deals or an object of columns")
+    if count > MAX_BATCH_DEALS:
+        raise ApiError(413, f"At most {MAX_BATCH_DEALS:,} deals per request")
+
+    columns = {}
+    for name, default in zip(DEAL_FIELDS, DEAL_DEFAULTS):
+        values = raw[name]
+        if values is None:
+            columns[name] = np.full(count, default)
+            continue
+        if not isinstance(values, list) or len(values) != count:
+            raise ApiError(400, f"Column {name} must be a list of {count} numbers")
+        # NumPy turns booleans mixed with numbers into numbers
+        if any(value is True or value is False for value in values):
+            raise ApiError(400, f"{name} must be a finite number in every deal")
+        try:
+            column = np.array(values)
+        except ValueError:
+            # Ragged nested lists
+            raise ApiError(400, f"{name} must be a finite number in every deal") from None
+        # Strings, nulls and booleans give a non-numeric dtype, nested lists extra dimensions
+        if column.ndim != 1 or count and column.dtype.kind not in "iuf":
+            raise ApiError(400, f"{name} must be a finite number in every deal")
+        column = column.astype(np.float64, copy=False)
+        if not np.isfinite(column).all():
+            raise ApiError(400, f"{name} must be a finite number in every deal")
+        columns[name] = column
+    _check_deals(columns, count)
+    return columns, count
+
+
+def _check_deals(columns, count):
+    """Reject a batch with a deal that breaks the calculator's rules (deal_problems())"""
+    problems = deal_problems(columns)
+    invalid = np.zeros(count, dtype=bool)
+    for mask, _ in problems:
+        invalid |= mask
+    if invalid.any():
+        row = int(np.flatnonzero(invalid)[0])
+        message = next(message for mask, message in problems if mask[row])
+        raise ApiError(400, f"Deal {row}: {message}")
+
+
+def quote_rows(figures):
+    """Turn compute_arrays() output into one dict of figures per deal"""
+    values = [figures[name].tolist() for name in DERIVED_COLUMNS]
+    return [dict(zip(DERIVED_COLUMNS, row)) for row in zip(*values)]
+
+
+def quote_batch(body):
+    """Evaluate the deals of a /quotes request body; run off the event loop"""
+    try:
+        payload = json.loads(body)
+    except ValueError as e:
+        raise ApiError(400, f"Invalid JSON body: {e}") from None
+    if not isinstance(payload, dict) or "deals" not in payload:
+        raise ApiError(400, 'Expected an object with a "deals" key')
+    columns, count = deal_columns(payload["deals"])
+    figures = compute_arrays(columns)
+    if isinstance(payload["deals"], dict):
+        quotes = {name: figures[name].tolist() for name in DERIVED_COLUMNS}
+    else:
+        quotes = quote_rows(figures)
+    return {"count": count, "quotes": quotes}
+
+
+class QuoteBatcher:
+    """Coalesce single quotes into vectorized evaluations.
+
+    Quotes submitted during one pass of the event loop are evaluated
+    together by one compute_arrays() call scheduled right after it, so a
+    burst of concurrent requests costs a handful of NumPy calls instead of
+    one per deal.
+    """
+
+    def __init__(self, max_size=MAX_COALESCED_QUOTES):
+        self.max_size = max_size
+        self.batches = 0
+        self.quotes = 0
+        self._pending = []
+        self._scheduled = False
+
+    def submit(self, values):
+        """Queue one deal (a deal_values() tuple); returns a future of its figures.
+
+        A deal that breaks the calculator's rules fails the future with ApiError.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((values, future))
+        if len(self._pending) >= self.max_size:
+            self.flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(self.flush)
+        return future
+
+    def flush(self):
+        """Evaluate every queued deal now"""
+        self._scheduled = False
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            matrix = np.array([values for values, _ in pending], dtype=np.float64)
+            columns = dict(zip(DEAL_FIELDS, matrix.T))
+            problems = deal_problems(columns)
+            invalid = np.zeros(len(pending), dtype=bool)
+            for mask, _ in problems:
+                invalid |= mask
+            rows = quote_rows(compute_arrays(columns))
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.quotes += len(pending)
+        for i, ((_, future), row) in enumerate(zip(pending, rows)):
+            # A cancelled future belongs to a client that went away
+            if future.done():
+                continue
+            if invalid[i]:
+                message = next(message for mask, message in problems if mask[i])
+                future.set_exception(ApiError(400, message))
+            else:
+                future.set_result(row)
+
+
+def _project_data(payload):
+    """Validate a project body for save_project()/update_project()"""
+    if not isinstance(payload, dict):
+        raise ApiError(400, "A project must be a JSON object")
+    name = payload.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise ApiError(400, "name must be a non-empty string")
+    data = dict(zip(DEAL_FIELDS, deal_values(payload)))
+    errors = deal_errors(data)
+    if errors:
+        raise ApiError(400, errors[0])
+    data["maintenance_months"] = int(data["maintenance_months"])
+    data["name"] = name.strip()
+    return data
+
+
+def _project_dict(project):
+    return {name: getattr(project, name) for name in PROJECT_COLUMNS}
+
+
+def _cursor(value):
+    """Parse a next_cursor value passed back as JSON in the query string"""
+    cursor = json.loads(value)
+    if not isinstance(cursor, list) or len(cursor) != 2:
+        raise ValueError("cursor must be a [sort_value, id] pair")
+    return tuple(cursor)
+
+
+def _flag(value):
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ValueError(value)
+
+
+class QuoteService:
+    """Route requests to the quote and project handlers"""
+
+    ROUTES = (
+        ("GET", r"/health", "health"),
+        ("POST", r"/quote", "quote"),
+        ("POST", r"/quotes", "quotes"),
+        ("GET", r"/projects", "list_projects"),
+        ("POST", r"/projects", "create_project"),
+        ("GET", r"/projects/(?P<project_id>\d+)", "get_project"),
+        ("PUT", r"/projects/(?P<project_id>\d+)", "update_project"),
+        ("DELETE", r"/projects/(?P<project_id>\d+)", "delete_project"),
+        ("GET", r"/metrics", "metrics"),
+    )
+
+    def __init__(self):
+        self.batcher = QuoteBatcher()
+        self._routes = [(method, re.compile(pattern), name) for method, pattern, name in self.ROUTES]
+
+    async def dispatch(self, request):
+        """Answer a request with (status, payload); payload is JSON data, text or None"""
+        allowed = []
+        for method, pattern, name in self._routes:
+            match = pattern.fullmatch(request.path)
+            if match is None:
+                continue
+            if method != request.method:
+                allowed.append(method)
+                continue
+            with span(f"api.{name}", kind="http") as handle:
+                try:
+                    status, payload, handle.rows = await getattr(self, name)(request, **match.groupdict())
+                except ApiError as e:
+                    status, payload = e.status, {"error": e.message}
+            return status, payload
+        if allowed:
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"Use {' or '.join(allowed)} for {request.path}"}
+        return HTTPStatus.NOT_FOUND, {"error": f"No endpoint at {request.path}"}
+
+    async def health(self, request):
+        return HTTPStatus.OK, {"status": "ok"}, 0
+
+    async def quote(self, request):
+        figures = await self.batcher.submit(deal_values(request.json()))
+        return HTTPStatus.OK, figures, 1
+
+    async def quotes(self, request):
+        result = await asyncio.to_thread(quote_batch, request.body)
+        return HTTPStatus.OK, result, result["count"]
+
+    async def list_projects(self, request):
+        limit = request.param("limit", int, 25)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ApiError(400, f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        try:
+            page = await asyncio.to_thread(
+                project_db.list_projects,
+                limit=limit,
+                cursor=request.param("cursor", _cursor),
+                sort_by=request.param("sort_by", default="created_at"),
+                descending=request.param("descending", _flag, True),
+                name=request.param("name"),
+                min_margin=request.param("min_margin", float),
+                max_margin=request.param("max_margin", float),
+                min_revenue=request.param("min_revenue", float),
+                max_revenue=request.param("max_revenue", float),
+            )
+        except ValueError as e:
+            raise ApiError(400, str(e)) from None
+        projects = [_project_dict(project) for project in page["projects"]]
+        return HTTPStatus.OK, {"projects": projects, "next_cursor": page["next_cursor"]}, len(projects)
+
+    async def create_project(self, request):
+        data = _project_data(request.json())
+        project_id = await asyncio.to_thread(project_db.save_project, data)
+        return HTTPStatus.CREATED, {"id": project_id}, 1
+
+    async def get_project(self, request, project_id):
+        project = await asyncio.to_thread(project_db.get_project_by_id, int(project_id))
+        if project is None:
+            raise ApiError(404, f"No project with id {project_id}")
+        return HTTPStatus.OK, _project_dict(project), 1
+
+    async def update_project(self, request, project_id):
+        data = _project_data(request.json())
+        if not await asyncio.to_thread(project_db.update_project, int(project_id), data):
+            raise ApiError(404, f"No project with id {project_id}")
+        return HTTPStatus.OK, {"id": int(project_id)}, 1
+
+    async def delete_project(self, request, project_id):
+        if not await asyncio.to_thread(project_db.delete_project, int(project_id)):
+            raise ApiError(404, f"No project with id {project_id}")
+        return HTTPStatus.NO_CONTENT, None, 1
+
+    async def metrics(self, request):
+        return HTTPStatus.OK, prometheus_text(), 0
+
+
+async def read_request(reader):
+    """Read one request from a connection; None once the client has closed it"""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise ApiError(400, "Malformed request line") from None
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise ApiError(431, "Too many headers")
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if "transfer-encoding" in headers:
+        raise ApiError(501, "Chunked request bodies are not supported; send Content-Length")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise ApiError(400, "Invalid Content-Length") from None
+    if length > MAX_BODY_BYTES:
+        raise ApiError(413, f"Request bodies are limited to {MAX_BODY_BYTES:,} bytes")
+    body = await reader.readexactly(length) if length else b""
+
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    url = urlsplit(target)
+    return Request(method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), headers, body, keep_alive)
+
+
+def render_response(status, payload, keep_alive):
+    """Serialize a response: JSON for data, text/plain for strings, no body for None"""
+    status = HTTPStatus(status)
+    if payload is None:
+        body, content_type = b"", None
+    elif isinstance(payload, str):
+        body, content_type = payload.encode(), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload, separators=(",", ":")).encode(), "application/json"
+    head = [f"HTTP/1.1 {status.value} {status.phrase}"]
+    if status != HTTPStatus.NO_CONTENT:
+        head.append(f"Content-Length: {len(body)}")
+    if content_type:
+        head.append(f"Content-Type: {content_type}")
+    head.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def handle_connection(service, reader, writer):
+    """Serve requests on one connection until the client closes it or goes idle"""
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for(read_request(reader), KEEP_ALIVE_TIMEOUT)
+            except ApiError as e:
+                # The rest of the stream cannot be trusted; answer and close
+                writer.write(render_response(e.status, {"error": e.message}, keep_alive=False))
+                await writer.drain()
+                break
+            except ValueError:
+                writer.write(render_response(431, {"error": "Request line or header too long"}, keep_alive=False))
+                await writer.drain()
+                break
+            if request is None:
+                break
+            try:
+                status, payload = await service.dispatch(request)
+            except Exception:
+                traceback.print_exc()
+                status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal server error"}
+            writer.write(render_response(status, payload, request.keep_alive))
+            await writer.drain()
+            if not request.keep_alive:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+    """Run the API until cancelled; `ready` is called with the bound (host, port)"""
+    await asyncio.to_thread(project_db.ensure_db)
+    service = QuoteService()
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(service, reader, writer), host, port
+    )
+    if ready is not None:
+        ready(server.sockets[0].getsockname()[:2])
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the quoting and project API over HTTP.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="0 picks a free port")
+    parser.add_argument("--db", help=f"database file (default: {project_db.DB_PATH})")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        project_db.DB_PATH = args.db
+
+    def ready(address):
+        print(f"Listening on http://{address[0]}:{address[1]}", flush=True)
+
+    try:
+        asyncio.run(serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    except (OSError, RuntimeError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import functools
+import threading
+from collections import OrderedDict
+
+from utils.storage import data_version
+
+# Default number of results kept per cached function
+DEFAULT_MAX_ENTRIES = 128
+
+_caches = {}
+
+
+class QueryCache:
+    """A thread-safe LRU cache of query results tagged with a data version.
+
+    An entry is only served while the database's data version matches the
+    one recorded when it was stored, so any write invalidates it.
+    """
+
+    def __init__(self, name, max_entries=DEFAULT_MAX_ENTRIES):
+        self.name = name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """Return (True, value) for a fresh entry, else (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def register_cache(name, max_entries=DEFAULT_MAX_ENTRIES):
+    """Create a cache that is listed by cache_stats() and emptied by clear_caches()"""
+    cache = _caches[name] = QueryCache(name, max_entries)
+    return cache
+
+
+def copy_rows(rows):
+    """A new list of new dicts; the `copy` for results that are lists of dicts"""
+    return [dict(row) for row in rows]
+
+
+def cached_query(get_db_path, max_entries=DEFAULT_MAX_ENTRIES, copy=None):
+    """Cache a read function's results until its database changes.
+
+    `get_db_path` is a zero-argument callable returning the database file,
+    so modules can keep reassigning their DB_PATH. Cached values are shared
+    between sessions: results that callers could modify (lists, dicts) need
+    a `copy` function, which is applied to the cached value on every call so
+    each caller gets its own. Immutable results (records, RecordTables) are
+    returned as they are.
+    """
+    def decorator(func):
+        cache = register_cache(func.__module__ + "." + func.__qualname__, max_entries)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            db_path = str(get_db_path())
+            key = (db_path, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                # Unhashable arguments are never cached
+                return func(*args, **kwargs)
+
+            # Read the version before running the query so a concurrent write
+            # can only make the stored entry look older, never newer
+            version = data_version(db_path)
+            found, value = cache.get(key, version)
+            if not found:
+                value = func(*args, **kwargs)
+                cache.put(key, version, value)
+            return value if copy is None else copy(value)
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def cache_stats():
+    """Hit/miss counters for every registered cache"""
+    return [cache.stats() for cache in _caches.values()]
+
+
+def clear_caches():
+    """Drop every cached result (counters are kept)"""
+    for cache in _caches.values():
+        cache.clear()
@@ -0,0 +1,187 @@
+"""Pure calculation core for a single project quote.
+
+Everything the cost calculator shows for one deal (revenue, the available
+budget, the four category budgets, the developer and internal staff splits
+and the suggested sub-category breakdowns) is derived here from a
+QuoteInputs value. Results are memoized on the inputs, so a Streamlit rerun
+with unchanged widgets does no math at all. For whole portfolios of saved
+projects use the vectorized engine in utils.profitability instead.
+"""
+import functools
+from collections.abc import Mapping
+from dataclasses import dataclass, fields, replace
+
+# Allocation fields in the projects table, in category order, and their labels
+ALLOCATION_FIELDS = (
+    "freelancer_allocation",
+    "internal_staff_allocation",
+    "tech_infra_allocation",
+    "admin_allocation",
+)
+CATEGORY_LABELS = (
+    "A. Freelancers",
+    "B. Internal Staff",
+    "C. Tech & Infrastructure",
+    "D. Admin & Misc",
+)
+
+# Default allocation percentages used when no valid mix has been submitted
+DEFAULT_ALLOCATIONS = (50, 20, 15, 15)
+
+# Suggested breakdowns of the smaller categories, in percent
+TECH_INFRA_SPLIT = (
+    ("Cloud Hosting", 40),
+    ("Software Tools", 30),
+    ("Domain/Google Workspace", 15),
+    ("Misc Tech Costs", 15),
+)
+ADMIN_SPLIT = (
+    ("Accounting/Legal", 30),
+    ("Bank Fees", 20),
+    ("Contingency", 50),
+)
+
+CALC_CACHE_SIZE = 1024
+
+
+@dataclass(frozen=True)
+class QuoteInputs:
+    """Everything a quote depends on. Hashable, so it can key the cache.
+
+    `developer_split` holds the percentage of the freelancer budget paid to
+    developers 1..n-1; the last developer receives whatever is left.
+    """
+    upfront_payment: float = 0.0
+    monthly_maintenance: float = 0.0
+    maintenance_months: int = 0
+    other_revenue: float = 0.0
+    target_margin: float = 50.0
+    freelancer_allocation: float = DEFAULT_ALLOCATIONS[0]
+    internal_staff_allocation: float = DEFAULT_ALLOCATIONS[1]
+    tech_infra_allocation: float = DEFAULT_ALLOCATIONS[2]
+    admin_allocation: float = DEFAULT_ALLOCATIONS[3]
+    developer_count: int = 1
+    developer_split: tuple = ()
+    internal_developer_pct: float = 70.0
+
+    @classmethod
+    def from_project(cls, project, **overrides):
+        """Build inputs from a saved project (a Project record, or a dict or mapping)"""
+        names = {f.name for f in fields(cls)}
+        if isinstance(project, Mapping):
+            values = {name: project[name] for name in names if name in project}
+        else:
+            values = {name: getattr(project, name) for name in names if hasattr(project, name)}
+        values.update(overrides)
+        return cls(**values)
+
+    @property
+    def allocations(self):
+        return tuple(getattr(self, name) for name in ALLOCATION_FIELDS)
+
+    @property
+    def total_allocation(self):
+        return sum(self.allocations)
+
+    def with_changes(self, **changes):
+        """Return a copy of the inputs with some fields replaced"""
+        return replace(self, **changes)
+
+
+@dataclass(frozen=True)
+class QuoteResult:
+    """Derived figures for one quote. Amounts are tuples of (label, amount, percent)."""
+    inputs: QuoteInputs
+    total_maintenance: float
+    total_revenue: float
+    available_budget: float
+    freelancer_budget: float
+    internal_staff_budget: float
+    tech_infra_budget: float
+    admin_budget: float
+    total_expenses: float
+    expected_profit: float
+    actual_margin_pct: float
+    even_split: float
+    developer_payments: tuple
+    internal_staff_split: tuple
+    tech_infra_breakdown: tuple
+    admin_breakdown: tuple
+
+    @property
+    def category_budgets(self):
+        return (self.freelancer_budget, self.internal_staff_budget, self.tech_infra_budget, self.admin_budget)
+
+    @property
+    def category_expenses(self):
+        """Category budgets keyed by their display label"""
+        return dict(zip(CATEGORY_LABELS, self.category_budgets))
+
+
+def _developer_payments(freelancer_budget, developer_count, developer_split):
+    """Pay developers 1..n-1 their share and give the last one the remainder"""
+    if not developer_split:
+        return ()
+    remaining = freelancer_budget
+    payments = []
+    for i, percent in enumerate(developer_split, start=1):
+        amount = freelancer_budget * (percent / 100)
+        remaining -= amount
+        payments.append((f"Developer {i}", amount, percent))
+
+    # The last developer is only listed while there is budget left over
+    if remaining > 0:
+        percent = 100 - sum(p[2] for p in payments)
+        payments.append((f"Developer {developer_count}", remaining, percent))
+    return tuple(payments)
+
+
+def _breakdown(budget, split):
+    return tuple((label, budget * (percent / 100), percent) for label, percent in split)
+
+
+@functools.lru_cache(maxsize=CALC_CACHE_SIZE)
+def calculate(inputs):
+    """Compute every figure for a quote. Cached per QuoteInputs value."""
+    total_maintenance = inputs.monthly_maintenance * inputs.maintenance_months
+    total_revenue = inputs.upfront_payment + total_maintenance + inputs.other_revenue
+
+    # Available budget is only defined for deals that bring in revenue
+    available_budget = total_revenue * (1 - inputs.target_margin / 100) if total_revenue > 0 else 0
+    budgets = [available_budget * (allocation / 100) for allocation in inputs.allocations]
+    freelancer_budget, internal_staff_budget, tech_infra_budget, admin_budget = budgets
+
+    total_expenses = sum(budgets)
+    expected_profit = total_revenue - total_expenses
+    actual_margin_pct = (expected_profit / total_revenue * 100) if total_revenue > 0 else 0
+
+    sales_pct = 100 - inputs.internal_developer_pct
+    internal_staff_split = (
+        ("Internal Developer", internal_staff_budget * (inputs.internal_developer_pct / 100),
+         inputs.internal_developer_pct),
+        ("Sales Person", internal_staff_budget * (sales_pct / 100), sales_pct),
+    )
+
+    return QuoteResult(
+        inputs=inputs,
+        total_maintenance=total_maintenance,
+        total_revenue=total_revenue,
+        available_budget=available_budget,
+        freelancer_budget=freelancer_budget,
+        internal_staff_budget=internal_staff_budget,
+        tech_infra_budget=tech_infra_budget,
+        admin_budget=admin_budget,
+        total_expenses=total_expenses,
+        expected_profit=expected_profit,
+        actual_margin_pct=actual_margin_pct,
+        even_split=freelancer_budget / inputs.developer_count if inputs.developer_count > 0 else 0,
+        developer_payments=_developer_payments(freelancer_budget, inputs.developer_count, inputs.developer_split),
+        internal_staff_split=internal_staff_split,
+        tech_infra_breakdown=_breakdown(tech_infra_budget, TECH_INFRA_SPLIT),
+        admin_breakdown=_breakdown(admin_budget, ADMIN_SPLIT),
+    )
+
+
+def calculate_project(project, **overrides):
+    """Compute the figures for a saved project"""
+    return calculate(QuoteInputs.from_project(project, **overrides))
@@ -0,0 +1,138 @@
+"""Plotly figures for the Cost Calculator, cached on their inputs.
+
+Building a figure through graph_objects validates every property, and
+st.plotly_chart then copies the figure to a dict and encodes that as JSON.
+Reruns usually redraw the same numbers, so each chart function is wrapped
+with `cached_figure`: the figure's dict is kept per input vector, and repeat
+views skip building, validating and copying it. Streamlit has no public way
+to take an already encoded spec, so the JSON encoding still runs on every
+rerun; it is the cheap part (about 0.06 ms of a 7 ms chart, see the
+`[cached,json]` cases of benchmarks.suite).
+"""
+import functools
+
+import plotly.graph_objects as go
+
+from utils.cache import register_cache
+
+# Figures kept per chart function
+FIGURE_CACHE_SIZE = 64
+
+# Colors of the expense categories in the deal composition chart
+CATEGORY_COLORS = ['#3498db', '#9b59b6', '#e74c3c', '#f39c12']
+
+
+class SerializedFigure(go.Figure):
+    """A figure that returns a precomputed spec instead of copying itself to a dict.
+
+    st.plotly_chart reads a figure only through plotly.tools, which calls
+    to_dict() on it, so this skips Plotly object construction, validation
+    and the copy on every cache hit (tests/test_charts.py checks that
+    Streamlit still renders the same spec). Everything else about the
+    figure is empty: it is only meant to be passed to st.plotly_chart. The
+    spec is shared between sessions and must be treated as read-only.
+    """
+
+    def __init__(self, spec):
+        super().__init__()
+        self._spec = spec
+
+    def to_dict(self):
+        return self._spec
+
+    to_plotly_json = to_dict
+
+
+def _freeze(value):
+    """Hashable form of a chart input; dicts keep their order, which is the plot order"""
+    if isinstance(value, dict):
+        return tuple((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def cached_figure(func=None, *, max_entries=FIGURE_CACHE_SIZE):
+    """Cache the serialized figure built by `func` for each set of arguments.
+
+    Entries are evicted least recently used, and hit rates show up in
+    cache_stats() next to the query caches.
+    """
+    def decorator(func):
+        cache = register_cache(func.__module__ + "." + func.__qualname__, max_entries)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (_freeze(args), _freeze(dict(sorted(kwargs.items()))))
+            found, figure = cache.get(key, None)
+            if found:
+                return figure
+            figure = SerializedFigure(func(*args, **kwargs).to_dict())
+            cache.put(key, None, figure)
+            return figure
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
+
+
+@cached_figure
+def deal_composition_figure(expected_profit, actual_margin_pct, category_expenses, total_revenue):
+    """Stacked bar of how the deal splits into profit and cost categories"""
+    fig = go.Figure()
+
+    # Add profit bar
+    fig.add_trace(go.Bar(
+        name='Profit',
+        y=['Deal Composition'],
+        x=[expected_profit],
+        orientation='h',
+        marker=dict(color='#2ecc71'),
+        text=f"{actual_margin_pct:.1f}%",
+        textposition='inside',
+        insidetextanchor='middle'
+    ))
+
+    # Add expense categories
+    for i, (category, amount) in enumerate(category_expenses.items()):
+        percentage = (amount / total_revenue * 100)
+        fig.add_trace(go.Bar(
+            name=category,
+            y=['Deal Composition'],
+            x=[amount],
+            orientation='h',
+            marker=dict(color=CATEGORY_COLORS[i % len(CATEGORY_COLORS)]),
+            text=f"{percentage:.1f}%" if percentage >= 5 else "",
+            textposition='inside',
+            insidetextanchor='middle'
+        ))
+
+    fig.update_layout(
+        title='Deal Size Composition',
+        barmode='stack',
+        height=200,
+        margin=dict(l=50, r=50, t=50, b=20),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5),
+        xaxis=dict(title='Amount')
+    )
+    return fig
+
+
+@cached_figure
+def expense_pie_figure(labels, values, height):
+    """Donut chart of the expense breakdown"""
+    fig = go.Figure(data=[go.Pie(
+        labels=labels,
+        values=values,
+        hole=.3,
+        textinfo='label+percent',
+        insidetextorientation='radial'
+    )])
+
+    fig.update_layout(
+        title='Expense Distribution',
+        height=height,
+        margin=dict(l=20, r=20, t=50, b=20)
+    )
+    return fig
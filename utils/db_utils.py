@@ -1,148 +1,488 @@
-import sqlite3
-import pandas as pd
-import os
-from pathlib import Path
+import math
+from contextlib import contextmanager
 
-# Define database path
-DB_PATH = Path(__file__).parent.parent / "data" / "bookkeeping.db"
+from utils import schema
+from utils.lazy import lazy_import
+from utils.metrics import timed
+from utils.schema import REBUILD_ROLLUPS_SQL, create_ledger_indexes, create_search_triggers, drop_search_triggers
+from utils.storage import connect, init_once, transaction
 
+pd = lazy_import("pandas")
+
+# The ledger shares one database with projects and payroll (see utils.schema)
+DB_PATH = schema.DB_PATH
+
+# Column order used by save_transactions() for bulk inserts
+TRANSACTION_COLUMNS = (
+    "date", "type", "amount", "currency", "vnd_amount",
+    "description", "category", "reference", "exchange_rate"
+)
+
+# SQL expressions for the date buckets supported by get_transaction_totals();
+# dates are stored as YYYY-MM-DD text and weeks are labelled by their Monday
+DATE_BUCKETS = {
+    "day": "substr(date, 1, 10)",
+    "week": "date(substr(date, 1, 10), '-6 days', 'weekday 1')",
+    "month": "substr(date, 1, 7)",
+}
+
+# Searches matching more transactions than this list hits newest first
+# instead of ranking them (see search_transactions)
+SEARCH_RANK_LIMIT = 5000
+
+# Tolerances used when comparing rollup sums against the raw ledger
+ROLLUP_ABS_TOLERANCE = 0.005
+ROLLUP_REL_TOLERANCE = 1e-9
+
+@timed
 def init_db():
-    """Initialize the database and create tables if they don't exist"""
-    # Ensure the data directory exists
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Create transactions table if it doesn't exist
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            type TEXT NOT NULL,
-            amount REAL NOT NULL,
-            currency TEXT NOT NULL,
-            vnd_amount REAL NOT NULL,
-            description TEXT,
-            category TEXT NOT NULL,
-            reference TEXT,
-            exchange_rate REAL DEFAULT 1.0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """Create the database schema or bring it up to date"""
+    schema.migrate(DB_PATH)
+
+@init_once(lambda: DB_PATH)
+def ensure_db():
+    """Run init_db() once per process; pages call this on every rerun"""
+    init_db()
 
+@timed
 def save_transaction(transaction_data):
-    """Save a new transaction to the database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO transactions
-        (date, type, amount, currency, vnd_amount, description, category, reference, exchange_rate)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        transaction_data["date"],
-        transaction_data["type"],
-        transaction_data["amount"],
-        transaction_data["currency"],
-        transaction_data["vnd_amount"],
-        transaction_data["description"],
-        transaction_data["category"],
-        transaction_data["reference"],
-        transaction_data["exchange_rate"]
-    ))
-    
-    conn.commit()
-    conn.close()
+    """Save a new transaction to the database.
+
+    An optional "project_id" books it to a project.
+    """
+    with transaction(DB_PATH) as conn:
+        conn.execute('''
+            INSERT INTO transactions
+            (date, type, amount, currency, vnd_amount, description, category, reference, exchange_rate, project_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            transaction_data["date"],
+            transaction_data["type"],
+            transaction_data["amount"],
+            transaction_data["currency"],
+            transaction_data["vnd_amount"],
+            transaction_data["description"],
+            transaction_data["category"],
+            transaction_data["reference"],
+            transaction_data["exchange_rate"],
+            transaction_data.get("project_id")
+        ))
+
+@timed
+def save_transactions(rows):
+    """Save many transactions in a single transaction.
 
+    `rows` is a sequence of tuples in TRANSACTION_COLUMNS order. Returns the
+    number of rows inserted.
+    """
+    with transaction(DB_PATH) as conn:
+        cursor = conn.executemany(f'''
+            INSERT INTO transactions ({", ".join(TRANSACTION_COLUMNS)})
+            VALUES ({", ".join("?" for _ in TRANSACTION_COLUMNS)})
+        ''', rows)
+        return cursor.rowcount
+
+@contextmanager
+def bulk_load():
+    """Suspend per-row index and rollup maintenance during a large load.
+
+    The covering indexes and the rollup insert and update triggers are
+    dropped for the duration of the block and rebuilt in one pass
+    afterwards, which is far cheaper than updating them row by row. Rows
+    inserted during the block are added to the search index afterwards too,
+    with the text they have at the end of the block.
+
+    The drops, the block's writes and the rebuild are one write transaction
+    (writes inside the block join it), so other writers wait for the load
+    instead of bypassing the triggers, and an error or a crash part-way
+    rolls everything back with the indexes and triggers in place.
+    """
+    with transaction(DB_PATH) as conn:
+        conn.execute("DROP INDEX IF EXISTS idx_transactions_type_category_date")
+        conn.execute("DROP INDEX IF EXISTS idx_transactions_date")
+        conn.execute("DROP TRIGGER IF EXISTS trg_transactions_rollup_insert")
+        conn.execute("DROP TRIGGER IF EXISTS trg_transactions_rollup_update")
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+        # Loaded rows reach the search index in one pass at the end, so until
+        # then only rows that are already indexed may be updated or deleted there
+        drop_search_triggers(conn)
+        create_search_triggers(conn, indexed_through=last_id)
+
+        yield
+
+        create_ledger_indexes(conn)
+        conn.execute('''
+            INSERT INTO transactions_fts (rowid, description, reference)
+            SELECT id, description, reference FROM transactions WHERE id > ?
+        ''', (last_id,))
+        drop_search_triggers(conn)
+        create_search_triggers(conn)
+        rebuild_monthly_rollups()
+
+@timed
 def update_transaction(transaction_id, transaction_data):
     """Update an existing transaction in the database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE transactions
-        SET date = ?, type = ?, amount = ?, currency = ?, 
-            vnd_amount = ?, description = ?, category = ?, 
-            reference = ?, exchange_rate = ?
-        WHERE id = ?
-    ''', (
-        transaction_data["date"],
-        transaction_data["type"],
-        transaction_data["amount"],
-        transaction_data["currency"],
-        transaction_data["vnd_amount"],
-        transaction_data["description"],
-        transaction_data["category"],
-        transaction_data["reference"],
-        transaction_data["exchange_rate"],
-        transaction_id
-    ))
-    
-    conn.commit()
-    conn.close()
+    with transaction(DB_PATH) as conn:
+        conn.execute('''
+            UPDATE transactions
+            SET date = ?, type = ?, amount = ?, currency = ?,
+                vnd_amount = ?, description = ?, category = ?,
+                reference = ?, exchange_rate = ?, project_id = ?
+            WHERE id = ?
+        ''', (
+            transaction_data["date"],
+            transaction_data["type"],
+            transaction_data["amount"],
+            transaction_data["currency"],
+            transaction_data["vnd_amount"],
+            transaction_data["description"],
+            transaction_data["category"],
+            transaction_data["reference"],
+            transaction_data["exchange_rate"],
+            transaction_data.get("project_id"),
+            transaction_id
+        ))
 
+@timed
 def delete_transaction(transaction_id):
     """Delete a transaction from the database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
-    
-    conn.commit()
-    conn.close()
+    with transaction(DB_PATH) as conn:
+        conn.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
 
+@timed
 def get_all_transactions():
     """Get all transactions from the database"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT * FROM transactions ORDER BY date DESC
-    ''')
-    
-    rows = cursor.fetchall()
+    with connect(DB_PATH) as conn:
+        rows = conn.execute('''
+            SELECT * FROM transactions ORDER BY date DESC
+        ''').fetchall()
+
     transactions = [dict(row) for row in rows]
-    
-    conn.close()
     return transactions
 
+@timed
 def get_filtered_transactions(types=None, categories=None):
     """Get transactions filtered by type and/or category"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
     query = "SELECT * FROM transactions WHERE 1=1"
     params = []
-    
+
     if types and len(types) > 0:
         placeholders = ', '.join('?' for _ in types)
         query += f" AND type IN ({placeholders})"
         params.extend(types)
-    
+
     if categories and len(categories) > 0:
         placeholders = ', '.join('?' for _ in categories)
         query += f" AND category IN ({placeholders})"
         params.extend(categories)
-    
+
     query += " ORDER BY date DESC"
-    
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
+
+    with connect(DB_PATH) as conn:
+        rows = conn.execute(query, params).fetchall()
+
     transactions = [dict(row) for row in rows]
-    
-    conn.close()
     return transactions
 
+def _match_query(text):
+    """Turn search text into an FTS5 query: every word must match, the last one as a prefix"""
+    words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if words:
+        words[-1] += "*"
+    return " ".join(words)
+
+@timed
+def search_transactions(query, limit=25, cursor=None, types=None, categories=None):
+    """Full-text search of transaction descriptions and references.
+
+    Every word of `query` must appear in the description or reference, and
+    the last one may be incomplete, so "hosting ref-0012" finds a hosting
+    payment with reference REF-00123; accents are optional. Hits are ranked
+    by BM25, best first. A query matching more than SEARCH_RANK_LIMIT
+    transactions is too broad for the ranking to be worth scoring every
+    match, so its hits come most recently added first, with a `rank` of
+    None. `cursor` is the `next_cursor` value from the previous page.
+    Returns a dict with the page of `transactions` (dicts with their `rank`)
+    and the `next_cursor`, which is None on the last page.
+    """
+    match = _match_query(query)
+    if not match:
+        return {"transactions": [], "next_cursor": None}
+
+    with connect(DB_PATH) as conn:
+        if cursor is None:
+            # Only count as far as the limit; the index streams the matches
+            matches = conn.execute('''
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM transactions_fts WHERE transactions_fts MATCH ? LIMIT ?
+                )
+            ''', (match, SEARCH_RANK_LIMIT + 1)).fetchone()[0]
+            ranked = matches <= SEARCH_RANK_LIMIT
+        else:
+            ranked = cursor[0] is not None
+
+        rank = "transactions_fts.rank" if ranked else "NULL"
+        sql = f'''
+            SELECT t.*, {rank} AS rank
+            FROM transactions_fts JOIN transactions AS t ON t.id = transactions_fts.rowid
+            WHERE transactions_fts MATCH ?
+        '''
+        params = [match]
+        if types:
+            sql += f" AND t.type IN ({', '.join('?' for _ in types)})"
+            params.extend(types)
+        if categories:
+            sql += f" AND t.category IN ({', '.join('?' for _ in categories)})"
+            params.extend(categories)
+
+        # Seek past the last hit of the previous page
+        if cursor is not None and ranked:
+            sql += " AND (transactions_fts.rank, transactions_fts.rowid) > (?, ?)"
+            params.extend(cursor)
+        elif cursor is not None:
+            sql += " AND transactions_fts.rowid < ?"
+            params.append(cursor[1])
+        if ranked:
+            sql += " ORDER BY transactions_fts.rank, transactions_fts.rowid"
+        else:
+            sql += " ORDER BY transactions_fts.rowid DESC"
+        # Fetch one extra row to learn whether another page exists
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+        rows = conn.execute(sql, params).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = (last["rank"], last["id"])
+    return {"transactions": [dict(row) for row in rows[:limit]], "next_cursor": next_cursor}
+
+@timed
+def get_transaction_totals(group_by=("type", "category"), bucket=None, types=None,
+                           categories=None, start_date=None, end_date=None):
+    """Sum vnd_amount per group inside SQLite.
+
+    `group_by` is any of "type" and "category"; `bucket` optionally adds a
+    "period" per day, week or month. Dates are inclusive YYYY-MM-DD strings.
+    Returns a list of dicts with the group columns, `total_vnd` and
+    `transaction_count`.
+    """
+    group_by = list(group_by)
+    for column in group_by:
+        if column not in ("type", "category"):
+            raise ValueError(f"Cannot group transactions by {column!r}")
+    if bucket is not None and bucket not in DATE_BUCKETS:
+        raise ValueError(f"Unknown date bucket {bucket!r}")
+
+    # Whole-ledger totals per month or overall are served from the rollups
+    if bucket in (None, "month") and not start_date and not end_date:
+        return _get_rollup_totals(group_by, bucket == "month", types, categories)
+
+    group_exprs = list(group_by)
+    if bucket is not None:
+        group_exprs.insert(0, f"{DATE_BUCKETS[bucket]} AS period")
+
+    # COALESCE so an empty ledger sums to 0 on both paths
+    select = ", ".join(group_exprs + ["COALESCE(SUM(vnd_amount), 0.0) AS total_vnd", "COUNT(*) AS transaction_count"])
+    query = f"SELECT {select} FROM transactions WHERE 1=1"
+    params = []
+
+    if types and len(types) > 0:
+        query += f" AND type IN ({', '.join('?' for _ in types)})"
+        params.extend(types)
+    if categories and len(categories) > 0:
+        query += f" AND category IN ({', '.join('?' for _ in categories)})"
+        params.extend(categories)
+    if start_date:
+        query += " AND date >= ?"
+        params.append(start_date)
+    if end_date:
+        # Compare against the next day so timestamps on end_date still match
+        query += " AND date < date(?, '+1 day')"
+        params.append(end_date)
+
+    group_keys = (["period"] if bucket is not None else []) + group_by
+    if group_keys:
+        query += f" GROUP BY {', '.join(group_keys)} ORDER BY {', '.join(group_keys)}"
+
+    with connect(DB_PATH) as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    return [dict(row) for row in rows]
+
+def _get_rollup_totals(group_by, by_month, types=None, categories=None):
+    """Answer get_transaction_totals() from the monthly rollup table"""
+    group_keys = (["month AS period"] if by_month else []) + group_by
+    select = ", ".join(group_keys + [
+        "COALESCE(SUM(total_vnd), 0.0) AS total_vnd", "COALESCE(SUM(transaction_count), 0) AS transaction_count"
+    ])
+    query = f"SELECT {select} FROM transaction_monthly_rollups WHERE 1=1"
+    params = []
+
+    if types and len(types) > 0:
+        query += f" AND type IN ({', '.join('?' for _ in types)})"
+        params.extend(types)
+    if categories and len(categories) > 0:
+        query += f" AND category IN ({', '.join('?' for _ in categories)})"
+        params.extend(categories)
+
+    group_names = (["period"] if by_month else []) + group_by
+    if group_names:
+        query += f" GROUP BY {', '.join(group_names)} ORDER BY {', '.join(group_names)}"
+
+    with connect(DB_PATH) as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    return [dict(row) for row in rows]
+
+@timed
+def get_monthly_totals(types=None, categories=None, start_month=None, end_month=None):
+    """Get per-month totals by type, category and currency from the rollups.
+
+    Months are YYYY-MM strings and both bounds are inclusive.
+    """
+    query = "SELECT * FROM transaction_monthly_rollups WHERE 1=1"
+    params = []
+
+    if types and len(types) > 0:
+        query += f" AND type IN ({', '.join('?' for _ in types)})"
+        params.extend(types)
+    if categories and len(categories) > 0:
+        query += f" AND category IN ({', '.join('?' for _ in categories)})"
+        params.extend(categories)
+    if start_month:
+        query += " AND month >= ?"
+        params.append(start_month)
+    if end_month:
+        query += " AND month <= ?"
+        params.append(end_month)
+
+    query += " ORDER BY month, type, category, currency"
+
+    with connect(DB_PATH) as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    return [dict(row) for row in rows]
+
+@timed
+def rebuild_monthly_rollups():
+    """Recompute the monthly rollup table from the raw transactions"""
+    with transaction(DB_PATH) as conn:
+        conn.execute("DELETE FROM transaction_monthly_rollups")
+        cursor = conn.execute(REBUILD_ROLLUPS_SQL)
+        return cursor.rowcount
+
+@timed
+def verify_monthly_rollups():
+    """Compare the rollup table with the raw transactions.
+
+    Returns a list of mismatching groups; an empty list means the rollups
+    are consistent.
+    """
+    key_columns = ("month", "type", "category", "currency")
+    with connect(DB_PATH) as conn:
+        expected = {
+            tuple(row[:4]): row[4:]
+            for row in conn.execute('''
+                SELECT substr(date, 1, 7), type, category, currency,
+                       SUM(amount), SUM(vnd_amount), COUNT(*)
+                FROM transactions
+                GROUP BY 1, 2, 3, 4
+            ''')
+        }
+        actual = {
+            tuple(row[:4]): row[4:]
+            for row in conn.execute('''
+                SELECT month, type, category, currency,
+                       total_amount, total_vnd, transaction_count
+                FROM transaction_monthly_rollups
+            ''')
+        }
+
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys()):
+        want = expected.get(key, (0.0, 0.0, 0))
+        got = actual.get(key, (0.0, 0.0, 0))
+        sums_match = all(
+            math.isclose(w, g, rel_tol=ROLLUP_REL_TOLERANCE, abs_tol=ROLLUP_ABS_TOLERANCE)
+            for w, g in zip(want[:2], got[:2])
+        )
+        if want[2] != got[2] or not sums_match:
+            mismatches.append({
+                **dict(zip(key_columns, key)),
+                "expected": tuple(want),
+                "actual": tuple(got),
+            })
+    return mismatches
+
+@timed
+def save_fx_rates(rows):
+    """Insert or replace many (currency, rate_date, rate) rows in one transaction"""
+    with transaction(DB_PATH) as conn:
+        c = conn.executemany(
+            "INSERT OR REPLACE INTO fx_rates (currency, rate_date, rate) VALUES (?, ?, ?)",
+            rows
+        )
+        return c.rowcount
+
+@timed
+def get_fx_rates(currency=None):
+    """Get exchange rates ordered by currency and date as a list of dicts"""
+    query = "SELECT currency, rate_date, rate FROM fx_rates"
+    params = []
+    if currency is not None:
+        query += " WHERE currency = ?"
+        params.append(currency)
+    query += " ORDER BY currency, rate_date"
+
+    with connect(DB_PATH) as conn:
+        rows = conn.execute(query, params).fetchall()
+    return [dict(row) for row in rows]
+
+@timed
+def get_foreign_transactions_after(after_id, limit, currencies=None, start_date=None, end_date=None):
+    """Get the next `limit` non-VND transactions with id > `after_id`, in id order.
+
+    Returns (id, date, currency, amount, exchange_rate, vnd_amount) rows with
+    the date trimmed to YYYY-MM-DD; used to walk the ledger in chunks.
+    """
+    query = """
+        SELECT id, substr(date, 1, 10), currency, amount, exchange_rate, vnd_amount
+        FROM transactions WHERE id > ? AND currency != 'VND'
+    """
+    params = [after_id]
+    if currencies:
+        placeholders = ', '.join('?' for _ in currencies)
+        query += f" AND currency IN ({placeholders})"
+        params.extend(currencies)
+    if start_date:
+        query += " AND date >= ?"
+        params.append(start_date)
+    if end_date:
+        # Compare against the next day so timestamps on end_date still match
+        query += " AND date < date(?, '+1 day')"
+        params.append(end_date)
+    query += " ORDER BY id LIMIT ?"
+    params.append(limit)
+
+    with connect(DB_PATH) as conn:
+        return conn.execute(query, params).fetchall()
+
+@timed
+def update_exchange_rates(rows):
+    """Write many (exchange_rate, vnd_amount, id) updates in one transaction"""
+    with transaction(DB_PATH) as conn:
+        c = conn.executemany(
+            "UPDATE transactions SET exchange_rate = ?, vnd_amount = ? WHERE id = ?",
+            rows
+        )
+        return c.rowcount
+
+@timed
 def export_to_dataframe():
     """Export all transactions to a pandas DataFrame"""
-    conn = sqlite3.connect(DB_PATH)
     query = "SELECT * FROM transactions ORDER BY date DESC"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    with connect(DB_PATH) as conn:
+        df = pd.read_sql_query(query, conn)
     return df
@@ -0,0 +1,139 @@
+import csv
+import io
+import tempfile
+import zlib
+
+from utils import db_utils, payroll_db, project_db
+from utils.metrics import timed
+from utils.storage import connect
+
+# Rows fetched from SQLite per chunk; bounds memory regardless of table size
+EXPORT_CHUNK_SIZE = 5000
+
+# Exports spill to disk once they grow past this size
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Export format -> (MIME type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "csv.gz": ("application/gzip", ".csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+# Exportable tables -> (module holding DB_PATH, table, ORDER BY clause)
+EXPORT_TABLES = {
+    "transactions": (db_utils, "transactions", "date DESC"),
+    "projects": (project_db, "projects", "created_at DESC, id DESC"),
+    "freelancers": (payroll_db, "freelancers", "id"),
+}
+
+def _table_query(name):
+    module, table, order_by = EXPORT_TABLES[name]
+    return module.DB_PATH, table, f"SELECT * FROM {table} ORDER BY {order_by}"
+
+def iter_csv(name, compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield a table as CSV bytes, one chunk of rows at a time.
+
+    With `compress` the chunks form a single gzip stream.
+    """
+    db_path, _, query = _table_query(name)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    with connect(db_path) as conn:
+        cursor = conn.execute(query)
+        writer.writerow([d[0] for d in cursor.description])
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            writer.writerows(rows)
+            data = buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+            if not rows:
+                break
+
+    if compressor:
+        yield compressor.flush()
+
+def _arrow_type(declared_type):
+    """Map a declared SQLite column type to an Arrow type by affinity"""
+    import pyarrow as pa
+
+    declared_type = (declared_type or "").upper()
+    if "INT" in declared_type:
+        return pa.int64()
+    if any(t in declared_type for t in ("REAL", "FLOA", "DOUB")):
+        return pa.float64()
+    return pa.string()
+
+def write_parquet(name, fileobj, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write a table to `fileobj` as Parquet, one row group per chunk"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow: pip install pyarrow")
+
+    db_path, table, query = _table_query(name)
+    with connect(db_path) as conn:
+        schema = pa.schema([
+            (col["name"], _arrow_type(col["type"]))
+            for col in conn.execute(f"PRAGMA table_info({table})")
+        ])
+        cursor = conn.execute(query)
+        with pq.ParquetWriter(fileobj, schema) as writer:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                columns = list(zip(*rows))
+                writer.write_table(pa.table(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                    schema=schema
+                ))
+
+@timed
+def export_to_file(name, file_format="csv", fileobj=None):
+    """Export a table in the given format and return the rewound file object.
+
+    By default the export is written to a spooled temporary file, so large
+    tables go to disk instead of being held in memory.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {file_format!r}")
+    if fileobj is None:
+        fileobj = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+    if file_format == "parquet":
+        write_parquet(name, fileobj)
+    else:
+        for chunk in iter_csv(name, compress=file_format == "csv.gz"):
+            fileobj.write(chunk)
+
+    fileobj.seek(0)
+    return fileobj
+
+def download_data(name, file_format="csv"):
+    """Return a zero-argument callable for st.download_button(data=...).
+
+    Streamlit only runs it when the button is clicked, so reruns don't pay
+    for building the export. Streamlit keeps the finished download in memory,
+    but the export itself is still produced chunk by chunk.
+    """
+    def build():
+        with export_to_file(name, file_format) as f:
+            return f.read()
+    return build
+
+def download_file_name(basename, file_format="csv"):
+    """Build the download file name for an export format"""
+    return basename + EXPORT_FORMATS[file_format][1]
+
+def download_mime(file_format="csv"):
+    """MIME type of an export format"""
+    return EXPORT_FORMATS[file_format][0]
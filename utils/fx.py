@@ -0,0 +1,225 @@
+"""Exchange rates to VND and bulk revaluation of bookkeeping transactions.
+
+Rates are stored in the `fx_rates` table keyed by (currency, rate_date) and
+loaded into sorted NumPy arrays per currency, so the rate in effect on any
+date is found with a binary search. Usage:
+
+    python -m utils.fx load rates.csv          # currency,rate_date,rate rows
+    python -m utils.fx rate USD 2024-03-15     # as-of lookup
+    python -m utils.fx revalue --currency USD --start-date 2024-01-01
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import db_utils
+from utils.cache import cached_query
+from utils.ingest import FORMATS, RowError, read_rows
+from utils.lazy import lazy_import
+from utils.storage import transaction
+
+np = lazy_import("numpy")
+
+# Amounts in the base currency are never revalued
+BASE_CURRENCY = "VND"
+
+DEFAULT_CHUNK_SIZE = 100000
+
+
+class FxRates:
+    """Exchange rates compiled into sorted per-currency arrays.
+
+    `lookup()` returns the rate in effect on each date: the latest rate
+    dated on or before it. Dates before a currency's first rate have no rate.
+    """
+
+    def __init__(self, rows):
+        by_currency = {}
+        for row in rows:
+            by_currency.setdefault(row["currency"], []).append((row["rate_date"][:10], float(row["rate"])))
+
+        self._tables = {}
+        for currency, entries in by_currency.items():
+            entries.sort()
+            dates = np.array([d for d, _ in entries], dtype="datetime64[D]")
+            rates = np.array([r for _, r in entries])
+            self._tables[currency] = (dates, rates)
+
+    @property
+    def currencies(self):
+        return tuple(self._tables)
+
+    def lookup(self, currencies, dates):
+        """As-of rates for parallel arrays of currencies and YYYY-MM-DD dates.
+
+        Returns a float64 array with NaN where no rate is known.
+        """
+        currencies = np.asarray(currencies, dtype=object)
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        rates = np.full(len(currencies), np.nan)
+        rates[currencies == BASE_CURRENCY] = 1.0
+
+        for currency, (table_dates, table_rates) in self._tables.items():
+            rows = currencies == currency
+            if not rows.any():
+                continue
+            index = np.searchsorted(table_dates, dates[rows], side="right") - 1
+            found = index >= 0
+            matched = np.full(index.shape, np.nan)
+            matched[found] = table_rates[index[found]]
+            rates[rows] = matched
+        return rates
+
+    def rate(self, currency, on_date):
+        """The rate in effect for one currency on one date, or None"""
+        rate = self.lookup([currency], [str(on_date)[:10]])[0]
+        return None if np.isnan(rate) else float(rate)
+
+
+@cached_query(lambda: db_utils.DB_PATH)
+def load_fx_rates():
+    """Load every stored rate; cached until the bookkeeping database changes"""
+    return FxRates(db_utils.get_fx_rates())
+
+
+def _convert_rate_row(row, line):
+    if isinstance(row, RowError):
+        raise row
+    try:
+        currency = str(row["currency"]).strip().upper()
+        rate_date = date.fromisoformat(str(row.get("rate_date") or row["date"]).strip()[:10]).isoformat()
+        rate = float(row["rate"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"row {line}: {e}") from None
+    if rate <= 0:
+        raise ValueError(f"row {line}: rate must be positive")
+    return currency, rate_date, rate
+
+
+def load_rates_file(path, file_format=None):
+    """Store the rates from a CSV, JSONL or Parquet file of currency, rate_date, rate rows"""
+    db_utils.init_db()
+    rows = [_convert_rate_row(row, line) for line, row in enumerate(read_rows(path, file_format), start=1)]
+    return db_utils.save_fx_rates(rows)
+
+
+def revalue_transactions(currencies=None, start_date=None, end_date=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                         progress=None, fx_rates=None, defer_indexes=True):
+    """Recompute exchange_rate and vnd_amount of foreign-currency transactions.
+
+    The ledger is walked in id order in chunks of `chunk_size`; each chunk is
+    revalued with one vectorized as-of lookup and only rows whose figures
+    change are written. Everything runs in a single transaction, so a
+    failure leaves the ledger untouched. Rows without a known rate are left
+    as they are and counted in `missing_rate`. With `defer_indexes` the
+    ledger indexes and monthly rollups are rebuilt once at the end (see
+    db_utils.bulk_load()). `progress` is called with the running stats after
+    every chunk. Returns a dict with `rows`, `updated`, `missing_rate`,
+    `seconds` and `rows_per_second`.
+    """
+    fx_rates = fx_rates or load_fx_rates()
+    stats = {"rows": 0, "updated": 0, "missing_rate": 0, "seconds": 0.0, "rows_per_second": 0.0}
+    start = time.perf_counter()
+
+    def revalue():
+        after_id = 0
+        while True:
+            chunk = db_utils.get_foreign_transactions_after(after_id, chunk_size, currencies, start_date, end_date)
+            if not chunk:
+                break
+            ids, dates, chunk_currencies, amounts, old_rates, old_vnd = zip(*chunk)
+            after_id = ids[-1]
+
+            rates = fx_rates.lookup(chunk_currencies, dates)
+            vnd_amounts = np.asarray(amounts, dtype=np.float64) * rates
+            known = ~np.isnan(rates)
+            changed = known & (
+                (rates != np.asarray(old_rates, dtype=np.float64))
+                | (vnd_amounts != np.asarray(old_vnd, dtype=np.float64))
+            )
+            if changed.any():
+                stats["updated"] += db_utils.update_exchange_rates(zip(
+                    rates[changed].tolist(), vnd_amounts[changed].tolist(), np.asarray(ids)[changed].tolist()
+                ))
+
+            stats["rows"] += len(chunk)
+            stats["missing_rate"] += int((~known).sum())
+            stats["seconds"] = time.perf_counter() - start
+            stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+            if progress:
+                progress(stats)
+
+    with transaction(db_utils.DB_PATH):
+        if defer_indexes:
+            with db_utils.bulk_load():
+                revalue()
+        else:
+            revalue()
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage exchange rates and revalue transactions.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("load", help="store rates from a file with currency, rate_date and rate columns")
+    load.add_argument("path")
+    load.add_argument("--format", choices=FORMATS, help="input format (default: from extension)")
+
+    rate = commands.add_parser("rate", help="show the rate in effect on a date")
+    rate.add_argument("currency")
+    rate.add_argument("date", nargs="?", default=date.today().isoformat())
+
+    revalue = commands.add_parser("revalue", help="recompute vnd_amount from the stored rates")
+    revalue.add_argument("--currency", action="append", help="only revalue this currency (repeatable)")
+    revalue.add_argument("--start-date")
+    revalue.add_argument("--end-date")
+    revalue.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    revalue.add_argument(
+        "--keep-indexes", action="store_true",
+        help="maintain indexes and rollups row by row (better when few rows change in a large ledger)"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "load":
+            print(f"Stored {load_rates_file(args.path, args.format):,} rates")
+        elif args.command == "rate":
+            db_utils.init_db()
+            value = load_fx_rates().rate(args.currency.upper(), args.date)
+            if value is None:
+                print(f"No {args.currency.upper()} rate on or before {args.date}", file=sys.stderr)
+                return 1
+            print(value)
+        else:
+            db_utils.init_db()
+
+            def report(stats):
+                print(f"\r{stats['rows']:,} rows ({stats['rows_per_second']:,.0f} rows/s), "
+                      f"{stats['updated']:,} updated", end="", file=sys.stderr)
+
+            stats = revalue_transactions(
+                [c.upper() for c in args.currency] if args.currency else None,
+                args.start_date, args.end_date, args.chunk_size, report,
+                defer_indexes=not args.keep_indexes
+            )
+            print(file=sys.stderr)
+            print(
+                f"Revalued {stats['rows']:,} rows in {stats['seconds']:.2f}s "
+                f"({stats['rows_per_second']:,.0f} rows/s): {stats['updated']:,} updated, "
+                f"{stats['missing_rate']:,} without a rate"
+            )
+    except (RuntimeError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
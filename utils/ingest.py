@@ -0,0 +1,220 @@
+"""Bulk ingestion of bookkeeping transactions from CSV, JSONL or Parquet files.
+
+Rows are streamed from the input file, validated and converted into
+batches, and each batch is written with a single executemany() inside one
+transaction. Usage:
+
+    python -m utils.ingest transactions.csv --batch-size 20000
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+from datetime import date
+from itertools import islice
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import db_utils
+
+DEFAULT_BATCH_SIZE = 20000
+PARQUET_BATCH_SIZE = 65536
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+
+class RowError(ValueError):
+    """Raised when an input row cannot be converted into a transaction"""
+
+    def __init__(self, line, message):
+        super().__init__(f"row {line}: {message}")
+        self.line = line
+
+
+def detect_format(path):
+    """Guess the input format from the file extension"""
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    if ext in ("json", "ndjson"):
+        ext = "jsonl"
+    if ext not in FORMATS:
+        raise ValueError(f"Cannot detect input format of {path!r}; pass --format")
+    return ext
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    # Yielded, not raised, so that --skip-invalid can drop the line and go on
+                    yield RowError(line_no, f"invalid JSON: {e.msg}")
+
+
+def _read_parquet(path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Reading Parquet files requires pyarrow: pip install pyarrow")
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=PARQUET_BATCH_SIZE):
+        yield from batch.to_pylist()
+
+
+def read_rows(path, file_format=None):
+    """Stream the rows of an input file as dicts"""
+    readers = {"csv": _read_csv, "jsonl": _read_jsonl, "parquet": _read_parquet}
+    return readers[file_format or detect_format(path)](path)
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def convert_row(row, line=0):
+    """Validate one input row and convert it to a TRANSACTION_COLUMNS tuple.
+
+    `vnd_amount` defaults to `amount * exchange_rate` and `exchange_rate`
+    defaults to 1.0 when they are missing.
+    """
+    if isinstance(row, RowError):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError(line, "expected an object with named fields")
+    try:
+        tx_date = _text(row.get("date"))
+        if tx_date is None:
+            raise RowError(line, "missing date")
+        # Normalize to YYYY-MM-DD so date ordering and grouping work in SQL
+        tx_date = date.fromisoformat(tx_date[:10]).isoformat()
+
+        tx_type = _text(row.get("type"))
+        category = _text(row.get("category"))
+        if tx_type is None or category is None:
+            raise RowError(line, "type and category are required")
+
+        amount = float(row["amount"])
+        exchange_rate = _text(row.get("exchange_rate"))
+        exchange_rate = float(exchange_rate) if exchange_rate is not None else 1.0
+        vnd_amount = _text(row.get("vnd_amount"))
+        vnd_amount = float(vnd_amount) if vnd_amount is not None else amount * exchange_rate
+        # float() accepts "nan" and "inf", which the NOT NULL columns cannot store
+        if not all(map(math.isfinite, (amount, exchange_rate, vnd_amount))):
+            raise RowError(line, "amount, exchange_rate and vnd_amount must be finite numbers")
+    except RowError:
+        raise
+    except (KeyError, TypeError, ValueError) as e:
+        raise RowError(line, str(e)) from None
+
+    currency = (_text(row.get("currency")) or "VND").upper()
+    return (
+        tx_date, tx_type, amount, currency, vnd_amount,
+        _text(row.get("description")), category, _text(row.get("reference")), exchange_rate
+    )
+
+
+def ingest_transactions(rows, batch_size=DEFAULT_BATCH_SIZE, skip_invalid=False, progress=None):
+    """Validate and insert a stream of transaction dicts in batches.
+
+    Each batch is committed as one transaction. Invalid rows raise RowError
+    unless `skip_invalid` is set, in which case they are counted and dropped.
+    `progress` is called with the running stats after every batch. Returns a
+    dict with `rows`, `skipped`, `seconds` and `rows_per_second`.
+    """
+    stats = {"rows": 0, "skipped": 0, "seconds": 0.0, "rows_per_second": 0.0}
+    start = time.perf_counter()
+    numbered = enumerate(rows, start=1)
+
+    while True:
+        chunk = list(islice(numbered, batch_size))
+        if not chunk:
+            break
+
+        batch = []
+        for line, row in chunk:
+            try:
+                batch.append(convert_row(row, line))
+            except RowError:
+                if not skip_invalid:
+                    raise
+                stats["skipped"] += 1
+
+        if batch:
+            stats["rows"] += db_utils.save_transactions(batch)
+        stats["seconds"] = time.perf_counter() - start
+        stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+        if progress:
+            progress(stats)
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def ingest_file(path, file_format=None, batch_size=DEFAULT_BATCH_SIZE, skip_invalid=False,
+                progress=None, defer_indexes=True):
+    """Stream a CSV, JSONL or Parquet file into the transactions table.
+
+    With `defer_indexes` the ledger indexes and monthly rollups are rebuilt
+    once after the load instead of being maintained row by row, and the
+    whole load is one transaction: a load that fails part-way, including on
+    an invalid row, leaves the ledger as it was.
+    """
+    db_utils.init_db()
+    rows = read_rows(path, file_format)
+    if not defer_indexes:
+        return ingest_transactions(rows, batch_size=batch_size, skip_invalid=skip_invalid, progress=progress)
+
+    start = time.perf_counter()
+    with db_utils.bulk_load():
+        stats = ingest_transactions(rows, batch_size=batch_size, skip_invalid=skip_invalid, progress=progress)
+    # Report throughput including the index and rollup rebuild
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load bookkeeping transactions.")
+    parser.add_argument("path", help="CSV, JSONL or Parquet file to load")
+    parser.add_argument("--format", choices=FORMATS, help="input format (default: from extension)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--skip-invalid", action="store_true", help="drop invalid rows instead of stopping")
+    parser.add_argument(
+        "--keep-indexes", action="store_true",
+        help="maintain indexes and rollups row by row (better for small loads into a large ledger)"
+    )
+    args = parser.parse_args(argv)
+
+    def report(stats):
+        print(f"\r{stats['rows']:,} rows ({stats['rows_per_second']:,.0f} rows/s)", end="", file=sys.stderr)
+
+    try:
+        stats = ingest_file(
+            args.path, args.format, args.batch_size, args.skip_invalid, report,
+            defer_indexes=not args.keep_indexes
+        )
+    except (RowError, RuntimeError, ValueError) as e:
+        print(f"\nerror: {e}", file=sys.stderr)
+        return 1
+
+    print(file=sys.stderr)
+    print(
+        f"Loaded {stats['rows']:,} rows in {stats['seconds']:.2f}s "
+        f"({stats['rows_per_second']:,.0f} rows/s), skipped {stats['skipped']:,} invalid rows"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""Deferred imports for heavy modules.
+
+pandas alone takes about a quarter of a second to import, and most page
+loads never need it (an empty project list, a quote without revenue). A
+module-level `pd = lazy_import("pandas")` keeps the familiar `pd.` call
+sites while the real import happens on first attribute access.
+"""
+import importlib
+import sys
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Stand-in for a module that is imported on first attribute access.
+
+    Loading is guarded by a lock, so concurrent Streamlit sessions touching
+    it for the first time import it once. After loading, the real module's
+    attributes are copied in, so later lookups cost the same as on the
+    module itself.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._lazy_lock = threading.Lock()
+        self._lazy_module = None
+
+    def _load(self):
+        module = self._lazy_module
+        if module is None:
+            with self._lazy_lock:
+                module = self._lazy_module
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__.update(module.__dict__)
+                    self._lazy_module = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self._lazy_module is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name):
+    """Return `name` as a module that is only imported when first used.
+
+    Modules that are already imported are returned as they are.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
@@ -0,0 +1,225 @@
+"""In-process latency metrics for database calls and page render blocks.
+
+Database helpers are wrapped with `timed` and render blocks with `span()`.
+Both record the wall time and the number of rows involved into a rolling
+window per name, from which p50/p95/p99 are computed on demand. Metrics are
+shared by every session of the Streamlit process; the Performance page shows
+them and `write_prometheus()` exports them in the Prometheus text format
+(for example for node_exporter's textfile collector).
+"""
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Samples kept per metric for the rolling percentiles
+WINDOW_SIZE = 1024
+
+# Quantiles reported by snapshot() and the Prometheus export
+QUANTILES = (0.5, 0.95, 0.99)
+
+PROMETHEUS_PREFIX = "cost_calculate"
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+class Histogram:
+    """A rolling window of (seconds, rows) samples plus lifetime totals"""
+
+    def __init__(self, name, kind, window=WINDOW_SIZE):
+        self.name = name
+        self.kind = kind
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.total_rows = 0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, rows=0, error=False):
+        with self._lock:
+            self._samples.append((seconds, rows))
+            self.count += 1
+            self.errors += error
+            self.total_seconds += seconds
+            self.total_rows += rows
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self.count = self.errors = self.total_rows = 0
+            self.total_seconds = 0.0
+
+    def stats(self):
+        with self._lock:
+            samples = list(self._samples)
+            stats = {
+                "name": self.name,
+                "kind": self.kind,
+                "count": self.count,
+                "errors": self.errors,
+                "total_seconds": self.total_seconds,
+                "total_rows": self.total_rows,
+            }
+        seconds = sorted(s for s, _ in samples)
+        rows = sorted(r for _, r in samples)
+        for q in QUANTILES:
+            stats[f"p{q * 100:g}_ms"] = _quantile(seconds, q) * 1000
+        stats["max_ms"] = seconds[-1] * 1000 if seconds else 0.0
+        stats["rows_p50"] = _quantile(rows, 0.5)
+        stats["rows_max"] = rows[-1] if rows else 0
+        return stats
+
+
+def _quantile(sorted_values, q):
+    """Linearly interpolated quantile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def get_histogram(name, kind):
+    """Get the histogram for a metric name, creating it on first use"""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.get(name)
+            if histogram is None:
+                histogram = _histograms[name] = Histogram(name, kind)
+    return histogram
+
+
+def count_rows(result):
+    """Rows returned or affected by a database helper, judged from its result"""
+    if result is None:
+        return 0
+    if isinstance(result, bool):
+        return int(result)
+    if isinstance(result, int):
+        # Write helpers return a rowcount
+        return max(result, 0)
+    if isinstance(result, dict):
+        # A single row, or a page of rows such as list_projects()
+        return len(result["projects"]) if "projects" in result else 1
+    try:
+        return len(result)
+    except TypeError:
+        return 1
+
+
+def timed(func=None, *, name=None, kind="db", rows=count_rows):
+    """Record the latency and row count of every call to a function.
+
+    The metric is named `module.function` (without the `utils.` package)
+    unless `name` is given; `rows` maps the result to a row count. Usable
+    bare (`@timed`) or with options (`@timed(kind="compute")`).
+    """
+    def decorator(func):
+        histogram = get_histogram(name or func.__module__.removeprefix("utils.") + "." + func.__qualname__, kind)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                histogram.record(time.perf_counter() - start, error=True)
+                raise
+            histogram.record(time.perf_counter() - start, rows(result))
+            return result
+
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
+
+
+class Span:
+    """Handle yielded by span(); set `rows` to record how much was rendered"""
+    __slots__ = ("rows",)
+
+    def __init__(self):
+        self.rows = 0
+
+
+@contextmanager
+def span(name, kind="render"):
+    """Time a block of code, such as rendering a chart or a table"""
+    histogram = get_histogram(name, kind)
+    handle = Span()
+    start = time.perf_counter()
+    try:
+        yield handle
+    except BaseException:
+        histogram.record(time.perf_counter() - start, handle.rows, error=True)
+        raise
+    histogram.record(time.perf_counter() - start, handle.rows)
+
+
+def snapshot(kind=None):
+    """Stats for every metric with at least one sample, sorted by name"""
+    with _histograms_lock:
+        histograms = list(_histograms.values())
+    return sorted(
+        (h.stats() for h in histograms if h.count and (kind is None or h.kind == kind)),
+        key=lambda s: s["name"]
+    )
+
+
+def reset_metrics():
+    """Drop every sample and counter"""
+    with _histograms_lock:
+        histograms = list(_histograms.values())
+    for histogram in histograms:
+        histogram.clear()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def prometheus_text(prefix=PROMETHEUS_PREFIX):
+    """Render every metric in the Prometheus text exposition format.
+
+    Latencies are a `summary` over the rolling window plus lifetime `_sum`
+    and `_count`; rows and errors are lifetime counters.
+    """
+    stats = snapshot()
+    duration = f"{prefix}_duration_seconds"
+    lines = [
+        f"# HELP {duration} Latency of database calls, render blocks and API requests.",
+        f"# TYPE {duration} summary",
+    ]
+    for s in stats:
+        labels = f'name="{_label(s["name"])}",kind="{_label(s["kind"])}"'
+        for q in QUANTILES:
+            lines.append(f'{duration}{{{labels},quantile="{q:g}"}} {s[f"p{q * 100:g}_ms"] / 1000:.9g}')
+        lines.append(f"{duration}_sum{{{labels}}} {s['total_seconds']:.9g}")
+        lines.append(f"{duration}_count{{{labels}}} {s['count']}")
+
+    for metric, key, help_text in (
+        (f"{prefix}_rows_total", "total_rows", "Rows returned or affected by database calls and rendered by blocks."),
+        (f"{prefix}_errors_total", "errors", "Calls that raised an exception."),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for s in stats:
+            lines.append(f'{metric}{{name="{_label(s["name"])}",kind="{_label(s["kind"])}"}} {s[key]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path, prefix=PROMETHEUS_PREFIX):
+    """Atomically write prometheus_text() to a file; returns the path"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(prometheus_text(prefix))
+    os.replace(tmp_path, path)
+    return path
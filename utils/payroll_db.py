@@ -0,0 +1,283 @@
+from datetime import datetime
+
+from utils import schema
+from utils.cache import cached_query, copy_rows
+from utils.lazy import lazy_import
+from utils.metrics import timed
+from utils.records import FREELANCER_COLUMNS, Freelancer
+from utils.storage import connect, init_once, transaction
+
+pd = lazy_import("pandas")
+
+# Payroll shares one database with projects and the ledger (see utils.schema)
+DB_PATH = schema.DB_PATH
+
+def _copy_frame(df):
+    # Cached frames are shared between sessions; each caller gets a copy
+    return df.copy()
+
+@timed
+def init_db():
+    """Create the database schema or bring it up to date"""
+    schema.migrate(DB_PATH)
+
+@init_once(lambda: DB_PATH)
+def ensure_db():
+    """Run init_db() once per process; pages call this on every rerun"""
+    init_db()
+
+@timed
+def add_freelancer(name, nationality, gross_payment, tax_rate, tax_amount, net_payment, project_id=None):
+    """Add a new freelancer to the database, optionally assigned to a project"""
+    with transaction(DB_PATH) as conn:
+        conn.execute(
+            "INSERT INTO freelancers (name, nationality, gross_payment, tax_rate, tax_amount, net_payment, project_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (name, nationality, gross_payment, tax_rate, tax_amount, net_payment, project_id)
+        )
+
+@timed
+def add_freelancers(rows):
+    """Insert many freelancers in one transaction.
+
+    `rows` are (name, nationality, gross_payment, tax_rate, tax_amount,
+    net_payment) tuples. Returns the number of rows inserted.
+    """
+    with transaction(DB_PATH) as conn:
+        c = conn.executemany(
+            "INSERT INTO freelancers (name, nationality, gross_payment, tax_rate, tax_amount, net_payment) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        return c.rowcount
+
+@timed
+def update_payroll_results(rows):
+    """Write recomputed tax figures for many freelancers in one transaction.
+
+    `rows` are (tax_rate, tax_amount, net_payment, freelancer_id) tuples.
+    Returns the number of rows updated.
+    """
+    with transaction(DB_PATH) as conn:
+        c = conn.executemany(
+            "UPDATE freelancers SET tax_rate = ?, tax_amount = ?, net_payment = ? WHERE id = ?",
+            rows
+        )
+        return c.rowcount
+
+@timed
+def get_payroll_roster():
+    """Get (id, nationality, gross_payment) of every freelancer as a DataFrame.
+
+    Not cached: payroll runs read it inside their write transaction.
+    """
+    with connect(DB_PATH) as conn:
+        return pd.read_sql_query("SELECT id, nationality, gross_payment FROM freelancers ORDER BY id", conn)
+
+@timed
+@cached_query(lambda: DB_PATH, copy=copy_rows)
+def get_tax_rules():
+    """Get every tax bracket as a list of dicts, in the order they were defined"""
+    with connect(DB_PATH) as conn:
+        rows = conn.execute("SELECT residency, min_income, rate FROM tax_rules ORDER BY id").fetchall()
+    return [dict(row) for row in rows]
+
+@timed
+@cached_query(lambda: DB_PATH, copy=copy_rows)
+def get_tax_deductions():
+    """Get every tax deduction as a list of dicts"""
+    with connect(DB_PATH) as conn:
+        rows = conn.execute(
+            "SELECT residency, description, amount FROM tax_deductions ORDER BY residency, id"
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+@timed
+def set_tax_rules(residency, brackets, deductions=()):
+    """Replace the brackets and deductions of one residency.
+
+    `brackets` are (min_income, rate) pairs and `deductions` are
+    (description, amount) pairs.
+    """
+    with transaction(DB_PATH) as conn:
+        conn.execute("DELETE FROM tax_rules WHERE residency = ?", (residency,))
+        conn.execute("DELETE FROM tax_deductions WHERE residency = ?", (residency,))
+        conn.executemany(
+            "INSERT INTO tax_rules (residency, min_income, rate) VALUES (?, ?, ?)",
+            [(residency, min_income, rate) for min_income, rate in brackets]
+        )
+        conn.executemany(
+            "INSERT INTO tax_deductions (residency, description, amount) VALUES (?, ?, ?)",
+            [(residency, description, amount) for description, amount in deductions]
+        )
+
+@timed
+@cached_query(lambda: DB_PATH, copy=_copy_frame)
+def get_all_freelancers():
+    """Retrieve all freelancers from the database, with the name of their project"""
+    with connect(DB_PATH) as conn:
+        df = pd.read_sql_query('''
+            SELECT f.id, f.name, f.nationality, f.gross_payment, f.tax_rate,
+                   f.tax_amount, f.net_payment, p.name AS project
+            FROM freelancers f LEFT JOIN projects p ON p.id = f.project_id
+            ORDER BY f.id
+        ''', conn)
+    if not df.empty:
+        # Format tax_rate as percentage string for display
+        df['tax_rate'] = df['tax_rate'].apply(lambda x: f"{int(x*100)}%")
+    return df
+
+@timed
+def delete_freelancer(freelancer_id):
+    """Delete a freelancer from the database"""
+    with transaction(DB_PATH) as conn:
+        c = conn.execute("DELETE FROM freelancers WHERE id = ?", (freelancer_id,))
+        return c.rowcount > 0  # Returns True if a row was deleted
+
+@timed
+def update_freelancer(freelancer_id, name, nationality, gross_payment, tax_rate, tax_amount, net_payment):
+    """Update an existing freelancer's information"""
+    with transaction(DB_PATH) as conn:
+        c = conn.execute(
+            """UPDATE freelancers
+               SET name = ?, nationality = ?, gross_payment = ?, tax_rate = ?,
+                   tax_amount = ?, net_payment = ?
+               WHERE id = ?""",
+            (name, nationality, gross_payment, tax_rate, tax_amount, net_payment, freelancer_id)
+        )
+        return c.rowcount > 0  # Returns True if a row was updated
+
+@timed
+@cached_query(lambda: DB_PATH)
+def get_freelancer_by_id(freelancer_id):
+    """Get a single freelancer by ID as a Freelancer record, or None"""
+    with connect(DB_PATH) as conn:
+        row = conn.execute(
+            f"SELECT {', '.join(FREELANCER_COLUMNS)} FROM freelancers WHERE id = ?", (freelancer_id,)
+        ).fetchone()
+    return Freelancer(*row) if row is not None else None
+
+@timed
+@cached_query(lambda: DB_PATH, copy=copy_rows)
+def search_freelancers(query="", limit=50):
+    """Find freelancers by id or name for a picker; at most `limit` {"id", "name"} dicts.
+
+    See schema.search_names() for how matches are ordered.
+    """
+    with connect(DB_PATH) as conn:
+        return schema.search_names(conn, "freelancers", query.strip(), limit)
+
+def _check_period(period):
+    """Validate a payroll period in YYYY-MM form"""
+    try:
+        datetime.strptime(period, "%Y-%m")
+    except (TypeError, ValueError):
+        raise ValueError(f"Payroll period must be YYYY-MM, got {period!r}") from None
+    return period
+
+@timed
+def create_payroll_run(period, replace=False):
+    """Snapshot the current roster into a payroll run for `period` (YYYY-MM).
+
+    The lines are copied with a single INSERT ... SELECT and the run's totals
+    are stored on the run, all in one transaction. An existing run for the
+    period raises ValueError unless `replace` is set. Returns the run id.
+    """
+    _check_period(period)
+    with transaction(DB_PATH) as conn:
+        existing = conn.execute("SELECT id FROM payroll_runs WHERE period = ?", (period,)).fetchone()
+        if existing is not None:
+            if not replace:
+                raise ValueError(f"A payroll run for {period} already exists")
+            conn.execute("DELETE FROM payroll_lines WHERE run_id = ?", (existing["id"],))
+            conn.execute("DELETE FROM payroll_runs WHERE id = ?", (existing["id"],))
+
+        run_id = conn.execute("INSERT INTO payroll_runs (period) VALUES (?)", (period,)).lastrowid
+        conn.execute(
+            """INSERT INTO payroll_lines (run_id, freelancer_id, name, nationality,
+                                          gross_payment, tax_rate, tax_amount, net_payment)
+               SELECT ?, id, name, nationality, gross_payment, tax_rate, tax_amount, net_payment
+               FROM freelancers""",
+            (run_id,)
+        )
+        conn.execute(
+            """UPDATE payroll_runs
+               SET (freelancer_count, total_gross, total_tax, total_net) = (
+                   SELECT COUNT(*), COALESCE(SUM(gross_payment), 0),
+                          COALESCE(SUM(tax_amount), 0), COALESCE(SUM(net_payment), 0)
+                   FROM payroll_lines WHERE run_id = ?
+               )
+               WHERE id = ?""",
+            (run_id, run_id)
+        )
+        return run_id
+
+@timed
+def delete_payroll_run(run_id):
+    """Delete a payroll run and its lines"""
+    with transaction(DB_PATH) as conn:
+        conn.execute("DELETE FROM payroll_lines WHERE run_id = ?", (run_id,))
+        c = conn.execute("DELETE FROM payroll_runs WHERE id = ?", (run_id,))
+        return c.rowcount > 0  # Returns True if a run was deleted
+
+def _period_filter(start_period, end_period, column="period"):
+    clauses, params = [], []
+    if start_period is not None:
+        clauses.append(f"{column} >= ?")
+        params.append(_check_period(start_period))
+    if end_period is not None:
+        clauses.append(f"{column} <= ?")
+        params.append(_check_period(end_period))
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+@timed
+@cached_query(lambda: DB_PATH, copy=copy_rows)
+def get_payroll_runs(start_period=None, end_period=None):
+    """Per-period totals of every payroll run, oldest first, as a list of dicts"""
+    where, params = _period_filter(start_period, end_period)
+    with connect(DB_PATH) as conn:
+        rows = conn.execute(
+            f"""SELECT id, period, created_at, freelancer_count, total_gross, total_tax, total_net
+                FROM payroll_runs{where} ORDER BY period""",
+            params
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+@timed
+@cached_query(lambda: DB_PATH, copy=_copy_frame)
+def get_payroll_lines(run_id):
+    """Every line of one payroll run as a DataFrame"""
+    with connect(DB_PATH) as conn:
+        return pd.read_sql_query(
+            "SELECT * FROM payroll_lines WHERE run_id = ? ORDER BY freelancer_id", conn, params=(run_id,)
+        )
+
+@timed
+@cached_query(lambda: DB_PATH, copy=_copy_frame)
+def get_freelancer_payroll_totals(start_period=None, end_period=None):
+    """Per-freelancer totals across the payroll runs in a period range, as a DataFrame"""
+    where, params = _period_filter(start_period, end_period, "r.period")
+    with connect(DB_PATH) as conn:
+        return pd.read_sql_query(
+            f"""SELECT l.freelancer_id, MAX(l.name) AS name, COUNT(*) AS runs,
+                       SUM(l.gross_payment) AS total_gross, SUM(l.tax_amount) AS total_tax,
+                       SUM(l.net_payment) AS total_net
+                FROM payroll_runs r
+                JOIN payroll_lines l ON l.run_id = r.id{where}
+                GROUP BY l.freelancer_id
+                ORDER BY total_gross DESC""",
+            conn, params=params
+        )
+
+@timed
+@cached_query(lambda: DB_PATH, copy=copy_rows)
+def get_freelancer_payroll_history(freelancer_id):
+    """One freelancer's line in every payroll run, oldest first, as a list of dicts"""
+    with connect(DB_PATH) as conn:
+        rows = conn.execute(
+            """SELECT r.period, l.gross_payment, l.tax_rate, l.tax_amount, l.net_payment
+               FROM payroll_lines l
+               JOIN payroll_runs r ON r.id = l.run_id
+               WHERE l.freelancer_id = ?
+               ORDER BY r.period""",
+            (freelancer_id,)
+        ).fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,142 @@
+"""Vectorized payroll engine driven by the tax rules in the payroll database.
+
+Tax brackets and deductions are read from the `tax_rules` and
+`tax_deductions` tables and compiled into sorted NumPy arrays per
+residency, so gross, tax and net pay for any number of freelancers are
+computed with one binary search per row instead of Python loops.
+"""
+from utils import payroll_db
+from utils.cache import cached_query
+from utils.lazy import lazy_import
+from utils.metrics import timed
+from utils.storage import transaction
+
+np = lazy_import("numpy")
+
+# Effective tax rates are stored to basis-point precision
+RATE_DECIMALS = 4
+
+
+class TaxTable:
+    """Tax rules compiled into per-residency lookup arrays.
+
+    For each residency, `floors` holds the sorted lower bound of every
+    bracket, `rates` the marginal rate inside it and `base` the tax owed on
+    all income below the bracket, so the tax on an income is
+    `base[i] + (income - floors[i]) * rates[i]` for the bracket `i` found by
+    binary search.
+    """
+
+    def __init__(self, rules, deductions=()):
+        brackets = {}
+        for rule in rules:
+            brackets.setdefault(rule["residency"], []).append((float(rule["min_income"]), float(rule["rate"])))
+        allowances = {}
+        for deduction in deductions:
+            allowances[deduction["residency"]] = allowances.get(deduction["residency"], 0.0) + float(deduction["amount"])
+
+        # Residencies keep the order their rules were defined in
+        self.residencies = tuple(brackets)
+        self._tables = {}
+        for residency, rows in brackets.items():
+            rows.sort()
+            if rows[0][0] > 0:
+                # Income below the first bracket is untaxed
+                rows.insert(0, (0.0, 0.0))
+            floors = np.array([floor for floor, _ in rows])
+            rates = np.array([rate for _, rate in rows])
+            base = np.concatenate(([0.0], np.cumsum(np.diff(floors) * rates[:-1])))
+            self._tables[residency] = (floors, rates, base, allowances.get(residency, 0.0))
+
+    def compute(self, residencies, gross_payments):
+        """Compute tax for parallel arrays of residencies and gross payments.
+
+        Returns a dict of float64 arrays: `gross_payment`, `taxable_income`,
+        `tax_amount`, `net_payment` and the effective `tax_rate`. Raises
+        ValueError for a residency without rules.
+        """
+        residencies = np.asarray(residencies, dtype=object)
+        gross = np.asarray(gross_payments, dtype=np.float64)
+        taxable = np.zeros_like(gross)
+        tax = np.zeros_like(gross)
+
+        unknown = set(residencies.tolist()) - set(self._tables)
+        if unknown:
+            raise ValueError(f"No tax rules for residency: {', '.join(sorted(map(str, unknown)))}")
+
+        for residency, (floors, rates, base, allowance) in self._tables.items():
+            rows = residencies == residency
+            if not rows.any():
+                continue
+            income = np.maximum(gross[rows] - allowance, 0.0)
+            bracket = np.searchsorted(floors, income, side="right") - 1
+            taxable[rows] = income
+            tax[rows] = base[bracket] + (income - floors[bracket]) * rates[bracket]
+
+        tax_rate = np.divide(tax, gross, out=np.zeros_like(gross), where=gross > 0)
+        return {
+            "gross_payment": gross,
+            "taxable_income": taxable,
+            "tax_amount": tax,
+            "net_payment": gross - tax,
+            "tax_rate": np.round(tax_rate, RATE_DECIMALS),
+        }
+
+
+@timed
+@cached_query(lambda: payroll_db.DB_PATH)
+def load_tax_table():
+    """Compile the current tax rules; cached until the payroll database changes"""
+    return TaxTable(payroll_db.get_tax_rules(), payroll_db.get_tax_deductions())
+
+
+def calculate_tax(nationality, gross_payment, tax_table=None):
+    """Return (tax_rate, tax_amount, net_payment) for a single payment"""
+    result = (tax_table or load_tax_table()).compute([nationality], [gross_payment])
+    return (
+        float(result["tax_rate"][0]),
+        float(result["tax_amount"][0]),
+        float(result["net_payment"][0]),
+    )
+
+
+@timed(rows=lambda run: run["freelancers"])
+def run_payroll(new_freelancers=(), tax_table=None, period=None, replace=False):
+    """Recompute tax and net pay for every freelancer in one transaction.
+
+    `new_freelancers` are optional (name, nationality, gross_payment) tuples
+    added in the same transaction. All rows are computed in one vectorized
+    pass with the current tax rules. With a `period` (YYYY-MM) the results
+    are also snapshotted into a payroll run, see
+    payroll_db.create_payroll_run(). Returns totals for the run.
+    """
+    tax_table = tax_table or load_tax_table()
+    new_freelancers = list(new_freelancers)
+
+    with transaction(payroll_db.DB_PATH):
+        roster = payroll_db.get_payroll_roster()
+        residencies = roster["nationality"].tolist() + [row[1] for row in new_freelancers]
+        gross = np.concatenate([
+            roster["gross_payment"].to_numpy(dtype=np.float64),
+            np.array([row[2] for row in new_freelancers], dtype=np.float64),
+        ])
+        result = tax_table.compute(residencies, gross)
+        columns = [result[name].tolist() for name in ("tax_rate", "tax_amount", "net_payment")]
+
+        existing = len(roster)
+        payroll_db.update_payroll_results(zip(*(c[:existing] for c in columns), roster["id"].tolist()))
+        if new_freelancers:
+            payroll_db.add_freelancers(
+                (name, nationality, float(payment), *figures)
+                for (name, nationality, payment), *figures in zip(new_freelancers, *(c[existing:] for c in columns))
+            )
+        run_id = payroll_db.create_payroll_run(period, replace=replace) if period is not None else None
+
+    return {
+        "run_id": run_id,
+        "freelancers": len(gross),
+        "added": len(new_freelancers),
+        "total_gross": float(gross.sum()),
+        "total_tax": float(result["tax_amount"].sum()),
+        "total_net": float(result["net_payment"].sum()),
+    }
@@ -0,0 +1,55 @@
+"""Searchable pickers for projects and freelancers.
+
+A plain selectbox over every record sends all of them to the browser and
+formats each one on every rerun. These pickers instead ask the database for
+the top matches of what was typed (project_db.search_projects,
+payroll_db.search_freelancers) and index just those options by id, so a
+rerun costs the same with a hundred records or a hundred thousand.
+"""
+import streamlit as st
+
+from utils.payroll_db import search_freelancers
+from utils.project_db import search_projects
+
+# Options offered at a time; type more of a name to narrow them down
+PICKER_SIZE = 50
+
+
+def record_picker(label, search, key, format_label, default=None, none_label=None, limit=PICKER_SIZE):
+    """A search box and a selectbox of the best matches; returns the selected id.
+
+    `search(query, limit)` returns {"id", "name"} dicts, best first.
+    `default` lists the records offered before anything is typed (otherwise
+    the first matches of an empty search). `format_label(id, name)` gives
+    the option text. With `none_label`, None is offered first under that
+    label. Must not be used inside st.form, where typing does not rerun.
+    """
+    query = st.text_input(label, key=f"{key}_query", placeholder="Type a name or ID").strip()
+    matches = default if default is not None and not query else search(query, limit)
+
+    # id -> name of the offered records; formatting an option is one lookup
+    names = {record["id"]: record["name"] for record in matches}
+    options = ([None] if none_label is not None else []) + list(names)
+    if not options:
+        st.caption(f"No matches for '{query}'.")
+        return None
+    return st.selectbox(
+        label, options, key=key, label_visibility="collapsed",
+        format_func=lambda x: none_label if x is None else format_label(x, names[x])
+    )
+
+
+def project_picker(label, key, default=None, none_label=None):
+    """Pick a saved project by name or ID"""
+    return record_picker(
+        label, search_projects, key, lambda project_id, name: f"ID {project_id}: {name}",
+        default=default, none_label=none_label
+    )
+
+
+def freelancer_picker(label, key, none_label=None):
+    """Pick a freelancer by name or ID"""
+    return record_picker(
+        label, search_freelancers, key, lambda freelancer_id, name: f"{freelancer_id} - {name}",
+        none_label=none_label
+    )
@@ -0,0 +1,220 @@
+import functools
+
+from utils.calc import ALLOCATION_FIELDS, QuoteInputs
+from utils.lazy import lazy_import
+from utils.records import RecordTable
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# Allocation columns in the projects table (shared with the single-quote
+# calculator in utils.calc) and the budget columns derived from them
+ALLOCATION_COLUMNS = list(ALLOCATION_FIELDS)
+BUDGET_COLUMNS = [
+    "freelancer_budget",
+    "internal_staff_budget",
+    "tech_infra_budget",
+    "admin_budget",
+]
+# Project columns the derived figures depend on, with the calculator's
+# defaults for deals that leave some of them out
+INPUT_COLUMNS = [
+    "upfront_payment",
+    "monthly_maintenance",
+    "maintenance_months",
+    "other_revenue",
+    "target_margin",
+    *ALLOCATION_COLUMNS,
+]
+INPUT_DEFAULTS = {name: float(getattr(QuoteInputs(), name)) for name in INPUT_COLUMNS}
+DERIVED_COLUMNS = [
+    "total_revenue",
+    "available_budget",
+    *BUDGET_COLUMNS,
+    "total_expenses",
+    "expected_profit",
+    "actual_margin_pct",
+]
+
+# Target margins evaluated by the sensitivity grid (same range as the slider)
+SENSITIVITY_MARGINS = tuple(range(0, 95, 5))
+
+# Ranges of the deal inputs that the Cost Calculator's widgets allow; None
+# leaves the top open
+INPUT_LIMITS = {
+    "upfront_payment": (0, None),
+    "monthly_maintenance": (0, None),
+    "maintenance_months": (0, None),
+    "other_revenue": (0, None),
+    "target_margin": (0, SENSITIVITY_MARGINS[-1]),
+    **{name: (0, 100) for name in ALLOCATION_COLUMNS},
+}
+# Rounding slack when checking that allocations add up to 100%
+ALLOCATION_TOLERANCE = 1e-6
+
+def _column(projects, name):
+    """Get a column from the input as a float64 array"""
+    return np.asarray(projects[name], dtype=np.float64)
+
+def compute_arrays(projects):
+    """Compute every derived figure for a batch of projects in one pass.
+
+    `projects` is anything indexable by the projects table column names
+    (a DataFrame, a RecordTable or a dict of NumPy arrays). Returns a dict of arrays keyed by
+    DERIVED_COLUMNS, in the same row order as the input.
+    """
+    total_revenue = (
+        _column(projects, "upfront_payment")
+        + _column(projects, "monthly_maintenance") * _column(projects, "maintenance_months")
+        + _column(projects, "other_revenue")
+    )
+
+    # Available budget is only defined for projects that bring in revenue
+    margin = _column(projects, "target_margin")
+    available_budget = np.where(total_revenue > 0, total_revenue * (1 - margin / 100), 0.0)
+
+    allocations = np.column_stack([_column(projects, c) for c in ALLOCATION_COLUMNS])
+    budgets = available_budget[:, None] * (allocations / 100)
+
+    total_expenses = budgets.sum(axis=1)
+    expected_profit = total_revenue - total_expenses
+    actual_margin_pct = np.divide(
+        expected_profit * 100, total_revenue,
+        out=np.zeros_like(total_revenue), where=total_revenue > 0
+    )
+
+    result = {
+        "total_revenue": total_revenue,
+        "available_budget": available_budget,
+        "total_expenses": total_expenses,
+        "expected_profit": expected_profit,
+        "actual_margin_pct": actual_margin_pct,
+    }
+    for i, name in enumerate(BUDGET_COLUMNS):
+        result[name] = budgets[:, i]
+    return result
+
+def deal_problems(projects):
+    """Check deal inputs against the Cost Calculator's rules.
+
+    `projects` is anything compute_arrays() accepts (or a mapping of single
+    numbers), with finite values. Returns one (mask, message) pair per rule, the mask
+    flagging the deals that break it: values outside INPUT_LIMITS,
+    fractional maintenance months and allocations that do not add up to
+    100%. The page, the HTTP API and utils.quotes all validate deals here.
+    """
+    problems = []
+    for name, (low, high) in INPUT_LIMITS.items():
+        values = _column(projects, name)
+        if high is None:
+            problems.append((values < low, f"{name} must be at least {low}"))
+        else:
+            problems.append(((values < low) | (values > high), f"{name} must be between {low} and {high}"))
+    months = _column(projects, "maintenance_months")
+    problems.append((months != np.round(months), "maintenance_months must be a whole number"))
+    total_allocation = sum(_column(projects, name) for name in ALLOCATION_COLUMNS)
+    problems.append((abs(total_allocation - 100) > ALLOCATION_TOLERANCE, "The allocations must add up to 100%"))
+    return problems
+
+def deal_errors(deal):
+    """The messages of the deal_problems() rules one deal breaks.
+
+    `deal` maps INPUT_COLUMNS to numbers; missing ones take INPUT_DEFAULTS.
+    """
+    values = {name: deal.get(name, INPUT_DEFAULTS[name]) for name in INPUT_COLUMNS}
+    return [message for broken, message in deal_problems(values) if broken]
+
+def compute_portfolio(projects):
+    """Return the projects as a DataFrame with all derived figures added.
+
+    Accepts a DataFrame, a RecordTable, a dict of column arrays or a list of
+    project dicts.
+    """
+    if isinstance(projects, RecordTable):
+        # Hand pandas whole columns instead of one object per row
+        projects = projects.to_columns()
+    df = projects if isinstance(projects, pd.DataFrame) else pd.DataFrame(projects)
+    if df.empty:
+        return df.reindex(columns=[*df.columns, *DERIVED_COLUMNS])
+    derived = compute_arrays(df)
+    return df.assign(**{name: derived[name] for name in DERIVED_COLUMNS})
+
+def summarize_portfolio(portfolio):
+    """Aggregate a computed portfolio into totals for reporting"""
+    total_revenue = float(portfolio["total_revenue"].sum()) if len(portfolio) else 0.0
+    total_expenses = float(portfolio["total_expenses"].sum()) if len(portfolio) else 0.0
+    total_profit = total_revenue - total_expenses
+    return {
+        "project_count": len(portfolio),
+        "total_revenue": total_revenue,
+        "total_expenses": total_expenses,
+        "total_profit": total_profit,
+        "weighted_margin_pct": (total_profit / total_revenue * 100) if total_revenue > 0 else 0.0,
+    }
+
+def allocation_mixes(step=5):
+    """Every allocation mix over the four categories that sums to 100%.
+
+    `step` is the granularity in percentage points and must divide 100.
+    Returns a (mixes, 4) array in ALLOCATION_COLUMNS order.
+    """
+    if step <= 0 or 100 % step:
+        raise ValueError(f"Allocation step must divide 100, got {step}")
+    levels = np.arange(0, 101, step)
+    a, b, c = np.meshgrid(levels, levels, levels, indexing="ij")
+    d = 100 - a - b - c
+    valid = d >= 0
+    return np.column_stack([a[valid], b[valid], c[valid], d[valid]]).astype(np.float64)
+
+@functools.lru_cache(maxsize=32)
+def sensitivity_grid(total_revenue, step=5, margins=SENSITIVITY_MARGINS):
+    """Evaluate every (target margin, allocation mix) pair for one deal.
+
+    Results are cached per input and returned as read-only arrays:
+    `margins` (m,), `mixes` (k, 4), `budgets` (m, k, 4) in BUDGET_COLUMNS
+    order, and `expected_profit` and `actual_margin_pct` (m, k).
+    """
+    margin_values = np.asarray(margins, dtype=np.float64)
+    mixes = allocation_mixes(step)
+
+    if total_revenue > 0:
+        available_budget = total_revenue * (1 - margin_values / 100)
+    else:
+        available_budget = np.zeros_like(margin_values)
+    budgets = available_budget[:, None, None] * (mixes[None, :, :] / 100)
+    expected_profit = total_revenue - budgets.sum(axis=2)
+    actual_margin_pct = (
+        expected_profit * 100 / total_revenue if total_revenue > 0 else np.zeros_like(expected_profit)
+    )
+
+    grid = {
+        "margins": margin_values,
+        "mixes": mixes,
+        "budgets": budgets,
+        "expected_profit": expected_profit,
+        "actual_margin_pct": actual_margin_pct,
+    }
+    # Cached arrays are shared between callers
+    for array in grid.values():
+        array.setflags(write=False)
+    return grid
+
+@functools.lru_cache(maxsize=32)
+def sensitivity_table(total_revenue, step=5, margins=SENSITIVITY_MARGINS):
+    """The sensitivity grid as a long DataFrame, one row per combination.
+
+    Cached per input; callers must not modify the returned frame.
+    """
+    grid = sensitivity_grid(total_revenue, step, margins)
+    n_margins, n_mixes = grid["expected_profit"].shape
+
+    columns = {"target_margin": np.repeat(grid["margins"], n_mixes)}
+    tiled_mixes = np.tile(grid["mixes"], (n_margins, 1))
+    for i, name in enumerate(ALLOCATION_COLUMNS):
+        columns[name] = tiled_mixes[:, i]
+    flat_budgets = grid["budgets"].reshape(-1, len(BUDGET_COLUMNS))
+    for i, name in enumerate(BUDGET_COLUMNS):
+        columns[name] = flat_budgets[:, i]
+    columns["expected_profit"] = grid["expected_profit"].ravel()
+    columns["actual_margin_pct"] = grid["actual_margin_pct"].ravel()
+    return pd.DataFrame(columns)
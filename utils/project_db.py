@@ -1,142 +1,244 @@
-import sqlite3
-import os
-import pandas as pd
 from datetime import datetime
 
-# Database path
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'project_costs.db')
+from utils import schema
+from utils.cache import cached_query, copy_rows
+from utils.metrics import timed
+from utils.records import PROJECT_COLUMNS, Project, RecordTable
+from utils.schema import TOTAL_REVENUE_SQL, search_names
+from utils.storage import connect, init_once, transaction
 
-# Ensure data directory exists
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+# Projects share one database with the ledger and payroll (see utils.schema)
+DB_PATH = schema.DB_PATH
 
+# Columns selected for Project records, in field order
+_PROJECT_SELECT = ", ".join(PROJECT_COLUMNS)
+
+# Columns written by save_projects(), in the order of its row tuples
+PROJECT_INSERT_COLUMNS = PROJECT_COLUMNS[1:]
+
+# Sortable columns for list_projects, each backed by an index on (key, id)
+PROJECT_SORT_KEYS = {
+    "created_at": "created_at",
+    "name": "name",
+    "target_margin": "target_margin",
+    "total_revenue": f"({TOTAL_REVENUE_SQL})",
+}
+
+@timed
 def init_db():
-    """Initialize the database schema if it doesn't exist"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Create projects table if not exists
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS projects (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        upfront_payment REAL NOT NULL,
-        monthly_maintenance REAL NOT NULL,
-        maintenance_months INTEGER NOT NULL,
-        other_revenue REAL NOT NULL,
-        target_margin REAL NOT NULL,
-        freelancer_allocation REAL NOT NULL,
-        internal_staff_allocation REAL NOT NULL,
-        tech_infra_allocation REAL NOT NULL,
-        admin_allocation REAL NOT NULL,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """Create the database schema or bring it up to date"""
+    schema.migrate(DB_PATH)
 
+@init_once(lambda: DB_PATH)
+def ensure_db():
+    """Run init_db() once per process; pages call this on every rerun"""
+    init_db()
+
+@timed
 def save_project(project_data):
     """Save a project to the database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    INSERT INTO projects (
-        name, upfront_payment, monthly_maintenance, maintenance_months, 
-        other_revenue, target_margin, freelancer_allocation, 
-        internal_staff_allocation, tech_infra_allocation, admin_allocation
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        project_data["name"],
-        project_data["upfront_payment"],
-        project_data["monthly_maintenance"],
-        project_data["maintenance_months"],
-        project_data["other_revenue"],
-        project_data["target_margin"],
-        project_data["freelancer_allocation"],
-        project_data["internal_staff_allocation"],
-        project_data["tech_infra_allocation"],
-        project_data["admin_allocation"]
-    ))
-    
-    conn.commit()
-    last_id = cursor.lastrowid
-    conn.close()
-    return last_id
+    with transaction(DB_PATH) as conn:
+        cursor = conn.execute('''
+        INSERT INTO projects (
+            name, upfront_payment, monthly_maintenance, maintenance_months,
+            other_revenue, target_margin, freelancer_allocation,
+            internal_staff_allocation, tech_infra_allocation, admin_allocation
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            project_data["name"],
+            project_data["upfront_payment"],
+            project_data["monthly_maintenance"],
+            project_data["maintenance_months"],
+            project_data["other_revenue"],
+            project_data["target_margin"],
+            project_data["freelancer_allocation"],
+            project_data["internal_staff_allocation"],
+            project_data["tech_infra_allocation"],
+            project_data["admin_allocation"]
+        ))
+        return cursor.lastrowid
+
+@timed
+def save_projects(rows):
+    """Save many projects in a single transaction.
+
+    `rows` is a sequence of tuples in PROJECT_INSERT_COLUMNS order; a None
+    `created_at` means now. Returns the number of rows inserted.
+    """
+    with transaction(DB_PATH) as conn:
+        cursor = conn.executemany(f'''
+            INSERT INTO projects ({", ".join(PROJECT_INSERT_COLUMNS)})
+            VALUES ({", ".join("?" for _ in PROJECT_INSERT_COLUMNS[:-1])}, COALESCE(?, CURRENT_TIMESTAMP))
+        ''', rows)
+        return cursor.rowcount
 
+@timed
+@cached_query(lambda: DB_PATH)
 def get_all_projects():
-    """Retrieve all projects from database"""
-    conn = sqlite3.connect(DB_PATH)
-    
-    # Use pandas to read from SQLite
-    df = pd.read_sql_query("SELECT * FROM projects ORDER BY created_at DESC", conn)
-    conn.close()
-    
-    if df.empty:
-        return []
-    
-    # Convert DataFrame to list of dictionaries
-    projects = df.to_dict('records')
-    return projects
+    """Retrieve all projects, newest first, as a RecordTable of Project records"""
+    with connect(DB_PATH) as conn:
+        rows = conn.execute(f"SELECT {_PROJECT_SELECT} FROM projects ORDER BY created_at DESC").fetchall()
+    return RecordTable.from_rows(Project, rows)
+
+@timed
+@cached_query(lambda: DB_PATH, copy=dict)
+def list_projects(limit=25, cursor=None, sort_by="created_at", descending=True,
+                  name=None, min_margin=None, max_margin=None,
+                  min_revenue=None, max_revenue=None):
+    """Retrieve one page of projects using keyset pagination.
+
+    `cursor` is the `next_cursor` value from the previous page (a
+    `(sort_value, id)` pair). Returns a dict with the page of `projects` (a
+    RecordTable) and the `next_cursor`, which is None on the last page.
+    """
+    if sort_by not in PROJECT_SORT_KEYS:
+        raise ValueError(f"Cannot sort projects by {sort_by!r}")
+    sort_expr = PROJECT_SORT_KEYS[sort_by]
+
+    query = f"SELECT {_PROJECT_SELECT}, {sort_expr} AS sort_key FROM projects WHERE 1=1"
+    params = []
+
+    if name:
+        query += " AND name LIKE ? ESCAPE '\\'"
+        escaped = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%{escaped}%")
+    if min_margin is not None:
+        query += " AND target_margin >= ?"
+        params.append(min_margin)
+    if max_margin is not None:
+        query += " AND target_margin <= ?"
+        params.append(max_margin)
+    if min_revenue is not None:
+        query += f" AND ({TOTAL_REVENUE_SQL}) >= ?"
+        params.append(min_revenue)
+    if max_revenue is not None:
+        query += f" AND ({TOTAL_REVENUE_SQL}) <= ?"
+        params.append(max_revenue)
+
+    # Seek past the last row of the previous page instead of using OFFSET
+    if cursor is not None:
+        query += f" AND ({sort_expr}, id) {'<' if descending else '>'} (?, ?)"
+        params.extend(cursor)
 
+    order = "DESC" if descending else "ASC"
+    query += f" ORDER BY {sort_expr} {order}, id {order} LIMIT ?"
+    # Fetch one extra row to learn whether another page exists
+    params.append(limit + 1)
+
+    with connect(DB_PATH) as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = (last["sort_key"], last["id"])
+    projects = RecordTable.from_rows(Project, [row[:-1] for row in rows[:limit]])
+
+    return {"projects": projects, "next_cursor": next_cursor}
+
+@timed
+@cached_query(lambda: DB_PATH)
 def get_project_by_id(project_id):
-    """Retrieve a specific project by ID"""
-    conn = sqlite3.connect(DB_PATH)
-    
-    query = "SELECT * FROM projects WHERE id = ?"
-    df = pd.read_sql_query(query, conn, params=[project_id])
-    conn.close()
-    
-    if df.empty:
-        return None
-    
-    return df.iloc[0].to_dict()
+    """Retrieve a specific project by ID as a Project record, or None"""
+    with connect(DB_PATH) as conn:
+        row = conn.execute(f"SELECT {_PROJECT_SELECT} FROM projects WHERE id = ?", (project_id,)).fetchone()
+    return Project(*row) if row is not None else None
+
+@timed
+@cached_query(lambda: DB_PATH, copy=copy_rows)
+def search_projects(query="", limit=50):
+    """Find projects by id or name for a picker; at most `limit` {"id", "name"} dicts.
 
+    See schema.search_names() for how matches are ordered.
+    """
+    with connect(DB_PATH) as conn:
+        return search_names(conn, "projects", query.strip(), limit)
+
+@timed
 def update_project(project_id, project_data):
     """Update an existing project"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    UPDATE projects SET
-        name = ?, 
-        upfront_payment = ?, 
-        monthly_maintenance = ?, 
-        maintenance_months = ?, 
-        other_revenue = ?, 
-        target_margin = ?, 
-        freelancer_allocation = ?, 
-        internal_staff_allocation = ?, 
-        tech_infra_allocation = ?, 
-        admin_allocation = ?
-    WHERE id = ?
-    ''', (
-        project_data["name"],
-        project_data["upfront_payment"],
-        project_data["monthly_maintenance"],
-        project_data["maintenance_months"],
-        project_data["other_revenue"],
-        project_data["target_margin"],
-        project_data["freelancer_allocation"],
-        project_data["internal_staff_allocation"],
-        project_data["tech_infra_allocation"],
-        project_data["admin_allocation"],
-        project_id
-    ))
-    
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    with transaction(DB_PATH) as conn:
+        cursor = conn.execute('''
+        UPDATE projects SET
+            name = ?,
+            upfront_payment = ?,
+            monthly_maintenance = ?,
+            maintenance_months = ?,
+            other_revenue = ?,
+            target_margin = ?,
+            freelancer_allocation = ?,
+            internal_staff_allocation = ?,
+            tech_infra_allocation = ?,
+            admin_allocation = ?
+        WHERE id = ?
+        ''', (
+            project_data["name"],
+            project_data["upfront_payment"],
+            project_data["monthly_maintenance"],
+            project_data["maintenance_months"],
+            project_data["other_revenue"],
+            project_data["target_margin"],
+            project_data["freelancer_allocation"],
+            project_data["internal_staff_allocation"],
+            project_data["tech_infra_allocation"],
+            project_data["admin_allocation"],
+            project_id
+        ))
+        return cursor.rowcount > 0
 
+@timed
 def delete_project(project_id):
-    """Delete a project from the database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("DELETE FROM projects WHERE id = ?", (project_id,))
-    
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    """Delete a project from the database.
+
+    Transactions booked to it and freelancers assigned to it are kept and
+    become unassigned.
+    """
+    with transaction(DB_PATH) as conn:
+        cursor = conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+        conn.execute("UPDATE transactions SET project_id = NULL WHERE project_id = ?", (project_id,))
+        conn.execute("UPDATE freelancers SET project_id = NULL WHERE project_id = ?", (project_id,))
+        return cursor.rowcount > 0
+
+@timed
+@cached_query(lambda: DB_PATH, copy=copy_rows)
+def get_project_actuals(project_ids=None):
+    """Planned revenue of each project next to its booked ledger and payroll totals.
+
+    Joins projects with the transactions booked to them and the freelancers
+    assigned to them in one query. Returns a list of dicts with the project
+    `id` and `name`, `planned_revenue`, `actual_income`, `actual_expense`
+    (both in VND), `freelancer_count`, `freelancer_gross` and
+    `freelancer_net`, for every project or only those in `project_ids`.
+    """
+    query = f'''
+        SELECT p.id, p.name, {TOTAL_REVENUE_SQL} AS planned_revenue,
+               COALESCE(l.income, 0) AS actual_income,
+               COALESCE(l.expense, 0) AS actual_expense,
+               COALESCE(f.freelancer_count, 0) AS freelancer_count,
+               COALESCE(f.gross, 0) AS freelancer_gross,
+               COALESCE(f.net, 0) AS freelancer_net
+        FROM projects p
+        LEFT JOIN (
+            SELECT project_id,
+                   SUM(CASE WHEN type = 'Income' THEN vnd_amount ELSE 0 END) AS income,
+                   SUM(CASE WHEN type = 'Expense' THEN vnd_amount ELSE 0 END) AS expense
+            FROM transactions WHERE project_id IS NOT NULL
+            GROUP BY project_id
+        ) l ON l.project_id = p.id
+        LEFT JOIN (
+            SELECT project_id, COUNT(*) AS freelancer_count,
+                   SUM(gross_payment) AS gross, SUM(net_payment) AS net
+            FROM freelancers WHERE project_id IS NOT NULL
+            GROUP BY project_id
+        ) f ON f.project_id = p.id
+    '''
+    params = []
+    if project_ids is not None:
+        project_ids = list(project_ids)
+        query += f" WHERE p.id IN ({', '.join('?' for _ in project_ids)})"
+        params.extend(project_ids)
+    query += " ORDER BY p.id"
+
+    with connect(DB_PATH) as conn:
+        rows = conn.execute(query, params).fetchall()
+    return [dict(row) for row in rows]
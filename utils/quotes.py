@@ -0,0 +1,273 @@
+"""Batch quoting of deal files through the profitability engine.
+
+Deals are read in chunks from a CSV, JSONL or Parquet file with the columns
+of the projects table, priced with the same math as the Cost Calculator
+(profitability.compute_arrays) and written out chunk by chunk, so memory
+stays flat however large the file is. Input columns that are missing, or
+empty for a deal, take the calculator's defaults; other columns are passed
+through to the output. Usage:
+
+    python -m utils.quotes deals.csv --output quotes.parquet --save --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import project_db
+from utils.ingest import FORMATS, RowError, detect_format
+from utils.lazy import lazy_import
+from utils.profitability import DERIVED_COLUMNS, INPUT_COLUMNS, INPUT_DEFAULTS, compute_arrays, deal_problems
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+DEFAULT_CHUNK_SIZE = 50_000
+# Chunks in flight per worker process; bounds memory when quoting in parallel
+CHUNKS_PER_WORKER = 2
+
+
+def read_chunks(path, file_format=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream an input file as DataFrames of at most `chunk_size` deals"""
+    file_format = file_format or detect_format(path)
+    if file_format == "csv":
+        with pd.read_csv(path, chunksize=chunk_size, dtype={"name": str, "created_at": str}) as reader:
+            yield from reader
+    elif file_format == "jsonl":
+        with pd.read_json(path, lines=True, chunksize=chunk_size, dtype={"name": str, "created_at": str}) as reader:
+            yield from reader
+    else:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Reading Parquet files requires pyarrow: pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+
+
+def quote_chunk(deals, first_row=1, skip_invalid=False, require_name=False):
+    """Validate a DataFrame of deals and add their DERIVED_COLUMNS.
+
+    A deal is invalid unless its inputs are numbers that pass
+    profitability.deal_problems(), the rules the Cost Calculator and the
+    HTTP API apply. Returns (quotes, skipped): the valid deals with their
+    inputs filled in and figures added, and how many invalid deals were
+    dropped. Without `skip_invalid` the first invalid deal raises RowError;
+    `first_row` is the row number of the first deal in the file.
+    """
+    count = len(deals)
+    columns = {}
+    problems = []
+    for name in INPUT_COLUMNS:
+        if name not in deals:
+            columns[name] = np.full(count, INPUT_DEFAULTS[name])
+            continue
+        raw = deals[name]
+        values = pd.to_numeric(raw, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+        missing = raw.isna().to_numpy()
+        values[missing] = INPUT_DEFAULTS[name]
+        problems.append((~np.isfinite(values), f"{name} must be a number"))
+        columns[name] = values
+    # The Cost Calculator's rules, checked after the numbers so a deal that is
+    # not a number is reported as such
+    problems.extend(deal_problems(columns))
+    if require_name:
+        if "name" not in deals:
+            raise ValueError("Saving deals needs a name column")
+        names = deals["name"]
+        problems.append(((names.isna() | (names.astype(str).str.strip() == "")).to_numpy(), "name is required"))
+
+    invalid = np.zeros(count, dtype=bool)
+    for mask, _ in problems:
+        invalid |= mask
+    if invalid.any():
+        if not skip_invalid:
+            row = int(np.flatnonzero(invalid)[0])
+            message = next(message for mask, message in problems if mask[row])
+            raise RowError(first_row + row, message)
+        keep = ~invalid
+        deals = deals[keep]
+        columns = {name: values[keep] for name, values in columns.items()}
+
+    figures = compute_arrays(columns)
+    quotes = deals.reset_index(drop=True).assign(**columns, **{name: figures[name] for name in DERIVED_COLUMNS})
+    quotes["maintenance_months"] = quotes["maintenance_months"].astype(np.int64)
+    return quotes, int(invalid.sum())
+
+
+def output_columns(deals):
+    """The columns quote_chunk() returns for a chunk with the columns of `deals`"""
+    added = [name for name in (*INPUT_COLUMNS, *DERIVED_COLUMNS) if name not in deals.columns]
+    return list(deals.columns) + added
+
+
+def _passthrough_as_text(quotes):
+    """Pass-through columns as strings, so Parquet sees the same type in every chunk.
+
+    Columns of CSV and JSONL input get their type from each chunk's values;
+    a column empty in the first chunk and text in a later one would not fit
+    the Parquet schema taken from the first chunk.
+    """
+    computed = {"name", "created_at", *INPUT_COLUMNS, *DERIVED_COLUMNS}
+    return quotes.astype({name: "string" for name in quotes.columns if name not in computed})
+
+
+def _encode(quotes, file_format, header):
+    """Serialize a chunk of quotes for a text output format"""
+    if file_format == "csv":
+        return quotes.to_csv(index=False, header=header).encode("utf-8")
+    text = quotes.to_json(orient="records", lines=True)
+    return (text if text.endswith("\n") else text + "\n").encode("utf-8")
+
+
+def _process_chunk(deals, first_row, skip_invalid, require_name, output_format, keep_quotes, columns):
+    """Quote and serialize one chunk; runs in a worker process with --workers.
+
+    The quotes are reindexed to `columns`, the output columns of the first
+    chunk, so every chunk lines up with the header written for it.
+    """
+    quotes, skipped = quote_chunk(deals, first_row, skip_invalid, require_name)
+    if list(quotes.columns) != columns:
+        quotes = quotes.reindex(columns=columns)
+    data = _encode(quotes, output_format, header=first_row == 1) if output_format != "parquet" else None
+    return (quotes if keep_quotes else None), data, len(quotes), skipped
+
+
+def _map_ordered(func, arguments, workers):
+    """Apply `func` to each argument tuple, in order, across `workers` processes.
+
+    Only a few chunks per worker are in flight at a time, so reading the
+    input never runs far ahead of writing the output.
+    """
+    if workers <= 1:
+        for args in arguments:
+            yield func(*args)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for args in arguments:
+            pending.append(pool.submit(func, *args))
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _project_rows(quotes):
+    """Rows in project_db.PROJECT_INSERT_COLUMNS order for a chunk of quotes"""
+    created_at = (
+        quotes["created_at"].astype(object).where(quotes["created_at"].notna(), None).tolist()
+        if "created_at" in quotes else [None] * len(quotes)
+    )
+    return list(zip(
+        quotes["name"].astype(str).str.strip().tolist(),
+        *(quotes[name].tolist() for name in INPUT_COLUMNS),
+        [str(value) if value is not None else None for value in created_at],
+    ))
+
+
+def quote_file(path, output=None, file_format=None, output_format=None, chunk_size=DEFAULT_CHUNK_SIZE,
+               save=False, skip_invalid=False, workers=1, progress=None):
+    """Quote every deal in a file, streaming the results to `output`.
+
+    `output` is a file path, or None for CSV on standard output. The output
+    has the columns of the first chunk; columns that only appear in later
+    chunks (e.g. an extra key in a JSONL line) are dropped. With
+    `save` each chunk of valid deals is also inserted into the projects
+    table in one transaction. `progress` is called with the running stats
+    after every chunk. Returns a dict with `rows`, `skipped`, `saved`,
+    `seconds` and `rows_per_second`.
+    """
+    file_format = file_format or detect_format(path)
+    output_format = output_format or (detect_format(output) if output else "csv")
+    if output is None and output_format == "parquet":
+        raise ValueError("Parquet output needs an --output file")
+    if save:
+        project_db.init_db()
+
+    def arguments():
+        first_row = 1
+        columns = None
+        for deals in read_chunks(path, file_format, chunk_size):
+            columns = columns or output_columns(deals)
+            yield deals, first_row, skip_invalid, save, output_format, save or output_format == "parquet", columns
+            first_row += len(deals)
+
+    stats = {"rows": 0, "skipped": 0, "saved": 0, "seconds": 0.0, "rows_per_second": 0.0}
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        out = stack.enter_context(open(output, "wb")) if output else sys.stdout.buffer
+        writer = None
+        for quotes, data, rows, skipped in _map_ordered(_process_chunk, arguments(), workers):
+            if data is not None:
+                out.write(data)
+            elif rows:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                if file_format != "parquet":
+                    quotes = _passthrough_as_text(quotes)
+                if writer is None:
+                    table = pa.Table.from_pandas(quotes, preserve_index=False)
+                    writer = stack.enter_context(pq.ParquetWriter(out, table.schema))
+                else:
+                    try:
+                        table = pa.Table.from_pandas(quotes, schema=writer.schema, preserve_index=False)
+                    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                        raise ValueError(f"Quotes after row {stats['rows']:,} do not fit the Parquet schema: {e}") from None
+                writer.write_table(table)
+            if save and rows:
+                stats["saved"] += project_db.save_projects(_project_rows(quotes))
+
+            stats["rows"] += rows
+            stats["skipped"] += skipped
+            stats["seconds"] = time.perf_counter() - start
+            stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+            if progress:
+                progress(stats)
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quote a file of deals with the profitability engine.")
+    parser.add_argument("path", help="CSV, JSONL or Parquet file of deals")
+    parser.add_argument("--format", choices=FORMATS, help="input format (default: from extension)")
+    parser.add_argument("--output", help="file for the quotes (default: CSV on standard output)")
+    parser.add_argument("--output-format", choices=FORMATS, help="output format (default: from extension)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="quote chunks in this many processes")
+    parser.add_argument("--save", action="store_true", help="also save the deals to the projects table")
+    parser.add_argument("--skip-invalid", action="store_true", help="drop invalid deals instead of stopping")
+    args = parser.parse_args(argv)
+
+    def report(stats):
+        print(f"\r{stats['rows']:,} deals ({stats['rows_per_second']:,.0f} deals/s)", end="", file=sys.stderr)
+
+    try:
+        stats = quote_file(
+            args.path, args.output, args.format, args.output_format, args.chunk_size,
+            args.save, args.skip_invalid, args.workers, report
+        )
+    except (RowError, RuntimeError, ValueError) as e:
+        print(f"\nerror: {e}", file=sys.stderr)
+        return 1
+
+    print(file=sys.stderr)
+    print(
+        f"Quoted {stats['rows']:,} deals in {stats['seconds']:.2f}s "
+        f"({stats['rows_per_second']:,.0f} deals/s), skipped {stats['skipped']:,} invalid deals"
+        + (f", saved {stats['saved']:,} projects" if args.save else ""),
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
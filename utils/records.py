@@ -0,0 +1,122 @@
+"""Typed records for rows of the projects and freelancers tables.
+
+Single rows are frozen, slotted dataclasses built straight from cursor rows,
+so reading a project costs one small object instead of a DataFrame and a
+dict. Collections are RecordTables: the rows stored column by column, with
+numeric columns packed into arrays. Records are shared through the query
+caches, which is why they are immutable.
+"""
+from array import array
+from dataclasses import dataclass, fields
+
+# Array type codes for numeric record fields; other fields are kept as tuples
+_TYPECODES = {float: "d", int: "q"}
+
+
+@dataclass(frozen=True, slots=True)
+class Project:
+    """A saved project"""
+    id: int
+    name: str
+    upfront_payment: float
+    monthly_maintenance: float
+    maintenance_months: int
+    other_revenue: float
+    target_margin: float
+    freelancer_allocation: float
+    internal_staff_allocation: float
+    tech_infra_allocation: float
+    admin_allocation: float
+    created_at: str
+
+
+@dataclass(frozen=True, slots=True)
+class Freelancer:
+    """A freelancer on the payroll roster; `tax_rate` is a fraction"""
+    id: int
+    name: str
+    nationality: str
+    gross_payment: float
+    tax_rate: float
+    tax_amount: float
+    net_payment: float
+    project_id: int | None = None
+
+
+def columns_of(record_type):
+    """Field names of a record type, in the order its constructor takes them"""
+    return tuple(f.name for f in fields(record_type))
+
+
+PROJECT_COLUMNS = columns_of(Project)
+FREELANCER_COLUMNS = columns_of(Freelancer)
+
+
+def _pack(values, field_type):
+    """Store one column compactly: an array for numbers, else a tuple"""
+    typecode = _TYPECODES.get(field_type)
+    if typecode is not None:
+        try:
+            return array(typecode, values)
+        except TypeError:
+            # NULLs, or a float in an INTEGER column; keep the values as they are
+            pass
+    return tuple(values)
+
+
+def _read_only(column):
+    """A packed column as a read-only view; tuple columns are immutable already"""
+    return memoryview(column).toreadonly() if isinstance(column, array) else column
+
+
+class RecordTable:
+    """Rows of one record type, stored column by column.
+
+    Iterating or indexing by position yields records; indexing by a field
+    name returns the whole column. Float and integer columns are
+    `array.array`s, 8 bytes per value instead of a boxed object per row,
+    which NumPy and pandas read through the buffer protocol without copying.
+    Tables are cached and shared between sessions, so those columns are
+    handed out as read-only memoryviews.
+    """
+    __slots__ = ("record_type", "_columns", "_length")
+
+    def __init__(self, record_type, columns, length):
+        self.record_type = record_type
+        self._columns = columns
+        self._length = length
+
+    @classmethod
+    def from_rows(cls, record_type, rows):
+        """Build a table from rows whose values are in the record's field order"""
+        record_fields = fields(record_type)
+        transposed = list(zip(*rows)) or [()] * len(record_fields)
+        columns = {f.name: _pack(values, f.type) for f, values in zip(record_fields, transposed)}
+        return cls(record_type, columns, len(rows))
+
+    @property
+    def column_names(self):
+        return tuple(self._columns)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        record_type = self.record_type
+        for values in zip(*self._columns.values()):
+            yield record_type(*values)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return _read_only(self._columns[key])
+        if isinstance(key, slice):
+            columns = {name: column[key] for name, column in self._columns.items()}
+            return RecordTable(self.record_type, columns, len(range(*key.indices(self._length))))
+        return self.record_type(*(column[key] for column in self._columns.values()))
+
+    def __repr__(self):
+        return f"<RecordTable of {self._length:,} {self.record_type.__name__} records>"
+
+    def to_columns(self):
+        """The columns as a dict of field name -> sequence (e.g. for a DataFrame)"""
+        return {name: _read_only(column) for name, column in self._columns.items()}
@@ -0,0 +1,40 @@
+"""Maintenance commands for the monthly transaction rollups.
+
+    python -m utils.rollups verify
+    python -m utils.rollups rebuild
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import db_utils
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify or rebuild the monthly transaction rollups.")
+    parser.add_argument("command", choices=("verify", "rebuild"))
+    args = parser.parse_args(argv)
+
+    db_utils.init_db()
+
+    if args.command == "rebuild":
+        groups = db_utils.rebuild_monthly_rollups()
+        print(f"Rebuilt {groups:,} monthly rollup groups")
+        return 0
+
+    mismatches = db_utils.verify_monthly_rollups()
+    for m in mismatches:
+        print(
+            f"{m['month']} {m['type']} / {m['category']} / {m['currency']}: "
+            f"expected (amount, vnd, count) {m['expected']}, found {m['actual']}"
+        )
+    if mismatches:
+        print(f"{len(mismatches):,} rollup groups are out of date; run 'rebuild' to fix them")
+        return 1
+    print("Monthly rollups match the transactions table")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,504 @@
+"""The application's SQLite schema and its migrations.
+
+Projects, the bookkeeping ledger and payroll share one database file, so
+reports can join them inside SQLite. The schema version is kept in
+PRAGMA user_version; migrate() applies every newer migration in order, each
+in its own write transaction together with the version bump, so a database
+is always at a known version and concurrent processes apply a step once.
+
+Migration 2 copies the data of the separate files the app used before
+(project_costs.db, bookkeeping.db and payroll.db) when they sit next to the
+database. The old files are left in place.
+
+    python -m utils.schema migrate
+    python -m utils.schema version
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.storage import connect, transaction
+
+# Database path
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "app.db")
+
+# Legacy database files -> tables copied from them by migration 2
+LEGACY_DATABASES = {
+    "project_costs.db": ("projects",),
+    "bookkeeping.db": ("transactions", "fx_rates"),
+    "payroll.db": ("freelancers", "tax_rules", "tax_deductions", "payroll_runs", "payroll_lines"),
+}
+
+# Rows read from a legacy table per batch
+LEGACY_BATCH_SIZE = 50_000
+
+# Total revenue as a SQL expression; must match the expression index exactly
+TOTAL_REVENUE_SQL = "upfront_payment + monthly_maintenance * maintenance_months + other_revenue"
+
+# Tax rules seeded into a new database: the flat rates the app has always used
+DEFAULT_TAX_RULES = [
+    # (residency, min_income, rate)
+    ("Vietnamese", 0.0, 0.10),
+    ("Foreign", 0.0, 0.20),
+]
+
+# Add (sign=+1) or remove (sign=-1) one transaction row from the monthly rollup
+_ROLLUP_APPLY_SQL = '''
+    INSERT INTO transaction_monthly_rollups
+    (month, type, category, currency, total_amount, total_vnd, transaction_count)
+    VALUES (substr({row}.date, 1, 7), {row}.type, {row}.category, {row}.currency,
+            {sign} * {row}.amount, {sign} * {row}.vnd_amount, {sign})
+    ON CONFLICT (month, type, category, currency) DO UPDATE SET
+        total_amount = total_amount + excluded.total_amount,
+        total_vnd = total_vnd + excluded.total_vnd,
+        transaction_count = transaction_count + excluded.transaction_count;
+'''
+_ROLLUP_PRUNE_SQL = '''
+    DELETE FROM transaction_monthly_rollups
+    WHERE month = substr(OLD.date, 1, 7) AND type = OLD.type
+      AND category = OLD.category AND currency = OLD.currency
+      AND transaction_count = 0;
+'''
+
+# Recompute the monthly rollups from the raw transactions
+REBUILD_ROLLUPS_SQL = '''
+    INSERT INTO transaction_monthly_rollups
+    (month, type, category, currency, total_amount, total_vnd, transaction_count)
+    SELECT substr(date, 1, 7), type, category, currency,
+           SUM(amount), SUM(vnd_amount), COUNT(*)
+    FROM transactions
+    GROUP BY 1, 2, 3, 4
+'''
+
+
+def create_ledger_indexes(conn):
+    """Create the ledger's covering indexes and rollup triggers if missing.
+
+    Split out of the schema because bulk loads drop them and rebuild them
+    afterwards (see db_utils.bulk_load).
+    """
+    # Covering indexes for filtered listings and aggregates: one for
+    # type/category filters, one for date ranges and date ordering
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_type_category_date
+        ON transactions(type, category, date, vnd_amount)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_date
+        ON transactions(date, type, category, vnd_amount)
+    ''')
+
+    # Monthly rollups kept in step with the ledger by triggers, so every
+    # write path (single rows, bulk ingest, manual SQL) updates them
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_insert
+        AFTER INSERT ON transactions BEGIN
+            {_ROLLUP_APPLY_SQL.format(row="NEW", sign=1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_delete
+        AFTER DELETE ON transactions BEGIN
+            {_ROLLUP_APPLY_SQL.format(row="OLD", sign=-1)}
+            {_ROLLUP_PRUNE_SQL}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_update
+        AFTER UPDATE OF date, type, category, currency, amount, vnd_amount ON transactions BEGIN
+            {_ROLLUP_APPLY_SQL.format(row="OLD", sign=-1)}
+            {_ROLLUP_APPLY_SQL.format(row="NEW", sign=1)}
+            {_ROLLUP_PRUNE_SQL}
+        END
+    ''')
+
+
+def create_search_triggers(conn, indexed_through=None):
+    """Create the triggers keeping transactions_fts in step with the ledger.
+
+    Split out like the ledger indexes because bulk loads index the loaded
+    rows in one pass afterwards. With `indexed_through`, no insert trigger
+    is created and updates and deletes only reach the index for ids up to
+    it: an external content index must never be asked to delete a row it
+    has not indexed yet.
+    """
+    text_changed = "(OLD.description IS NOT NEW.description OR OLD.reference IS NOT NEW.reference)"
+    if indexed_through is None:
+        delete_when, update_when = "", f"WHEN {text_changed}"
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_insert
+            AFTER INSERT ON transactions BEGIN
+                INSERT INTO transactions_fts (rowid, description, reference)
+                VALUES (NEW.id, NEW.description, NEW.reference);
+            END
+        ''')
+    else:
+        indexed = f"OLD.id <= {int(indexed_through)}"
+        delete_when, update_when = f"WHEN {indexed}", f"WHEN {text_changed} AND {indexed}"
+    # An external content index must be told the exact values it indexed
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_delete
+        AFTER DELETE ON transactions {delete_when} BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description, reference)
+            VALUES ('delete', OLD.id, OLD.description, OLD.reference);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_update
+        AFTER UPDATE OF description, reference ON transactions
+        {update_when} BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description, reference)
+            VALUES ('delete', OLD.id, OLD.description, OLD.reference);
+            INSERT INTO transactions_fts (rowid, description, reference)
+            VALUES (NEW.id, NEW.description, NEW.reference);
+        END
+    ''')
+
+
+def drop_search_triggers(conn):
+    """Drop the triggers created by create_search_triggers()"""
+    for event in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_transactions_fts_{event}")
+
+
+def _create_schema(conn, db_path):
+    """Migration 1: projects, the ledger and payroll in one database"""
+    # Projects
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS projects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        upfront_payment REAL NOT NULL,
+        monthly_maintenance REAL NOT NULL,
+        maintenance_months INTEGER NOT NULL,
+        other_revenue REAL NOT NULL,
+        target_margin REAL NOT NULL,
+        freelancer_allocation REAL NOT NULL,
+        internal_staff_allocation REAL NOT NULL,
+        tech_infra_allocation REAL NOT NULL,
+        admin_allocation REAL NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # Indexes backing the keyset-paginated listing (see project_db.list_projects)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_projects_created_at ON projects(created_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_projects_name ON projects(name, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_projects_target_margin ON projects(target_margin, id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_projects_total_revenue ON projects(({TOTAL_REVENUE_SQL}), id)")
+
+    # Bookkeeping ledger; project_id optionally books a transaction to a project
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        currency TEXT NOT NULL,
+        vnd_amount REAL NOT NULL,
+        description TEXT,
+        category TEXT NOT NULL,
+        reference TEXT,
+        exchange_rate REAL DEFAULT 1.0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        project_id INTEGER REFERENCES projects(id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS transaction_monthly_rollups (
+        month TEXT NOT NULL,
+        type TEXT NOT NULL,
+        category TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        total_amount REAL NOT NULL,
+        total_vnd REAL NOT NULL,
+        transaction_count INTEGER NOT NULL,
+        PRIMARY KEY (month, type, category, currency)
+    ) WITHOUT ROWID
+    ''')
+    create_ledger_indexes(conn)
+    # Covers per-project ledger totals
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_transactions_project
+    ON transactions(project_id, type, vnd_amount) WHERE project_id IS NOT NULL
+    ''')
+
+    # Exchange rates to VND by currency and effective date; a rate applies
+    # from its date until the next rate for the same currency
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS fx_rates (
+        currency TEXT NOT NULL,
+        rate_date TEXT NOT NULL,
+        rate REAL NOT NULL,
+        PRIMARY KEY (currency, rate_date)
+    ) WITHOUT ROWID
+    ''')
+
+    # Payroll; project_id optionally assigns a freelancer to a project
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS freelancers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        nationality TEXT NOT NULL,
+        gross_payment REAL NOT NULL,
+        tax_rate REAL NOT NULL,
+        tax_amount REAL NOT NULL,
+        net_payment REAL NOT NULL,
+        project_id INTEGER REFERENCES projects(id)
+    )
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_freelancers_project
+    ON freelancers(project_id, gross_payment, tax_amount, net_payment) WHERE project_id IS NOT NULL
+    ''')
+    # Progressive brackets per residency: `rate` applies to taxable income
+    # from `min_income` up to the next bracket of the same residency
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS tax_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        residency TEXT NOT NULL,
+        min_income REAL NOT NULL DEFAULT 0,
+        rate REAL NOT NULL,
+        UNIQUE (residency, min_income)
+    )
+    ''')
+    # Fixed amounts subtracted from gross payment before the brackets apply
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS tax_deductions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        residency TEXT NOT NULL,
+        description TEXT NOT NULL,
+        amount REAL NOT NULL
+    )
+    ''')
+    # Monthly payroll snapshots: one run per period with its totals, and
+    # one line per freelancer copied from the roster when the run is created
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS payroll_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        period TEXT NOT NULL UNIQUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        freelancer_count INTEGER NOT NULL DEFAULT 0,
+        total_gross REAL NOT NULL DEFAULT 0,
+        total_tax REAL NOT NULL DEFAULT 0,
+        total_net REAL NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS payroll_lines (
+        run_id INTEGER NOT NULL,
+        freelancer_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        nationality TEXT NOT NULL,
+        gross_payment REAL NOT NULL,
+        tax_rate REAL NOT NULL,
+        tax_amount REAL NOT NULL,
+        net_payment REAL NOT NULL,
+        PRIMARY KEY (run_id, freelancer_id)
+    ) WITHOUT ROWID
+    ''')
+    # Covers per-freelancer history and totals without touching the table
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_payroll_lines_freelancer "
+        "ON payroll_lines (freelancer_id, run_id, gross_payment, tax_amount, net_payment)"
+    )
+    if conn.execute("SELECT 1 FROM tax_rules LIMIT 1").fetchone() is None:
+        conn.executemany(
+            "INSERT INTO tax_rules (residency, min_income, rate) VALUES (?, ?, ?)",
+            DEFAULT_TAX_RULES
+        )
+
+
+def _columns(conn, table, schema="main"):
+    """Column names of a table in order, or [] if it does not exist"""
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _copy_table(source, conn, table):
+    """Copy every row of `table` from a legacy connection, keeping ids.
+
+    Only columns present on both sides are copied, so files written by older
+    versions of the app (without later columns) import too. Returns the
+    number of rows copied.
+    """
+    target_columns = _columns(conn, table)
+    legacy_columns = set(_columns(source, table))
+    columns = [c for c in target_columns if c in legacy_columns]
+    if not columns:
+        return 0
+
+    if table == "tax_rules" and source.execute("SELECT 1 FROM tax_rules LIMIT 1").fetchone():
+        # The legacy rules replace the defaults seeded by migration 1
+        conn.execute("DELETE FROM tax_rules")
+
+    column_list = ", ".join(columns)
+    insert = f"INSERT INTO {table} ({column_list}) VALUES ({', '.join('?' for _ in columns)})"
+    cursor = source.execute(f"SELECT {column_list} FROM {table}")
+    copied = 0
+    while True:
+        rows = cursor.fetchmany(LEGACY_BATCH_SIZE)
+        if not rows:
+            return copied
+        conn.executemany(insert, rows)
+        copied += len(rows)
+
+
+def _import_legacy(conn, db_path):
+    """Migration 2: copy the data of the legacy per-domain database files"""
+    directory = Path(db_path).resolve().parent
+    legacy_files = [
+        (directory / file_name, tables) for file_name, tables in LEGACY_DATABASES.items()
+        if (directory / file_name).exists() and (directory / file_name) != Path(db_path).resolve()
+    ]
+    if not legacy_files:
+        return
+
+    # Load the ledger without per-row index and rollup maintenance, then
+    # rebuild both in one pass, as db_utils.bulk_load() does
+    conn.execute("DROP INDEX IF EXISTS idx_transactions_type_category_date")
+    conn.execute("DROP INDEX IF EXISTS idx_transactions_date")
+    conn.execute("DROP TRIGGER IF EXISTS trg_transactions_rollup_insert")
+
+    for path, tables in legacy_files:
+        source = sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True)
+        try:
+            for table in tables:
+                _copy_table(source, conn, table)
+        finally:
+            source.close()
+
+    create_ledger_indexes(conn)
+    conn.execute("DELETE FROM transaction_monthly_rollups")
+    conn.execute(REBUILD_ROLLUPS_SQL)
+
+
+def _create_transaction_search(conn, db_path):
+    """Migration 3: full-text index over transaction descriptions and references"""
+    # An external content table: the index stores tokens only and reads the
+    # text from transactions. Diacritics are folded so "thanh toan" finds
+    # "thanh toán"; the prefix indexes keep short prefix queries fast.
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+            description, reference,
+            content='transactions', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    create_search_triggers(conn)
+    conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+
+
+def _create_name_indexes(conn, db_path):
+    """Migration 4: case-insensitive name indexes for the project and freelancer pickers"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_projects_name_nocase ON projects(name COLLATE NOCASE, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_freelancers_name_nocase ON freelancers(name COLLATE NOCASE, id)")
+
+
+def search_names(conn, table, query, limit):
+    """Find rows of `table` by id or name for a picker, best matches first.
+
+    A number matches the row with that id, then come names starting with
+    `query` and names containing it elsewhere, each in name order and
+    ignoring ASCII case. The prefix matches are read as a range of the
+    NOCASE name index; the substring matches come from a scan of that index
+    in name order that stops as soon as it has enough hits, so only rare
+    substrings read the whole index. Returns at most `limit` {"id", "name"}
+    dicts.
+    """
+    rows = []
+    # ASCII only: isdigit() also accepts "²", which int() rejects; past 18
+    # digits the number could overflow SQLite's 64-bit integers
+    if query.isascii() and query.isdigit() and len(query) <= 18:
+        rows += conn.execute(f"SELECT id, name FROM {table} WHERE id = ?", (int(query),)).fetchall()
+    # Every character sorts below U+10FFFF, so this range is exactly the names with the prefix
+    prefix_range = "name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE"
+    prefix_bounds = (query, query + "\U0010ffff")
+    rows += conn.execute(f'''
+        SELECT id, name FROM {table} WHERE {prefix_range}
+        ORDER BY name COLLATE NOCASE, id LIMIT ?
+    ''', (*prefix_bounds, limit)).fetchall()
+    if query and len(rows) < limit:
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows += conn.execute(f'''
+            SELECT id, name FROM {table}
+            WHERE name LIKE ? ESCAPE '\\' AND NOT ({prefix_range})
+            ORDER BY name COLLATE NOCASE, id LIMIT ?
+        ''', (f"%{escaped}%", *prefix_bounds, limit - len(rows))).fetchall()
+
+    found = {}
+    for row in rows:
+        found.setdefault(row["id"], row["name"])
+    return [{"id": row_id, "name": name} for row_id, name in list(found.items())[:limit]]
+
+
+# Ordered migrations: version N is MIGRATIONS[N - 1]. Never edit or reorder
+# a released migration; append a new one instead.
+MIGRATIONS = [
+    ("Create the projects, ledger and payroll schema", _create_schema),
+    ("Import project_costs.db, bookkeeping.db and payroll.db", _import_legacy),
+    ("Add full-text search over transaction descriptions and references", _create_transaction_search),
+    ("Add case-insensitive name indexes for pickers", _create_name_indexes),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_version(db_path=None):
+    """Schema version of a database (0 for a new file)"""
+    with connect(db_path or DB_PATH) as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db_path=None):
+    """Bring a database up to SCHEMA_VERSION.
+
+    Returns the (version, description) of every migration applied, which is
+    empty when the database was already current.
+    """
+    db_path = str(db_path or DB_PATH)
+    version = get_version(db_path)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"{db_path} is at schema version {version}, newer than this app's {SCHEMA_VERSION}"
+        )
+
+    applied = []
+    for target, (description, step) in enumerate(MIGRATIONS, start=1):
+        if target <= version:
+            continue
+        with transaction(db_path) as conn:
+            # Another process may have applied it since the version was read
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= target:
+                continue
+            step(conn, db_path)
+            conn.execute(f"PRAGMA user_version = {target}")
+        applied.append((target, description))
+    return applied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate the application database.")
+    parser.add_argument("command", choices=("migrate", "version"))
+    parser.add_argument("--db", default=DB_PATH, help=f"database file (default: {DB_PATH})")
+    args = parser.parse_args(argv)
+
+    if args.command == "version":
+        print(f"{args.db}: schema version {get_version(args.db)} of {SCHEMA_VERSION}")
+        return 0
+
+    try:
+        applied = migrate(args.db)
+    except RuntimeError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    for version, description in applied:
+        print(f"Applied migration {version}: {description}")
+    print(f"{args.db} is at schema version {SCHEMA_VERSION}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+from utils.calc import ALLOCATION_FIELDS, QuoteInputs, calculate
+from utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# Scenarios drawn per batch; bounds the size of temporary arrays
+SIMULATION_BATCH_SIZE = 250_000
+
+# Percentiles reported for profit and margin
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Default risk assumptions, as fractions
+DEFAULT_RISK = {
+    "revenue_slippage_mean": 0.05,   # expected shortfall on upfront and other revenue
+    "revenue_slippage_sd": 0.10,
+    "monthly_churn_rate": 0.03,      # chance the client cancels maintenance each month
+    "cost_overrun_mean": 0.05,       # expected overrun on each cost category
+    "cost_overrun_sd": 0.15,
+}
+
+def _simulate_batch(rng, size, upfront_payment, monthly_maintenance, maintenance_months,
+                    other_revenue, category_budgets, risk):
+    """Draw one batch of scenarios and return (profit, revenue) arrays"""
+    # Revenue slippage on the fixed part of the deal, never below zero
+    slippage = rng.normal(risk["revenue_slippage_mean"], risk["revenue_slippage_sd"], size)
+    fixed_revenue = (upfront_payment + other_revenue) * np.clip(1 - slippage, 0, None)
+
+    # Maintenance churn: months paid before the first cancellation
+    if maintenance_months > 0 and risk["monthly_churn_rate"] > 0:
+        months_paid = np.minimum(rng.geometric(risk["monthly_churn_rate"], size) - 1, maintenance_months)
+    else:
+        months_paid = np.full(size, maintenance_months)
+    revenue = fixed_revenue + monthly_maintenance * months_paid
+
+    # Independent overruns per cost category on the planned budgets
+    overrun = rng.normal(risk["cost_overrun_mean"], risk["cost_overrun_sd"], (size, len(category_budgets)))
+    costs = (np.clip(1 + overrun, 0, None) * category_budgets).sum(axis=1)
+
+    return revenue - costs, revenue
+
+def simulate_quote(upfront_payment, monthly_maintenance, maintenance_months, other_revenue,
+                   target_margin, allocations, n_scenarios=1_000_000, seed=None, **risk):
+    """Run a Monte Carlo simulation of a quote's profit.
+
+    Costs are planned from the quoted revenue, target margin and the four
+    allocation percentages, exactly as in the calculator. Each scenario then
+    applies revenue slippage, maintenance churn and per-category cost
+    overruns (see DEFAULT_RISK; override any of them as keyword arguments).
+    Returns percentile bands of profit and margin, the mean profit and the
+    probability of a loss.
+    """
+    if n_scenarios < 1:
+        raise ValueError(f"n_scenarios must be at least 1, got {n_scenarios}")
+    unknown = set(risk) - set(DEFAULT_RISK)
+    if unknown:
+        raise ValueError(f"Unknown risk parameters: {', '.join(sorted(unknown))}")
+    risk = {**DEFAULT_RISK, **risk}
+
+    plan = calculate(QuoteInputs(
+        upfront_payment=upfront_payment,
+        monthly_maintenance=monthly_maintenance,
+        maintenance_months=maintenance_months,
+        other_revenue=other_revenue,
+        target_margin=target_margin,
+        **dict(zip(ALLOCATION_FIELDS, allocations))
+    ))
+    quoted_revenue = plan.total_revenue
+    category_budgets = np.asarray(plan.category_budgets, dtype=np.float64)
+
+    rng = np.random.default_rng(seed)
+    profit = np.empty(n_scenarios)
+    # Scenarios without revenue get a 0% margin, as in the calculator
+    margin = np.zeros(n_scenarios)
+    for start in range(0, n_scenarios, SIMULATION_BATCH_SIZE):
+        size = min(SIMULATION_BATCH_SIZE, n_scenarios - start)
+        batch_profit, batch_revenue = _simulate_batch(
+            rng, size, upfront_payment, monthly_maintenance, maintenance_months,
+            other_revenue, category_budgets, risk
+        )
+        profit[start:start + size] = batch_profit
+        np.divide(batch_profit * 100, batch_revenue, out=margin[start:start + size],
+                  where=batch_revenue > 0)
+
+    profit_bands = np.percentile(profit, PERCENTILES)
+    margin_bands = np.percentile(margin, PERCENTILES)
+    return {
+        "n_scenarios": n_scenarios,
+        "quoted_revenue": quoted_revenue,
+        "planned_profit": float(plan.expected_profit),
+        "mean_profit": float(profit.mean()),
+        "probability_of_loss": float((profit < 0).mean()),
+        "profit_percentiles": dict(zip(PERCENTILES, profit_bands.tolist())),
+        "margin_percentiles": dict(zip(PERCENTILES, margin_bands.tolist())),
+        "profit_histogram": np.histogram(profit, bins=50),
+    }
@@ -0,0 +1,200 @@
+import functools
+import sqlite3
+import os
+import threading
+from contextlib import contextmanager
+from queue import LifoQueue, Empty, Full
+
+# Connection tuning shared by every database in the app
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+POOL_SIZE = 8
+
+_pools = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+
+# Per-database write generations bumped by transaction() after a commit that
+# changed rows, plus one read-only watcher connection per database whose
+# PRAGMA data_version moves when any other connection (or process) commits
+_generations = {}
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+# (initializer, database) pairs already run by init_once() in this process
+_initialized = set()
+_initialized_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """A small pool of long-lived SQLite connections for one database file.
+
+    Connections are handed out to one thread at a time and returned to the
+    pool afterwards, so the page cache, the compiled statement cache and the
+    WAL setup survive across Streamlit reruns instead of being rebuilt for
+    every query.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = str(db_path)
+        self.size = size
+        self._idle = LifoQueue(maxsize=size)
+
+    def _open(self):
+        """Open a new connection with the shared pragmas applied"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA cache_size = -65536")
+        return conn
+
+    def acquire(self):
+        """Take an idle connection from the pool or open a new one"""
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            return self._open()
+
+    def release(self, conn):
+        """Return a connection to the pool, closing it if the pool is full"""
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    def close(self):
+        """Close every idle connection held by the pool"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+
+
+def get_pool(db_path):
+    """Get the process-wide pool for a database file, creating it on first use"""
+    key = str(db_path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(key)
+    return pool
+
+
+def close_all():
+    """Close all pooled connections (used by benchmarks and on shutdown).
+
+    Also forgets which databases init_once() has set up.
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+    with _watchers_lock:
+        for watcher in _watchers.values():
+            watcher.close()
+        _watchers.clear()
+    with _initialized_lock:
+        _initialized.clear()
+
+
+def init_once(get_db_path):
+    """Run a schema initializer only the first time a database is used.
+
+    `get_db_path` is a zero-argument callable returning the database file,
+    as for cached_query(). Pages call the wrapped function on every rerun,
+    but the CREATE ... IF NOT EXISTS statements only run once per process
+    and database; call the initializer itself to force it.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper():
+            key = (func.__module__, func.__qualname__, str(get_db_path()))
+            if key in _initialized:
+                return
+            with _initialized_lock:
+                if key not in _initialized:
+                    func()
+                    _initialized.add(key)
+        return wrapper
+    return decorator
+
+
+def data_version(db_path):
+    """Return a value that changes whenever the database's contents change.
+
+    Combines this process's write generation with PRAGMA data_version on a
+    dedicated watcher connection, so commits from other processes are seen
+    too. Cheap enough to call on every cache lookup.
+    """
+    key = str(db_path)
+    with _watchers_lock:
+        watcher = _watchers.get(key)
+        if watcher is None:
+            watcher = _watchers[key] = get_pool(key)._open()
+        version = watcher.execute("PRAGMA data_version").fetchone()[0]
+    return (_generations.get(key, 0), version)
+
+
+@contextmanager
+def connect(db_path):
+    """Borrow a pooled connection for the current thread.
+
+    Nested calls on the same thread and database reuse the connection that is
+    already checked out, so helpers can be composed inside a transaction.
+    """
+    key = str(db_path)
+    held = getattr(_local, "held", None)
+    if held is None:
+        held = _local.held = {}
+
+    if key in held:
+        yield held[key]
+        return
+
+    pool = get_pool(key)
+    conn = pool.acquire()
+    held[key] = conn
+    try:
+        yield conn
+    finally:
+        del held[key]
+        pool.release(conn)
+
+
+@contextmanager
+def transaction(db_path):
+    """Run a block of statements in a single write transaction.
+
+    Commits when the block exits normally and rolls back on error. Nested
+    transactions on the same thread join the outer one.
+    """
+    with connect(db_path) as conn:
+        if conn.in_transaction:
+            yield conn
+            return
+        changes_before = conn.total_changes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        if conn.total_changes != changes_before:
+            key = str(db_path)
+            with _watchers_lock:
+                _generations[key] = _generations.get(key, 0) + 1